@@ -0,0 +1,85 @@
+from repl import Watcher
+from patches import EVENT_RING_ADDRESS, EVENT_RING_HEADER_SIZE, EVENT_RING_RECORD_SIZE, EVENT_RING_SIZE, EVENT_RING_MAGIC, \
+    EVENT_OVERWORLD_ITEM, OVERWORLD_ITEMS
+import json
+import os
+import threading
+
+CHECKS_FILE = "location_checks.json"
+EVENT_POLL_INTERVAL = 0.25
+
+class CheckLog:
+    """ Location checks found by watching the game, saved to a JSON list of location names that the Manual client
+    sends with /import_checks. Each location is only added once. """
+
+    def __init__(self, filename : str = CHECKS_FILE):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.checked = []
+        if os.path.exists(filename):
+            with open(filename, "r") as file:
+                self.checked = json.load(file)
+
+    def add(self, locations : list[str]) -> list[str]:
+        """ Record locations as checked. Returns the ones that weren't already. """
+        with self.lock:
+            added = [location for location in locations if location not in self.checked]
+            if added:
+                self.checked += added
+                with open(self.filename, "w") as file:
+                    json.dump(self.checked, file, indent=4)
+            return added
+
+class EventWatcher(Watcher):
+    """ Drains the event ring buffer that initAP's hooks append overworld pickups to, and checks the matching
+    locations. Each poll reads the whole buffer, and does nothing until initAP has set the buffer up. """
+
+    name = "event watcher"
+    interval = EVENT_POLL_INTERVAL
+
+    def __init__(self, checkLog : CheckLog):
+        super().__init__()
+        self.locations = {(EVENT_OVERWORLD_ITEM, index): location for index, (_, _, location) in enumerate(OVERWORLD_ITEMS)}
+        self.checkLog = checkLog
+        self.readIndex = None
+        self.reported = set() # Unrecognized events that have already been reported
+
+    def drain(self, ring : bytes) -> list[tuple[int, int]]:
+        # Returns the (event type, item id) records written since the last drain, oldest first
+        if ring[12:16] != EVENT_RING_MAGIC:
+            self.readIndex = None
+            return []
+
+        writeIndex = int.from_bytes(ring[0:4], "little")
+        if self.readIndex is None or writeIndex < self.readIndex:
+            # First look at the buffer, or initAP was run again and reset it, so take everything it still holds
+            self.readIndex = max(0, writeIndex - EVENT_RING_SIZE)
+        # If more than EVENT_RING_SIZE events were written since the last drain, the oldest have been overwritten
+        start = max(self.readIndex, writeIndex - EVENT_RING_SIZE)
+
+        events = []
+        for index in range(start, writeIndex):
+            offset = EVENT_RING_HEADER_SIZE + (index % EVENT_RING_SIZE) * EVENT_RING_RECORD_SIZE
+            events.append((int.from_bytes(ring[offset:offset + 4], "little"), int.from_bytes(ring[offset + 4:offset + 8], "little")))
+        self.readIndex = writeIndex
+        return events
+
+    def ranges(self) -> list[tuple[int, int]]:
+        return [(EVENT_RING_ADDRESS, EVENT_RING_HEADER_SIZE + EVENT_RING_SIZE * EVENT_RING_RECORD_SIZE)]
+
+    def process(self, data : list[bytes]) -> str | None:
+        locations = []
+        messages = []
+        for event in self.drain(data[0]):
+            location = self.locations.get(event)
+            if location:
+                locations.append(location)
+            elif event not in self.reported:
+                # Nothing but initAP's pickup entries should write to the buffer, so this means memory was overwritten
+                self.reported.add(event)
+                messages.append(f"Unrecognized event in the event ring buffer (type {event[0]}, item id {hex(event[1])})")
+
+        added = self.checkLog.add(locations)
+        if added:
+            messages.insert(0, "Location checked: " + ", ".join(added))
+        return "\n".join(messages) if messages else None
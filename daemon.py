@@ -0,0 +1,323 @@
+from concurrent.futures import Future
+from pine.pine import Pine
+from inventory import InventoryBitmap
+import profiler
+from items import CMD_GET, CMD_REMOVE, applyItemToInventory, computeTargetInventory, loadReceivedItems, receiveItems
+from runstate import CURRENT_RUN_FILE, loadCurrentRun, saveCurrentRun, getCurrentRunFile
+from pathlib import PureWindowsPath
+import socketserver
+import sys
+import threading
+import queue
+import time
+import json
+
+DEFAULT_DAEMON_PORT = 28111
+COALESCE_WINDOW = 0.02 # Seconds to wait for more requests before running a transaction
+MAX_TRANSACTION_SIZE = 500
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+EDITOR_ERROR = -32000
+
+class RpcError(Exception):
+    def __init__(self, code : int, message : str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+def isFolderFile(filename) -> bool:
+    # Files named in requests must be in the editor's folder (or a folder inside it), so other tools can't read or
+    #     overwrite files anywhere else. Windows paths also accept / as a separator, so this catches both kinds.
+    if not isinstance(filename, str) or not filename:
+        return False
+    path = PureWindowsPath(filename)
+    return not path.anchor and ".." not in path.parts
+
+class EditorDaemon:
+    """ Runs inventory editor commands sent by other tools, over one persistent Pine connection.
+
+    Requests are queued and handled by a single worker thread. Requests that arrive within COALESCE_WINDOW of each
+    other are merged into one transaction: one batched read of the inventory, every request applied in order to an
+    in-memory copy, then one batched write of the bytes that changed.
+
+    When the daemon shares its Pine connection with the command prompt, runExclusive runs each transaction while
+    nothing else is using the connection, and notify prints what each receive request gave the player. """
+
+    METHODS = ["get", "remove", "receive", "sync", "dump", "status"]
+
+    def __init__(self, data : dict, pine : Pine, currentRun : dict, runFile : str = CURRENT_RUN_FILE, coalesceWindow : float = COALESCE_WINDOW,
+                 runExclusive = None, notify = None):
+        self.data = data
+        self.pine = pine
+        self.currentRun = currentRun
+        self.runFile = runFile
+        self.coalesceWindow = coalesceWindow
+        self.runExclusive = runExclusive or (lambda func, *args: func(*args))
+        self.notify = notify
+        self.queue = queue.Queue()
+        self.stats = {"requests": 0, "transactions": 0, "bytesWritten": 0, "errors": 0}
+        self.worker = threading.Thread(target=self._serviceQueue, name="EditorDaemonWorker", daemon=True)
+
+    def start(self):
+        self.worker.start()
+
+    def submit(self, method : str, params : dict) -> Future:
+        if method not in self.METHODS:
+            raise RpcError(METHOD_NOT_FOUND, f"Method '{method}' not found")
+        if not isinstance(params, dict):
+            raise RpcError(INVALID_PARAMS, "Params must be an object")
+        if "file" in params and not isFolderFile(params["file"]):
+            raise RpcError(INVALID_PARAMS, "file must be a relative path inside the editor's folder")
+
+        future = Future()
+        self.queue.put((method, params, future))
+        return future
+
+    def _serviceQueue(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.coalesceWindow
+            while len(batch) < MAX_TRANSACTION_SIZE:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with profiler.command("transaction"):
+                self.runExclusive(self._runTransaction, batch)
+
+    def _runTransaction(self, batch : list[tuple[str, dict, Future]]):
+        self.stats["requests"] += len(batch)
+        needsEmulator = any(method != "status" for method, _, _ in batch)
+
+        try:
+            if needsEmulator:
+                if not self.pine.is_connected():
+                    self.pine.connect()
+                current = InventoryBitmap.fromPine(self.data, self.pine)
+                target = current.copy()
+            else:
+                current = target = None
+
+            # Requests are applied to a copy of the run state, which is only kept if the write succeeds. Each request
+            #     also gets its own copy of the inventory and run state, which replaces the transaction's only if the
+            #     request succeeds, so a request that fails part way through leaves nothing behind.
+            runState = dict(self.currentRun)
+            results = []
+            messages = []
+            for method, params, future in batch:
+                requestTarget = target.copy() if target is not None else None
+                requestState = dict(runState)
+                try:
+                    result = self._apply(method, params, requestTarget, requestState)
+                except Exception as ex:
+                    results.append((future, None, RpcError(EDITOR_ERROR, str(ex))))
+                    continue
+                target, runState = requestTarget, requestState
+                results.append((future, result, None))
+                if method == "receive" and self.notify:
+                    messages += result["messages"]
+
+            if needsEmulator:
+                writes = target.write(self.pine, current)
+                self.stats["bytesWritten"] += sum(len(write[1]) for write in writes)
+            self.stats["transactions"] += 1
+
+            if runState != self.currentRun:
+                self.currentRun.clear()
+                self.currentRun.update(runState)
+                saveCurrentRun(self.currentRun, self.runFile)
+        except Exception as ex:
+            # Nothing was written (or the write failed), so fail every request in the transaction
+            self.stats["errors"] += len(batch)
+            for _, _, future in batch:
+                future.set_exception(RpcError(EDITOR_ERROR, f"Transaction failed: {ex}"))
+            return
+
+        for message in messages:
+            self.notify(message)
+        for future, result, error in results:
+            if error:
+                self.stats["errors"] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _apply(self, method : str, params : dict, target : InventoryBitmap, runState : dict):
+        if method == CMD_GET or method == CMD_REMOVE:
+            value = params.get("value", params.get("quantity"))
+            return applyItemToInventory(self.data, target, method, params.get("item"), None if value == None else str(value), runState)
+
+        elif method == "receive":
+            given, messages = receiveItems(self.data, target, params.get("key"), params.get("start", 0), params.get("items"), runState)
+            return {"given": given, "messages": messages}
+
+        elif method == "sync":
+            if "items" in params:
+                receivedItems = {name: int(count) for name, count in params["items"].items()}
+            elif "file" in params:
+                receivedItems = loadReceivedItems(params["file"])
+            else:
+                raise ValueError("sync requires either 'items' or 'file'")
+
+            # Sync replaces the target inventory, so any requests after it in this transaction build on the synced state
+            synced, levels = computeTargetInventory(self.data, target, receivedItems)
+            target.buffer[:] = synced.buffer
+            for name, level in levels.items():
+                if level > 0 or name in runState:
+                    runState[name] = level
+            return {"items": sum(receivedItems.values())}
+
+        elif method == "dump":
+            snapshot = target.toSnapshot()
+            snapshot["currentRun"] = dict(runState)
+            if "file" in params:
+                with open(params["file"], "w") as file:
+                    json.dump(snapshot, file, indent=4)
+            return snapshot
+
+        elif method == "status":
+            return {
+                "connected": self.pine.is_connected(),
+                "queued": self.queue.qsize(),
+                "currentRun": dict(self.currentRun),
+                **self.stats
+            }
+
+class EditorOrchestrator:
+    """ Drives several PCSX2 instances from one process, one EditorDaemon (with its own Pine connection, run state and
+    worker thread) per PINE slot. Requests are routed by their "slot" param, and each instance's queue is serviced
+    independently, so a slow or disconnected emulator never holds up the others. """
+
+    METHODS = EditorDaemon.METHODS + ["instances"]
+
+    def __init__(self, data : dict, slots : list[int]):
+        self.instances = {}
+        for slot in slots:
+            runFile = getCurrentRunFile(slot)
+            pine = Pine(slot)
+            profiler.attachPine(pine)
+            self.instances[slot] = EditorDaemon(data, pine, loadCurrentRun(runFile), runFile)
+
+    def start(self):
+        for instance in self.instances.values():
+            instance.start()
+
+    def submit(self, method : str, params : dict) -> Future:
+        if method == "instances":
+            future = Future()
+            future.set_result({str(slot): {"connected": instance.pine.is_connected(), "queued": instance.queue.qsize(), **instance.stats}
+                               for slot, instance in self.instances.items()})
+            return future
+        if not isinstance(params, dict):
+            raise RpcError(INVALID_PARAMS, "Params must be an object")
+
+        slot = params.get("slot")
+        if slot == None and len(self.instances) == 1:
+            slot = next(iter(self.instances))
+        elif isinstance(slot, str) and slot.isdigit():
+            slot = int(slot)
+        if slot not in self.instances:
+            raise RpcError(INVALID_PARAMS, f"Unknown slot {slot}, expected one of {list(self.instances)}")
+
+        return self.instances[slot].submit(method, params)
+
+def _toResponse(request, daemon : EditorDaemon) -> Future | dict | None:
+    # Submit one JSON-RPC request. Returns a Future for its result, a finished error response, or None for notifications
+    if not isinstance(request, dict) or request.get("jsonrpc") != "2.0" or not isinstance(request.get("method"), str):
+        return _errorResponse(request.get("id") if isinstance(request, dict) else None, RpcError(INVALID_REQUEST, "Invalid request"))
+    try:
+        future = daemon.submit(request["method"], request.get("params", {}))
+    except RpcError as ex:
+        return _errorResponse(request.get("id"), ex)
+    return future if "id" in request else None
+
+def _errorResponse(requestId, error : RpcError) -> dict:
+    return {"jsonrpc": "2.0", "id": requestId, "error": {"code": error.code, "message": error.message}}
+
+def _resultResponse(request : dict, future : Future) -> dict:
+    try:
+        return {"jsonrpc": "2.0", "id": request["id"], "result": future.result()}
+    except RpcError as ex:
+        return _errorResponse(request["id"], ex)
+
+class EditorRequestHandler(socketserver.StreamRequestHandler):
+    """ Newline-delimited JSON-RPC 2.0. Each line is one request, or a batch (array) of requests. """
+
+    def handle(self):
+        daemon = self.server.daemon
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                self._send(_errorResponse(None, RpcError(PARSE_ERROR, "Parse error")))
+                continue
+
+            # Submit every request in a batch before waiting on any of them, so they can share one transaction
+            requests = message if isinstance(message, list) else [message]
+            pending = [(request, _toResponse(request, daemon)) for request in requests]
+            responses = [_resultResponse(request, response) if isinstance(response, Future) else response for request, response in pending]
+            responses = [response for response in responses if response != None]
+
+            if isinstance(message, list) and responses:
+                self._send(responses)
+            elif responses:
+                self._send(responses[0])
+
+    def _send(self, response):
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+        self.wfile.flush()
+
+class EditorServer(socketserver.ThreadingTCPServer):
+    """ The JSON-RPC socket. It's opened before connecting to PCSX2, so that a second copy of the editor stops there
+    instead of opening a Pine connection of its own. The daemon that handles requests can be given later. """
+
+    daemon_threads = True
+    # On Windows, SO_REUSEADDR would let a second editor listen on the same port
+    allow_reuse_address = sys.platform != "win32"
+
+    def __init__(self, daemon : EditorDaemon | EditorOrchestrator | None, port : int):
+        # Only listen on localhost, this API can change the game's memory
+        super().__init__(("127.0.0.1", port), EditorRequestHandler)
+        self.daemon = daemon
+
+def openServer(port : int) -> EditorServer | None:
+    """ Listen on port, or print why not and return None if another program (e.g. another copy of the editor) already
+    does. """
+    try:
+        return EditorServer(None, port)
+    except OSError as ex:
+        print(f"Error: Could not listen on port {port} ({ex}). Is the inventory editor already running? Only one copy "
+              "can be connected to PCSX2 at a time, use that one (or give this one a different --port and PINE slot).")
+        return None
+
+def runOrchestrator(data : dict, slots : list[int], port : int = DEFAULT_DAEMON_PORT):
+    server = openServer(port)
+    if server is None:
+        return
+    server.daemon = EditorOrchestrator(data, slots)
+    server.daemon.start()
+    with server:
+        print(f"Inventory editor orchestrator listening on 127.0.0.1:{port}, driving PINE slots " + ", ".join(str(slot) for slot in slots))
+        print("Methods: " + ", ".join(EditorOrchestrator.METHODS) + " (pass the emulator's PINE slot as the 'slot' param)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down")
+
+def runDaemon(data : dict, pine : Pine, currentRun : dict, server : EditorServer):
+    server.daemon = EditorDaemon(data, pine, currentRun)
+    server.daemon.start()
+    with server:
+        print(f"Inventory editor daemon listening on 127.0.0.1:{server.server_address[1]}")
+        print("Methods: " + ", ".join(EditorDaemon.METHODS))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down")
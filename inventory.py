@@ -0,0 +1,256 @@
+from pine.pine import Pine
+
+BITS_IN_BYTE = 8
+MAX_MONEY = 999999
+LIFE_BODY_BIT_OFFSET = 149
+Q150_BODY_BIT_OFFSET = 150
+
+def getBodyName(bit : int) -> str:
+    # All bodies except Q150 are at an offset of their body number minus 1, and the Life Body sits between Q149 and Q150
+    if bit == LIFE_BODY_BIT_OFFSET:
+        return "Life Body"
+    elif bit == Q150_BODY_BIT_OFFSET:
+        return "Body Q150"
+    return f"Body Q{bit + 1:03}"
+
+class InventoryBitmap:
+    """ The player's complete inventory (money, license, collectibles, bodies, and every quantity bitfield of every
+    part table) held in one bytearray, laid out region by region as described in addresses.json.
+
+    An InventoryBitmap can be a snapshot read from the emulator, or a target state computed in Python. Comparing a
+    target to a snapshot with diff() gives the smallest set of writes that turns one into the other. """
+
+    def __init__(self, data : dict, buffer : bytes = None):
+        self.data = data
+
+        # Each region is (address, size in bytes, offset into the buffer), keyed by a name like "money" or "parts.tires"
+        self.regions = {}
+        offset = 0
+        for name, address, size in InventoryBitmap.getRegions(data):
+            self.regions[name] = (address, size, offset)
+            offset += size
+
+        if buffer is None:
+            self.buffer = bytearray(offset)
+        elif len(buffer) != offset:
+            raise ValueError(f"Error in InventoryBitmap: Buffer is {len(buffer)} bytes, but the inventory is {offset} bytes")
+        else:
+            self.buffer = bytearray(buffer)
+
+    @staticmethod
+    def getRegions(data : dict) -> list[tuple[str, int, int]]:
+        # Addresses in data object are hex strings e.g. "0x2DC56C", need to convert to int
+        regions = [
+            ("money", int(data["money"]["address"], 16), 4),
+            ("licenses", int(data["licenses"]["address"], 16), data["licenses"]["sizeInBytes"]),
+            ("collectibles", int(data["collectibles"]["address"], 16), data["collectibles"]["sizeInBytes"]),
+            ("bodies", int(data["bodies"]["address"], 16), data["bodies"]["sizeInBytes"])
+        ]
+
+        parts = data["parts"]
+        for partType in parts:
+            if isinstance(parts[partType], dict):
+                regions.append((f"parts.{partType}", int(parts[partType]["inventoryAddress"], 16), parts["maxQuantity"] * parts["sizeInBytes"]))
+
+        return regions
+
+    @classmethod
+    def fromPine(cls, data : dict, pine : Pine) -> "InventoryBitmap":
+        """ Snapshot the emulator's inventory, reading every region in one batched request. """
+        inventory = cls(data)
+        inventory.read(pine)
+        return inventory
+
+    def read(self, pine : Pine):
+        regions = list(self.regions.values())
+        results = pine.batch_read_bytes([(address, size) for address, size, _ in regions])
+        for (_, size, offset), result in zip(regions, results):
+            self.buffer[offset:offset + size] = result
+
+    def copy(self) -> "InventoryBitmap":
+        return InventoryBitmap(self.data, self.buffer)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, InventoryBitmap) and self.buffer == other.buffer
+
+    def getRegionBytes(self, region : str) -> bytes:
+        _, size, offset = self.regions[region]
+        return bytes(self.buffer[offset:offset + size])
+
+    def setRegionBytes(self, region : str, value : bytes):
+        _, size, offset = self.regions[region]
+        if len(value) != size:
+            raise ValueError(f"Error in setRegionBytes: {region} is {size} bytes, but {len(value)} bytes were given")
+        self.buffer[offset:offset + size] = value
+
+    def getValue(self, region : str) -> int:
+        return int.from_bytes(self.getRegionBytes(region), "little")
+
+    def setValue(self, region : str, value : int):
+        _, size, _ = self.regions[region]
+        self.setRegionBytes(region, value.to_bytes(size, "little"))
+
+    def _bitPosition(self, region : str, bit : int) -> tuple[int, int]:
+        _, size, offset = self.regions[region]
+        if not 0 <= bit < size * BITS_IN_BYTE:
+            raise ValueError(f"Error in InventoryBitmap: Bit index {bit} out of range for {region}")
+        return offset + bit // BITS_IN_BYTE, 1 << (bit % BITS_IN_BYTE)
+
+    def isBitSet(self, region : str, bit : int) -> bool:
+        index, mask = self._bitPosition(region, bit)
+        return bool(self.buffer[index] & mask)
+
+    def setBit(self, region : str, bit : int):
+        index, mask = self._bitPosition(region, bit)
+        self.buffer[index] |= mask
+
+    def clearBit(self, region : str, bit : int):
+        index, mask = self._bitPosition(region, bit)
+        self.buffer[index] &= ~mask
+
+    def partBit(self, bit : int, copy : int) -> int:
+        # Bit index of a part's Nth copy (starting from 0) within its part table region
+        if not 0 <= copy < self.data["parts"]["maxQuantity"]:
+            raise ValueError(f"Error in partBit: Copy {copy} out of range")
+        return copy * self.data["parts"]["sizeInBytes"] * BITS_IN_BYTE + bit
+
+    def getPartQuantity(self, partType : str, bit : int) -> int:
+        region = f"parts.{partType}"
+        return sum(self.isBitSet(region, self.partBit(bit, copy)) for copy in range(self.data["parts"]["maxQuantity"]))
+
+    def addPartCopies(self, partType : str, bit : int, quantity : int) -> int:
+        """ Give the player up to quantity more copies of a part, filling the lowest empty copies. Returns how many
+        were added, which is less than quantity if the player can't hold that many. """
+        region = f"parts.{partType}"
+        copies = [copy for copy in range(self.data["parts"]["maxQuantity"]) if not self.isBitSet(region, self.partBit(bit, copy))]
+        for copy in copies[:quantity]:
+            self.setBit(region, self.partBit(bit, copy))
+        return min(quantity, len(copies))
+
+    def removePartCopies(self, partType : str, bit : int, quantity : int) -> int:
+        """ Take up to quantity copies of a part away, emptying the highest filled copies. Returns how many were
+        removed. """
+        region = f"parts.{partType}"
+        copies = [copy for copy in reversed(range(self.data["parts"]["maxQuantity"])) if self.isBitSet(region, self.partBit(bit, copy))]
+        for copy in copies[:quantity]:
+            self.clearBit(region, self.partBit(bit, copy))
+        return min(quantity, len(copies))
+
+    def addMoney(self, amount : int) -> int:
+        """ Add to (or, if amount is negative, subtract from) the player's money, which can't go below 0 or above
+        MAX_MONEY. Returns the new amount. """
+        money = max(0, min(MAX_MONEY, self.getValue("money") + amount))
+        self.setValue("money", money)
+        return money
+
+    def popcount(self, region : str) -> int:
+        """ Number of set bits in a region, e.g. how many collectibles or bodies the player owns. """
+        return self.getValue(region).bit_count()
+
+    def popcountPartCopy(self, partType : str, copy : int) -> int:
+        """ Number of parts of a type the player owns at least copy + 1 of. """
+        sizeInBytes = self.data["parts"]["sizeInBytes"]
+        table = self.getRegionBytes(f"parts.{partType}")
+        return int.from_bytes(table[copy * sizeInBytes:(copy + 1) * sizeInBytes], "little").bit_count()
+
+    def decode(self) -> dict:
+        """ The inventory as item names, for displaying and for snapshots that a person can read. """
+        licenseNames = {value: name for name, value in self.data["licenses"]["values"].items()}
+        license = self.getValue("licenses")
+
+        collectibles = [name for name, bit in self.data["collectibles"]["bitOffsets"].items() if self.isBitSet("collectibles", bit)]
+
+        _, bodiesSize, _ = self.regions["bodies"]
+        bodies = [getBodyName(bit) for bit in range(bodiesSize * BITS_IN_BYTE) if self.isBitSet("bodies", bit)]
+
+        parts = {}
+        for partType in self.data["parts"]:
+            if isinstance(self.data["parts"][partType], dict):
+                for name, bit in self.data["parts"][partType]["bitOffsets"].items():
+                    quantity = self.getPartQuantity(partType, bit)
+                    if quantity > 0:
+                        parts[name] = quantity
+
+        return {
+            "money": self.getValue("money"),
+            "license": licenseNames.get(license, license),
+            "collectibles": collectibles,
+            "bodies": bodies,
+            "parts": parts
+        }
+
+    def toSnapshot(self) -> dict:
+        """ A JSON-friendly snapshot: the raw bytes of every region (used to restore), plus the decoded item names. """
+        return {
+            "regions": {name: {"address": hex(address), "bytes": self.getRegionBytes(name).hex()} for name, (address, _, _) in self.regions.items()},
+            "items": self.decode()
+        }
+
+    def checkSnapshot(self, snapshot : dict) -> list[str]:
+        """ Everything that stops a snapshot from being loaded into this inventory: regions that addresses.json doesn't
+        have, regions stored at a different address or with a different size, and regions that can't be decoded. """
+        regions = snapshot.get("regions") if isinstance(snapshot, dict) else None
+        if not isinstance(regions, dict):
+            return ["it has no regions"]
+
+        problems = []
+        for name, region in regions.items():
+            if name not in self.regions:
+                problems.append(f"{name} is not a region in addresses.json")
+                continue
+            address, size, _ = self.regions[name]
+            try:
+                storedAddress = int(region["address"], 16)
+                value = bytes.fromhex(region["bytes"])
+            except (KeyError, TypeError, ValueError):
+                problems.append(f"{name} is malformed (it needs an address and its bytes in hex)")
+                continue
+            if storedAddress != address:
+                problems.append(f"{name} is stored at {hex(storedAddress)}, but addresses.json has it at {hex(address)}")
+            elif len(value) != size:
+                problems.append(f"{name} is {len(value)} bytes, but addresses.json has it as {size} bytes")
+        return problems
+
+    def loadSnapshot(self, snapshot : dict) -> list[str]:
+        """ Overwrite this inventory with the regions stored in a snapshot. Regions that are missing from the snapshot
+        are left as they are. The whole snapshot is checked first, and a ValueError is raised without changing
+        anything if any of it doesn't match addresses.json. Returns the names of the regions loaded. """
+        problems = self.checkSnapshot(snapshot)
+        if problems:
+            raise ValueError("The snapshot doesn't match addresses.json: " + "; ".join(problems))
+
+        loaded = []
+        for name, region in snapshot["regions"].items():
+            self.setRegionBytes(name, bytes.fromhex(region["bytes"]))
+            loaded.append(name)
+        return loaded
+
+    def diff(self, other : "InventoryBitmap") -> list[tuple[int, bytes]]:
+        """ Returns the writes that turn other into this inventory, as (address, data) ranges. Only bytes that differ
+        are written, and runs of differing bytes that are next to each other in memory are merged into one range. """
+        writes = []
+        for address, size, offset in sorted(self.regions.values()):
+            runStart = None
+            for i in range(size + 1):
+                differs = i < size and self.buffer[offset + i] != other.buffer[offset + i]
+                if differs and runStart is None:
+                    runStart = i
+                elif not differs and runStart is not None:
+                    data = bytes(self.buffer[offset + runStart:offset + i])
+                    # Merge with the previous range if it ends exactly where this one starts (e.g. across regions)
+                    if writes and writes[-1][0] + len(writes[-1][1]) == address + runStart:
+                        writes[-1] = (writes[-1][0], writes[-1][1] + data)
+                    else:
+                        writes.append((address + runStart, data))
+                    runStart = None
+        return writes
+
+    def write(self, pine : Pine, current : "InventoryBitmap" = None) -> list[tuple[int, bytes]]:
+        """ Write this inventory into the emulator. Only the ranges that differ from current (or from a fresh snapshot
+        if current is not given) are written, in one batched request. Returns the ranges written. """
+        if current is None:
+            current = InventoryBitmap.fromPine(self.data, pine)
+        writes = self.diff(current)
+        if writes:
+            pine.batch_write_bytes(writes)
+        return writes
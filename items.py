@@ -0,0 +1,385 @@
+from inventory import InventoryBitmap, LIFE_BODY_BIT_OFFSET
+import profiler
+import json
+import re
+
+# The item catalog, and how each kind of item changes the inventory. Shared by the command prompt (main.py), the 
+#     daemon (daemon.py) and the monitor, which all work on an InventoryBitmap and only differ in how they read and 
+#     write it.
+
+CMD_GET = "get"
+CMD_REMOVE = "remove"
+PROGRESSIVE_SET_COUNT = 3 # Set 1 plus the two additional progressive part tracks
+
+# Items that do not change the inventory
+NON_INVENTORY_ITEMS = ["Stamp", "__Victory__"]
+
+# Stored in the run state: how many items of each seed and slot (keyed "seed:slot") have been given by receiveItems
+RECEIVED_ITEMS_KEY = "Received Items"
+
+# Kinds of item, see getItemKind
+ITEM_PROGRESSIVE = "progressive"
+ITEM_COLLECTIBLE = "collectible"
+ITEM_BODY = "body"
+ITEM_LICENSE = "license"
+ITEM_MONEY = "money"
+ITEM_PART = "part"
+
+# Part tables used by progressive upgrades, keyed by the part type in the progressive item's name
+PROGRESSIVE_PART_TABLES = {
+    "Tires": "tires",
+    "Engine": "engines",
+    "Chassis": "chassis",
+    "Transmission": "transmission",
+    "Steering": "steering",
+    "Brakes": "brakes"
+}
+
+# Tires are not provided in their internal order, use the below order instead
+PROGRESSIVE_TIRE_ORDER = [
+    "Normal Tires",
+    "Off-Road Tires", 
+    "Sports Tires", 
+    "Studless Tires", 
+    "Semi-Racing Tires", 
+    "Wet Tires", 
+    "HG Off-Road Tires", 
+    "HG Studless Tires", 
+    "HG Wet Tires", 
+    "Racing Tires", 
+    "Big Tires", 
+    "HG Racing Tires",
+    "Devil Tires"
+]
+
+def findPartType(table : dict, item : str) -> str | None:
+    # Returns the name of the part table (e.g. "engines") that contains this item, or None if it is not a part
+    with profiler.phase(profiler.PHASE_CATALOG):
+        for partType in table:
+            # Check that we're reading from a nested dictionary (if not, short-curcuit), then check if item is in bitOffsets
+            if isinstance(table[partType], dict) and item in table[partType]["bitOffsets"]:
+                return partType
+        return None
+
+def getProgressiveOrder(data : dict, itemType : str) -> list[str]:
+    # Returns the names of the items awarded by a progressive track, where the list index is the track's level.
+    #     Index 0 is the item the player starts with (e.g. Normal Engine, or the C License).
+    if itemType == "License":
+        values = data["licenses"]["values"]
+        return sorted(values, key=lambda name: values[name])
+    elif itemType == "Tires":
+        return PROGRESSIVE_TIRE_ORDER
+    else:
+        bitOffsets = data["parts"][PROGRESSIVE_PART_TABLES[itemType]]["bitOffsets"]
+        return sorted(bitOffsets, key=lambda name: bitOffsets[name])
+
+def getProgressiveTrackNames(itemType : str) -> list[str]:
+    # "Progressive License" only has one track, every part type has one track per upgrade set
+    if itemType == "License":
+        return ["Progressive License"]
+    return [f"Progressive {itemType}"] + [f"Progressive {itemType} - Set {i}" for i in range(2, PROGRESSIVE_SET_COUNT + 1)]
+
+def deriveProgressiveLevels(data : dict, bitfields : dict[str, list[int]], license : int, currentRun : dict) -> tuple[dict[str, int], list[str]]:
+    # Compute the level of every progressive track implied by the inventory bitfields.
+    #
+    # Road Trip stores your Nth copy of a part in the Nth quantity bitfield, and each progressive track awards its parts 
+    #     in order, so the Nth bitfield holds exactly the first L parts of the Nth highest track (excluding the part at 
+    #     level 0, which the player starts with). The level of that track is therefore the popcount of the bitfield, 
+    #     masked to the parts the tracks can award.
+    #
+    # Memory only tells us the levels, not which set each one belongs to. Levels are handed back to the tracks in the
+    #     same order they were in the stored run state (highest first), so a consistent run state is left as it was.
+    levels = {"Progressive License": license}
+    warnings = []
+
+    for itemType in PROGRESSIVE_PART_TABLES:
+        bitOffsets = data["parts"][PROGRESSIVE_PART_TABLES[itemType]]["bitOffsets"]
+        progressionBits = [bitOffsets[name] for name in getProgressiveOrder(data, itemType)[1:]]
+        progressionMask = sum(1 << bit for bit in progressionBits)
+
+        derived = []
+        for bitfield in bitfields[itemType][:PROGRESSIVE_SET_COUNT]:
+            level = (bitfield & progressionMask).bit_count()
+            # The bits should form an unbroken prefix of the progression - if the highest bit is past the popcount, the 
+            #     player has parts from outside the progressive tracks (e.g. repurchased in My City).
+            prefixMask = sum(1 << bit for bit in progressionBits[:level])
+            if bitfield & progressionMask != prefixMask:
+                warnings.append(f"{itemType} copy {len(derived) + 1} has parts outside the progressive order, level {level} is an estimate")
+            derived.append(level)
+
+        trackNames = getProgressiveTrackNames(itemType)
+        storedOrder = sorted(trackNames, key=lambda name: currentRun.get(name, 0), reverse=True)
+        for name, level in zip(storedOrder, sorted(derived, reverse=True)):
+            levels[name] = level
+
+    return levels, warnings
+
+def getBodyBitOffset(item : str) -> int | None:
+    if item != "Life Body":
+        if not item[0:6] == "Body Q":
+            print("Error: updateBody called, but item is not a body")
+            return None
+        try:
+            value = int(item[6:])
+            if item != "Body Q150":
+                value -= 1 # All bodies except Q150 are at an offset of their body number minus 1
+        except:
+            print("Error: Body value provided does not appear to be a number")
+            return None
+    else:
+        value = LIFE_BODY_BIT_OFFSET
+
+    if value > 150 or value < 0:
+        print("Error: Invalid body value (greater than 150 or less than 0")
+        return None
+
+    return value
+
+def fixPossibleItemNameIssues(item : str):
+    # Remove the " (Key)" string if included
+    item = item.replace(" (Key)", "")
+
+    # For "Normal Wheel" and "Mesh Wheel", the plural form should also be accepted
+    item = item.replace("Wheels", "Wheel")
+
+    # Correct "Hide-Out Pattern" to "Hide-out Pattern" 
+    # ('out' is lowercase in-game, but it's helpful for both to be accepted)
+    item = item.replace("Hide-Out", "Hide-out")
+
+    return item
+
+def getItemKind(data : dict, item : str) -> str:
+    # Which kind of item this is, checked in the same order the editor has always used. Anything else may be a part.
+    if item in data["progressiveUpgrades"]["names"]:
+        return ITEM_PROGRESSIVE
+    elif item in data["collectibles"]["bitOffsets"]:
+        return ITEM_COLLECTIBLE
+    elif item[0:6] == "Body Q" or item == "Life Body":
+        return ITEM_BODY
+    elif item in data["licenses"]["values"]:
+        return ITEM_LICENSE
+    elif item.lower() == "money":
+        return ITEM_MONEY
+    return ITEM_PART
+
+def loadReceivedItems(filename : str) -> dict[str, int]:
+    # Accepts a JSON list of item names, a JSON object of item names to counts (e.g. from the Manual client's 
+    #     /export_items command), or a text file with one item per line, optionally followed by its count in 
+    #     parentheses like the Manual client displays it (e.g. "Progressive Engine (3)").
+    with open(filename, "r") as file:
+        if filename.lower().endswith(".json"):
+            contents = json.load(file)
+            if isinstance(contents, dict):
+                return {name: int(count) for name, count in contents.items()}
+            lines = contents
+        else:
+            lines = [line.strip() for line in file if line.strip()]
+
+    receivedItems = {}
+    for line in lines:
+        match = re.match(r"^(.*?)\s*\((\d+)\)$", line)
+        name, count = (match.group(1), int(match.group(2))) if match else (line, 1)
+        receivedItems[name] = receivedItems.get(name, 0) + count
+
+    return receivedItems
+
+def computeTargetInventory(data : dict, current : InventoryBitmap, receivedItems : dict[str, int]) -> tuple[InventoryBitmap, dict[str, int]]:
+    # Build the inventory the player should have after receiving every item in receivedItems, starting from their 
+    #     current inventory. Returns the target inventory and the level of every progressive track.
+    #
+    # Collectibles and the license are set exactly, since only Archipelago can give them after initAP. Parts 
+    #     (including the ones from progressive tracks) and bodies are only ever added: the player can own extra copies 
+    #     outside of the randomizer (e.g. the Normal parts you start with, or parts bought again in My City), so a part 
+    #     is only given until the player owns at least as many copies as were received.
+    target = current.copy()
+    levels = {name: 0 for name in data["progressiveUpgrades"]["names"]}
+    partCounts = {}
+    licenseValue = 0
+    unknownItems = []
+
+    # Collectibles are only ever given by Archipelago, so remove any that were not received
+    for bit in data["collectibles"]["bitOffsets"].values():
+        target.clearBit("collectibles", bit)
+
+    for item, count in receivedItems.items():
+        item = fixPossibleItemNameIssues(item)
+
+        if item in levels:
+            levels[item] += count
+        elif item in data["collectibles"]["bitOffsets"]:
+            target.setBit("collectibles", data["collectibles"]["bitOffsets"][item])
+        elif item[0:6] == "Body Q" or item == "Life Body":
+            bit = getBodyBitOffset(item)
+            if bit != None:
+                target.setBit("bodies", bit)
+        elif item in data["licenses"]["values"]:
+            licenseValue = max(licenseValue, data["licenses"]["values"][item])
+        elif item in NON_INVENTORY_ITEMS:
+            continue
+        elif findPartType(data["parts"], item) != None:
+            partCounts[item] = partCounts.get(item, 0) + count
+        else:
+            unknownItems.append(item)
+
+    if unknownItems:
+        print(f"Warning: {len(unknownItems)} unknown items will not be synced:", ", ".join(sorted(unknownItems)))
+
+    # Each progressive track at level L owns one copy of the first L parts in its progression
+    licenseValue = max(licenseValue, levels["Progressive License"])
+    for itemType in PROGRESSIVE_PART_TABLES:
+        for index, name in enumerate(getProgressiveOrder(data, itemType)[1:], start=1):
+            tracksAtLevel = sum(1 for track in getProgressiveTrackNames(itemType) if levels[track] >= index)
+            partCounts[name] = partCounts.get(name, 0) + tracksAtLevel
+
+    maxQuantity = data["parts"]["maxQuantity"]
+    for item, count in partCounts.items():
+        partType = findPartType(data["parts"], item)
+        bit = data["parts"][partType]["bitOffsets"][item]
+        if count > maxQuantity:
+            print(f"Warning: Received {count} of {item}, but only {maxQuantity} can be held")
+        missing = count - target.getPartQuantity(partType, bit)
+        for copy in range(maxQuantity):
+            if missing <= 0:
+                break
+            if not target.isBitSet(f"parts.{partType}", target.partBit(bit, copy)):
+                target.setBit(f"parts.{partType}", target.partBit(bit, copy))
+                missing -= 1
+
+    target.setValue("licenses", licenseValue)
+
+    return target, levels
+
+def applyItemToInventory(data : dict, inventory : InventoryBitmap, cmd : str, item : str, value : str, currentRun : dict) -> str:
+    # The one place a get/remove changes the inventory, whether it comes from the command prompt, the daemon or an 
+    #     item received from Archipelago. It is applied to an in-memory inventory, so the caller can combine several 
+    #     changes into one batched read and write. Returns a message describing the change, and raises a ValueError 
+    #     if the command can't be applied.
+    if cmd != CMD_GET and cmd != CMD_REMOVE:
+        raise ValueError(f"Invalid command '{cmd}'")
+    if not item:
+        raise ValueError("No item supplied")
+
+    with profiler.phase(profiler.PHASE_NAMES):
+        item = fixPossibleItemNameIssues(item)
+    with profiler.phase(profiler.PHASE_CATALOG):
+        itemKind = getItemKind(data, item)
+
+    def updatePartCopies(partItem : str, quantity : int) -> tuple[int, str]:
+        # Returns how many copies were added/removed, and a message that warns when that's fewer than asked for
+        partType = findPartType(data["parts"], partItem)
+        bit = data["parts"][partType]["bitOffsets"][partItem]
+        if cmd == CMD_GET:
+            changed = inventory.addPartCopies(partType, bit, quantity)
+            if changed < quantity:
+                return changed, f"Warning: Cannot hold more than {data['parts']['maxQuantity']} of a part, adding {changed}"
+        else:
+            changed = inventory.removePartCopies(partType, bit, quantity)
+            if changed < quantity:
+                return changed, f"Warning: Only {changed} of this part in inventory, removing {changed}"
+        return changed, f"{cmd} {changed} of {partItem}"
+
+    if itemKind == ITEM_PROGRESSIVE:
+        itemType = item.split(" ")[1]
+        itemIndex = currentRun.get(item, 0)
+        if cmd == CMD_REMOVE and itemIndex <= 0:
+            raise ValueError("Cannot remove progressive upgrade since we do not currently have any of this type")
+
+        progressiveOrder = getProgressiveOrder(data, itemType)
+        newIndex = itemIndex + 1 if cmd == CMD_GET else itemIndex
+        if newIndex >= len(progressiveOrder):
+            raise ValueError("Could not find a valid new item to award")
+        newItem = progressiveOrder[newIndex]
+
+        warning = None
+        if itemType == "License":
+            inventory.setValue("licenses", newIndex if cmd == CMD_GET else newIndex - 1)
+        else:
+            changed, partMessage = updatePartCopies(newItem, 1)
+            # The level still changes, so the run state keeps counting the upgrades received
+            if changed < 1:
+                warning = partMessage
+
+        currentRun[item] = newIndex if cmd == CMD_GET else newIndex - 1
+        message = f"{item} is now level {currentRun[item]} ({newItem})"
+        return message if warning == None else f"{warning}\n{message}"
+
+    elif itemKind == ITEM_COLLECTIBLE:
+        if cmd == CMD_GET:
+            inventory.setBit("collectibles", data["collectibles"]["bitOffsets"][item])
+        else:
+            inventory.clearBit("collectibles", data["collectibles"]["bitOffsets"][item])
+        return f"{cmd} {item}"
+
+    elif itemKind == ITEM_BODY:
+        bit = getBodyBitOffset(item)
+        if bit == None:
+            raise ValueError(f"Invalid body '{item}'")
+        if cmd == CMD_GET:
+            inventory.setBit("bodies", bit)
+        else:
+            inventory.clearBit("bodies", bit)
+        return f"{cmd} {item}"
+
+    elif itemKind == ITEM_LICENSE:
+        licenseValue = data["licenses"]["values"][item]
+        if cmd == CMD_REMOVE:
+            if licenseValue == 0:
+                raise ValueError("Cannot remove C License")
+            licenseValue -= 1
+        inventory.setValue("licenses", licenseValue)
+        return f"License set to {licenseValue}"
+
+    elif itemKind == ITEM_MONEY:
+        if value == None or not str(value).isdigit():
+            raise ValueError("Money amount provided is not an integer")
+        money = inventory.addMoney(int(value) if cmd == CMD_GET else -int(value))
+        return f"Money is now {money}"
+
+    elif findPartType(data["parts"], item) != None:
+        if value != None and (not str(value).isdigit() or int(value) <= 0):
+            raise ValueError("Quantity provided is not a positive integer")
+        return updatePartCopies(item, 1 if value == None else int(value))[1]
+
+    else:
+        raise ValueError(f"Item '{item}' not found")
+
+def applyReceivedItem(data : dict, inventory : InventoryBitmap, item : str, currentRun : dict) -> str | None:
+    # Give one item received from Archipelago to an in-memory inventory, counted the same way sync counts it. Returns
+    #     a message describing the change, or None for items that aren't part of the inventory (e.g. stamps). Raises
+    #     a ValueError if the item can't be given.
+    item = fixPossibleItemNameIssues(item)
+    if item in NON_INVENTORY_ITEMS:
+        return None
+    return applyItemToInventory(data, inventory, CMD_GET, item, None, currentRun)
+
+def receiveItems(data : dict, inventory : InventoryBitmap, key : str, start : int, items : list[str], currentRun : dict) -> tuple[int, list[str]]:
+    # Give the items a player has received from Archipelago, where items[0] is the start-th item they received. Items 
+    #     that were already given are skipped, using the count stored in the run state, so items can be sent again 
+    #     after a reconnect without being given twice. The count is updated in the same run state as the progressive 
+    #     levels, so both are saved together. Returns how many items have now been given, and a message per item.
+    if not isinstance(key, str) or not key:
+        raise ValueError("A key (e.g. \"seed:slot\") is required")
+    if not isinstance(start, int) or start < 0:
+        raise ValueError("start must be a non-negative integer")
+    if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+        raise ValueError("items must be a list of item names")
+
+    received = dict(currentRun.get(RECEIVED_ITEMS_KEY, {}))
+    given = received.get(key, 0)
+    if start > given:
+        raise ValueError(f"Items {given} to {start - 1} of {key} have not been given yet, send them first")
+
+    messages = []
+    for item in items[given - start:]:
+        # An item that can't be given is still counted, so that it isn't retried forever
+        try:
+            message = applyReceivedItem(data, inventory, item, currentRun)
+        except ValueError as ex:
+            message = f"Could not give {item}: {ex}"
+        if message:
+            messages.append(message)
+        given += 1
+
+    received[key] = given
+    currentRun[RECEIVED_ITEMS_KEY] = received
+    return given, messages
@@ -1,64 +1,88 @@
 from pine.pine import Pine
 from time import sleep
+import argparse
 import shlex
 import json
 import os
+from inventory import InventoryBitmap
+from items import CMD_GET, CMD_REMOVE, PROGRESSIVE_PART_TABLES, applyItemToInventory, computeTargetInventory, \
+    deriveProgressiveLevels, loadReceivedItems
+from patches import CMD_INIT, ROAD_TRIP_GAME_ID, INIT_HOOK_ADDRESS, INIT_HOOK_BYTES, EVENT_STUB_ADDRESS, \
+    EVENT_PICKUP_ENTRY_ADDRESS, EVENT_RING_ADDRESS, EVENT_RING_SIZE, EVENT_RING_RECORD_SIZE, EVENT_RING_MAGIC, \
+    EVENT_OVERWORLD_ITEM, OVERWORLD_ITEMS
+from runstate import CURRENT_RUN_FILE, loadCurrentRun, saveCurrentRun
+import profiler
+import session
 
 BITS_IN_BYTE = 8
 MIPS_INSTRUCTION_SIZE = 4
-CMD_GET = "get"
-CMD_REMOVE = "remove"
-CMD_INIT = "initAP"
 CMD_HELP = "help"
+CMD_RECONCILE = "reconcile"
+CMD_DUMP = "dump"
+CMD_RESTORE = "restore"
+CMD_SYNC = "sync"
+CMD_MONITOR = "monitor"
+INTERACTIVE_COMMANDS = [CMD_MONITOR] # Commands that run until the user stops them, which replay.py skips
 NOP_BYTES = bytes([0,0,0,0])
-LIFE_BODY_BIT_OFFSET = 149
-
-def setBit(bytes : bytes, bitIndex : int, endianness="little") -> bytes:
-    val = bytes_to_int(bytes, endianness)
-
-    if(len(bytes) * BITS_IN_BYTE > bitIndex):
-        val = val | (1 << bitIndex)
-        val = int_to_bytes(val, len(bytes), endianness)
-    else:
-        raise ValueError("Error in setBit: Bit index out of range")
-    
-    return val
-
-def clearBit(bytes : bytes, bitIndex : int, endianness="little") -> bytes:
-    val = bytes_to_int(bytes, endianness)
-
-    if(len(bytes) * BITS_IN_BYTE > bitIndex):
-        val = val & ~(1 << bitIndex)
-        val = int_to_bytes(val, len(bytes), endianness)
-    else:
-        raise ValueError("Error in clearBit: Bit index out of range")
-    
-    return val
-
-def isBitSet(bytes : bytes, bit : int) -> bool:
-    # If clearBit does not change the value, that means the bit is not set
-    return bytes != clearBit(bytes, bit)
-
-def updateBit(cmd : str, bytes : bytes, bit: int, endianness="little") -> bytes:
-    if(cmd == CMD_GET):
-        return setBit(bytes, bit, endianness)
-    elif(cmd == CMD_REMOVE):
-        return clearBit(bytes, bit, endianness)
-    else:
-        raise ValueError("Error: First argument is not valid, but we're already handling a collectible upgrade... how did you get here??")
-
-# https://stackoverflow.com/a/30375198
-# Changed function to require a length value - Python removes leading 0s from bytes, which was causing problems.
-def int_to_bytes(x: int, len : int, endianness="little") -> bytes:
-    return x.to_bytes(len, endianness)
+DEFAULT_DUMP_FILE = "inventory_dump.json"
+DEFAULT_SYNC_FILE = "received_items.json"
 
 def bytes_to_int(xbytes: bytes, endianness="little") -> int:
     return int.from_bytes(xbytes, endianness)
 
-def bytes_length(x : int) -> int:
-    return (x.bit_length() + 7) // 8
+def mipsJump(opcode : int, target : int) -> bytes:
+    # Encode a j (opcode 2) or jal (opcode 3) to an address in the same 256MB segment
+    return ((opcode << 26) | ((target >> 2) & 0x3FFFFFF)).to_bytes(MIPS_INSTRUCTION_SIZE, "little")
+
+def mipsJal(target : int) -> bytes:
+    return mipsJump(3, target)
+
+def mipsJ(target : int) -> bytes:
+    return mipsJump(2, target)
+
+def initEventRing(pine : Pine):
+    # The event stub is called with the event type in t2 and the item id in a0, and appends (type, item id) to the
+    #     ring buffer. Overworld items are collected on every frame the car touches them (initAP keeps them in the
+    #     overworld), so an event that's the same as the last one is dropped.
+    stub = b''.join([
+        bytes([0x2E, 0x00, 0x08, 0x3C]), # lui t0, 0x002E (3C08002E)
+        bytes([0x00, 0xA2, 0x08, 0x35]), # ori t0, t0, 0xA200 (3508A200) - t0 = ring buffer
+        bytes([0x04, 0x00, 0x09, 0x8D]), # lw t1, 0x4(t0) (8D090004) - last event type
+        bytes([0x03, 0x00, 0x2A, 0x15]), # bne t1, t2, 0x2EA0EC (152A0003)
+        bytes([0x08, 0x00, 0x09, 0x8D]), # lw t1, 0x8(t0) (8D090008) - last item id
+        bytes([0x0B, 0x00, 0x24, 0x11]), # beq t1, a0, 0x2EA114 (1124000B)
+        NOP_BYTES,                       # nop (00000000)
+        bytes([0x00, 0x00, 0x09, 0x8D]), # lw t1, 0x0(t0) (8D090000) - write index
+        bytes([0x1F, 0x00, 0x2B, 0x31]), # andi t3, t1, 0x1F (312B001F)
+        bytes([0xC0, 0x58, 0x0B, 0x00]), # sll t3, t3, 3 (000B58C0)
+        bytes([0x21, 0x58, 0x68, 0x01]), # addu t3, t3, t0 (01685821)
+        bytes([0x10, 0x00, 0x6A, 0xAD]), # sw t2, 0x10(t3) (AD6A0010) - record's event type
+        bytes([0x14, 0x00, 0x64, 0xAD]), # sw a0, 0x14(t3) (AD640014) - record's item id
+        bytes([0x04, 0x00, 0x0A, 0xAD]), # sw t2, 0x4(t0) (AD0A0004)
+        bytes([0x08, 0x00, 0x04, 0xAD]), # sw a0, 0x8(t0) (AD040008)
+        bytes([0x01, 0x00, 0x29, 0x25]), # addiu t1, t1, 0x1 (25290001)
+        bytes([0x00, 0x00, 0x09, 0xAD]), # sw t1, 0x0(t0) (AD090000) - publish the record last
+        bytes([0x08, 0x00, 0xE0, 0x03]), # jr ra (03E00008)
+        NOP_BYTES                        # nop (00000000)
+    ])
+
+    # Overworld items: the item id is the item's index in OVERWORLD_ITEMS
+    pickupEntries = b''
+    for index in range(len(OVERWORLD_ITEMS)):
+        pickupEntries += bytes([index, 0x00, 0x04, 0x24]) # addiu a0, zero, index
+        pickupEntries += mipsJ(EVENT_STUB_ADDRESS)
+        pickupEntries += bytes([EVENT_OVERWORLD_ITEM, 0x00, 0x0A, 0x24]) # addiu t2, zero, 0x3
+
+    ringHeader = bytes(12) + EVENT_RING_MAGIC
+    pine.batch_write_bytes([
+        (EVENT_RING_ADDRESS, ringHeader + bytes(EVENT_RING_SIZE * EVENT_RING_RECORD_SIZE)),
+        (EVENT_STUB_ADDRESS, stub + pickupEntries)
+    ])
 
 def init(data : dict, pine : Pine):
+    # Write the event ring buffer's stub first, since the hooks below jump into it
+    initEventRing(pine)
+
     # Inject an ASM function that prevents purchased items from being added to your inventory, *except* in My City.
     #     My City's part shop does not contain any locations, and is used exclusively for repurchasing parts you've
     #     already obtained.
@@ -66,10 +90,10 @@ def init(data : dict, pine : Pine):
     # At 0x2697d8, change the ASM instruction (which is currently a jump-and-link to the function that handles updating  
     #     your inventory) to a jal to 0x2EA0A8. This is a region of memory containing unused non-English strings.
     #     We'll use this memory as a code cave for a new hook.
-    pine.write_bytes(0x2697D8, bytes([0x2A, 0xA8, 0x0B, 0x0C])) # jal 0x002EA0A8 (0C0BA82A)
+    pine.write_bytes(INIT_HOOK_ADDRESS, INIT_HOOK_BYTES) # jal 0x002EA0A8 (0C0BA82A)
     
     # In our hook, test if the current region index is 9 (My City).
-    #     If it's not, simply return.
+    #     If it's not, return immediately without updating your inventory.
     #     If it is, jump (not jal) to the function that updates your inventory.
     pine.write_bytes(0x2EA0A8, bytes([0x33, 0x00, 0x08, 0x3C])) # lui t0, 0x0033 (3C080033)
     pine.write_bytes(0x2EA0AC, bytes([0x23, 0x59, 0x08, 0x25])) # addiu t0, t0, 0x5923 (25085923)
@@ -112,28 +136,14 @@ def init(data : dict, pine : Pine):
     # NOP the line of assembly that gives the player license upgrades
     pine.write_bytes(0x236704, NOP_BYTES)
 
-    # Write NOPs to prevent overworld items from adding to your inventory on collision
-    overworldItemJALs = [
-        # First location = NOP function call for playing pickup sound
-        #     If we do not NOP this, it will play the sound on every frame, which (although pretty funny) 
-        #     is loud and sounds bad
-        # Second location = NOP function call for inventory update
-        0x2409E0,           # Peach  # 0x2409D0 for sound,  not needed for the Peach
-        0x25C02C, 0x25C03C, # Wallet 
-        0x25C2A4, 0x25C2B4, # Fluffy Mushroom
-        0x25C3E0, 0x25C3F0, # Amethyst
-        0x25C4C4, 0x25C4D4, # Moonstone
-        0x25C5F8, 0x25C608, # Small Bottle
-        0x25C6D8, 0x25C6E8, # Black Opal
-        0x25C7B8, 0x25C7C8, # Papu Flower
-        0x25C8F4, 0x25C904, # Ruby
-        0x25CAD8, 0x25CAE8, # Fountain Pen
-        0x25CBB8, 0x25CBC8, # Blue Sapphire
-        0x25D498, 0x25D4A8, # Topaz
-        0x25D5A8, 0x25D5B8  # Emerald
-    ]
-    for address in overworldItemJALs:
-        pine.write_bytes(address, NOP_BYTES)
+    # Prevent overworld items from adding to your inventory on collision
+    #     The function call for playing the pickup sound is NOP'd. If we do not NOP this, it will play the sound on 
+    #     every frame, which (although pretty funny) is loud and sounds bad.
+    #     The function call for the inventory update is redirected to the item's entry for the event ring buffer.
+    for index, (soundJAL, inventoryJAL, _) in enumerate(OVERWORLD_ITEMS):
+        if soundJAL != None:
+            pine.write_bytes(soundJAL, NOP_BYTES)
+        pine.write_bytes(inventoryJAL, mipsJal(EVENT_PICKUP_ENTRY_ADDRESS + index * 3 * MIPS_INSTRUCTION_SIZE))
     
     # Also modify these functions to prevent overworld items from disappearing when we add that item to our
     #    inventory. (Road Trip uses the status of the item in your inventory to determine whether it should
@@ -169,331 +179,226 @@ def init(data : dict, pine : Pine):
 
     print("initAP Successful")
 
-def getPartData(table : dict, item : str) -> tuple[bool, list]:
-    itemFound = False
-    itemData = [None, None, None]
-    for partType in table:
-        # Check that we're reading from a nested dictionary (if not, short-curcuit), then check if item is in bitOffsets
-        if isinstance(table[partType], dict) and item in table[partType]["bitOffsets"]:
-            print("Bit:", table[partType]["bitOffsets"][item])
-
-            inventoryAddress = int(table[partType]["inventoryAddress"], 16) # Addresses in data object are hex strings e.g. "0x2DC56C", need to convert to int
-            bit = table[partType]["bitOffsets"][item]
-            shopAddress = int(table[partType]["shopAddress"], 16)
-
-            itemData = [inventoryAddress, bit, shopAddress]
-            itemFound = True
-            break
-    
-    return itemFound, itemData
-
-def updatePart(table : dict, pine : Pine, cmd : str, item : str):
-    MAX_QUANTITY = table["maxQuantity"]
-    SIZE_IN_BYTES = table["sizeInBytes"]
-
-    partData = getPartData(table, item)
-    itemFound = partData[0]
-    inventoryAddress, bit, shopAddress = partData[1]
-
-    if itemFound:
-        # Check each quantity bitfield. (Road Trip uses separate bitfields for your 1st/2nd/etc. copies of a 
-        #     part - i.e. bitfield 1 tracks your first copy of all parts, bitfield 2 tracks all second
-        #     copies, etc.) Once we find one that is empty, either add the part to that bitfield, or remove 
-        #     it from the previous one, depending on the command.
-        i = 0
-        prevBytes = None
-        while i < MAX_QUANTITY:
-            bytes = pine.read_bytes(inventoryAddress, SIZE_IN_BYTES)
-
-            # Update Inventory
-            if not isBitSet(bytes, bit):
-                print("Open bit found")
-                # If we're gaining a part, set this bit to 1 in the current set of bytes
-                #    (i.e. current quantity and address)
-                if(cmd == CMD_GET):
-                    bytes = setBit(bytes, bit)
-                # If we're losing a part, set this bit to 0 in the *previous* set of bytes 
-                #   (i.e. previous quantity and address)
-                elif(cmd == CMD_REMOVE):
-                    if(i > 0):
-                        bytes = prevBytes
-                        inventoryAddress -= SIZE_IN_BYTES
-                        bytes = clearBit(bytes, bit)
-                break
-            else:
-                inventoryAddress += SIZE_IN_BYTES
-                prevBytes = bytes
-                i = i + 1
-
-        if (i == MAX_QUANTITY):
-            # If we run the full while loop without finding an unset bit, address gets incremented out of range
-            inventoryAddress -= SIZE_IN_BYTES 
-            # If we checked every bit, and all were already set, then we currently have the maximum number of an item.
-            #   If the command was remove, we need to remove the part from the last quantity bitfield.
-            if(cmd == CMD_REMOVE):
-                bytes = clearBit(bytes, bit)
-
-        # Finally, write the updated inventory bitfield into memory.
-        print("Writing to address", hex(inventoryAddress))
-        pine.write_bytes(inventoryAddress, bytes)
-
-        #updateItemInCurrentRun(cmd, item)
-    else:
-        print("Error: Item not found")
-
-def updateProgressiveUpgrade(data : dict, pine : Pine, cmd : str, item : str):
-    # Determine which table this part is in, and which part in the progression to give to/remove from the player
-    itemType = item.split(" ")[1]
-    typeObj = None
-    match itemType:
-        case "License":
-            typeObj = data["licenses"]
-        case "Tires":
-            typeObj = data["parts"]["tires"]
-        case "Engine":
-            typeObj = data["parts"]["engines"]
-        case "Chassis":
-            typeObj = data["parts"]["chassis"]
-        case "Transmission":
-            typeObj = data["parts"]["transmission"]
-        case "Steering":
-            typeObj = data["parts"]["steering"]
-        case "Brakes":
-            typeObj = data["parts"]["brakes"]
-        case _:
-            print("Error: Invalid progressive item type provided")
-            return
-    
-    ensureCurrentRunFileExists()
-    
-    with open("current_run.json", "r") as file:
-        currentRun = json.load(file)
-    
-    if item in currentRun:
-        itemIndex = currentRun[item]
-    else:
-        itemIndex = 0
-
-    if cmd == CMD_GET:
-        itemIndex += 1
-
-    if cmd == CMD_REMOVE and itemIndex <= 0:
-        print("Error: Cannot remove progressive upgrade since we do not currently have any of this type.")
+def readProgressiveInventory(data : dict, pine : Pine) -> tuple[dict[str, list[int]], int]:
+    # Read every quantity bitfield of the six progressive part types, plus the license byte, in one batched request.
+    #     Returns the bitfields of each part type (one int per quantity, first copy first) and the license value.
+    parts = data["parts"]
+    MAX_QUANTITY = parts["maxQuantity"]
+    SIZE_IN_BYTES = parts["sizeInBytes"]
+
+    regions = [(int(parts[table]["inventoryAddress"], 16), MAX_QUANTITY * SIZE_IN_BYTES) for table in PROGRESSIVE_PART_TABLES.values()]
+    regions.append((int(data["licenses"]["address"], 16), data["licenses"]["sizeInBytes"]))
+    results = pine.batch_read_bytes(regions)
+
+    bitfields = {}
+    for itemType, result in zip(PROGRESSIVE_PART_TABLES, results):
+        bitfields[itemType] = [bytes_to_int(result[i:i + SIZE_IN_BYTES]) for i in range(0, len(result), SIZE_IN_BYTES)]
+
+    return bitfields, bytes_to_int(results[-1])
+
+def reconcileCurrentRun(data : dict, pine : Pine, currentRun : dict):
+    bitfields, license = readProgressiveInventory(data, pine)
+    levels, warnings = deriveProgressiveLevels(data, bitfields, license, currentRun)
+
+    for warning in warnings:
+        print("Warning:", warning)
+
+    mismatches = {}
+    print(f"{'Progressive track':<36}{'Stored':>8}{'Memory':>8}")
+    for name in data["progressiveUpgrades"]["names"]:
+        stored = currentRun.get(name, 0)
+        derived = levels.get(name, 0)
+        if stored == 0 and derived == 0:
+            continue
+        print(f"{name:<36}{stored:>8}{derived:>8}" + ("" if stored == derived else "  <-- mismatch"))
+        if stored != derived:
+            mismatches[name] = derived
+
+    if not mismatches:
+        print("Stored run state matches the emulator's memory.")
         return
 
-    # Search through the items of this part type to see if we can find one with a bit offset that matches
-    #     our new itemIndex.
-    newItem = None
-    if itemType != "Tires" and itemType != "License":
-        for name, value in typeObj["bitOffsets"].items():
-            if value == itemIndex:
-                newItem = name
-                break
-    # Tires are not provided in their internal order, use the below order instead
-    elif itemType == "Tires":
-        progressiveTireOrder = [
-            "Normal Tires",
-            "Off-Road Tires", 
-            "Sports Tires", 
-            "Studless Tires", 
-            "Semi-Racing Tires", 
-            "Wet Tires", 
-            "HG Off-Road Tires", 
-            "HG Studless Tires", 
-            "HG Wet Tires", 
-            "Racing Tires", 
-            "Big Tires", 
-            "HG Racing Tires",
-            "Devil Tires"
-        ]
-        newItem = progressiveTireOrder[itemIndex]
-    # Licenses do not use bit offsets, they use specific values instead
-    else:
-        for name, value in typeObj["values"].items():
-            if value == itemIndex:
-                newItem = name
-                break
-    if newItem != None:
-        if itemType != "License":
-            updatePart(data["parts"], pine, cmd, newItem)
-        else:
-            setLicense(data["licenses"], pine, cmd, newItem)
+    answer = session.readInput("Type 'repair' to fix the mismatched tracks, 'replace' to rebuild the run state from memory, or anything else to cancel: ")
+    if answer.strip().lower() == "repair":
+        currentRun.update(mismatches)
+    elif answer.strip().lower() == "replace":
+        for name in data["progressiveUpgrades"]["names"]:
+            currentRun.pop(name, None)
+        currentRun.update({name: level for name, level in levels.items() if level > 0})
     else:
-        print("Error: Progressive Upgrade function could not find a valid new item to award.")
+        print("Run state left unchanged.")
         return
 
-    # Update our stored Python object that represents our JSON data
-    currentRun[item] = itemIndex
+    saveCurrentRun(currentRun)
+    print(f"Updated {CURRENT_RUN_FILE}.")
 
-    if cmd == CMD_REMOVE:
-        currentRun[item] -= 1
+def dumpInventory(data : dict, pine : Pine, currentRun : dict, filename : str):
+    # Snapshot the whole inventory in one batched read, and store it along with the current run state
+    inventory = InventoryBitmap.fromPine(data, pine)
+    snapshot = inventory.toSnapshot()
+    snapshot["currentRun"] = currentRun
 
-    # Write the updated object back to the current_run file
-    with open("current_run.json", "w") as file:
-        json.dump(currentRun, file, indent=4)
+    with open(filename, "w") as file:
+        json.dump(snapshot, file, indent=4)
 
-def updateCollectible(table : dict, pine : Pine, cmd : str, item : str):
-    print("Bit:", table["bitOffsets"][item])
+    items = snapshot["items"]
+    print(f"Saved inventory to {filename}: {items['money']} money, {items['license']}, {len(items['collectibles'])} collectibles, "
+          f"{len(items['bodies'])} bodies, {sum(items['parts'].values())} parts")
 
-    address = int(table["address"], 16) # Addresses in data object are hex strings e.g. "0x2DC56C", need to convert to int
-    bit = table["bitOffsets"][item]
-
-    bytes = pine.read_bytes(address, table["sizeInBytes"])
-
-    # Update Inventory
-    bytes = updateBit(cmd, bytes, bit)
-    
-    print("Writing to address", hex(address))
-    pine.write_bytes(address, bytes)
-
-    #updateItemInCurrentRun(cmd, item)
-
-def updateBody(table : dict, pine : Pine, cmd : str, item : str):
-    if item != "Life Body":
-        if not item[0:6] == "Body Q":
-            print("Error: updateBody called, but item is not a body")
-            return
-        try:
-            value = int(item[6:])
-            if item != "Body Q150":
-                value -= 1 # All bodies except Q150 are at an offset of their body number minus 1
-        except:
-            print("Error: Body value provided does not appear to be a number")
-    else:
-        value = LIFE_BODY_BIT_OFFSET
-
-    if value > 150 or value < 0:
-        print("Error: Invalid body value (greater than 150 or less than 0")
+def restoreInventory(data : dict, pine : Pine, currentRun : dict, filename : str):
+    if not os.path.exists(filename):
+        print(f"Error: {filename} does not exist")
         return
-    else: # We should now have a valid body value!
-        address = int(table["address"], 16) # Addresses in data object are hex strings e.g. "0x2DC56C", need to convert to int
-        bytes = pine.read_bytes(address, table["sizeInBytes"])
-        bytes = updateBit(cmd, bytes, value)
-        print("Writing to address", hex(address))
-        pine.write_bytes(address, bytes)
-
-        #updateItemInCurrentRun(cmd, item)
-
-def setLicense(table : dict, pine : Pine, cmd : str, item : str):
-    address = int(table["address"], 16) # Addresses in data object are hex strings e.g. "0x2DC56C", need to convert to int
-    value = table["values"][item]
-    size = table["sizeInBytes"]
-
-    if cmd == CMD_REMOVE:
-        if value > 0:
-            value -= 1
-        else:
-            print("Error: Cannot remove C License")
-            return
-
-    print("Writing to address", hex(address))
-    pine.write_bytes(address, int_to_bytes(value, size))
-
-    #updateItemInCurrentRun(cmd, item)
 
-def updateMoney(table : dict, pine : Pine, cmd : str, value : str):
-    if value == None or not value.isdigit:
-        print("Error: Money amount provided is not an integer.")
+    try:
+        with open(filename, "r") as file:
+            snapshot = json.load(file)
+    except json.JSONDecodeError as ex:
+        print(f"Error: {filename} is not a valid dump file ({ex}), nothing was restored")
         return
-    else:
-        value = int(value)
-
-    if cmd == CMD_REMOVE:
-        value *= -1
-
-    address = int(table["address"], 16) # Addresses in data object are hex strings e.g. "0x2DC56C", need to convert to int
 
-    bytes = pine.read_bytes(address, 4)
-    currentMoney = bytes_to_int(bytes)
-
-    if value > 0:
-        if currentMoney + value > 999999: # Prevent exceeding maximum money amount
-            value = 999999 - currentMoney
-            print(f"Adding {value} to money (cannot exceed 999,999)")
-        else:
-            print(f"Adding {value} to money")
-    elif value < 0:
-        if currentMoney + value < 0: # Prevent reducing money below 0
-            value = -1 * currentMoney
-            print(f"Subtracting {-1 * value} from money (cannot go below 0)")
-        else:
-            print(f"Subtracting {-1 * value} from money")
-    else:
-        print("Value is 0, no change")
+    if "currentRun" in snapshot and not isinstance(snapshot["currentRun"], dict):
+        print(f"Error: The run state in {filename} is malformed, nothing was restored")
         return
 
-    bytes = int_to_bytes(currentMoney + value, 4)
-    pine.write_bytes(address, bytes)
-
-def initializeCurrentRun():
-    with open("current_run.json", "w") as file:
-        json.dump({}, file)
-
-def ensureCurrentRunFileExists():
-    if not os.path.exists("current_run.json"):
-        initializeCurrentRun()
-    else:
-        with open("current_run.json", "r") as file:
-            # A blank JSON file will cause exceptions later. Let's initialize it to an empty JSON object.
-            size = os.path.getsize("current_run.json")
-            if size == 0:
-                initializeCurrentRun()
-
-def updateItemInCurrentRun(cmd : str, itemStr : str):
-    if cmd == CMD_GET:
-        writeItemToCurrentRun(itemStr)
-    elif cmd == CMD_REMOVE:
-        removeItemFromCurrentRun(itemStr)
-    else:
-        print("Error: writeItemToCurrentRun called, but command is neither get nor remove?")
-
-def writeItemToCurrentRun(itemStr: str):
-    ensureCurrentRunFileExists()
-    with open("current_run.json", "r") as file:
-        currentRun = json.load(file)
-        currentRun[itemStr] = 1
-    with open("current_run.json", "w") as file:
-        json.dump(currentRun, file, indent=4)
-
-def removeItemFromCurrentRun(itemStr : str):
-    ensureCurrentRunFileExists()
-    with open("current_run.json", "r") as file:
-        currentRun = json.load(file)
-        for name, value in currentRun.items():
-            if name == itemStr:
-                currentRun.pop(itemStr)
-                break
-    with open("current_run.json", "w") as file:
-        json.dump(currentRun, file, indent=4)
-
-def fixPossibleItemNameIssues(item : str):
-    # Remove the " (Key)" string if included
-    item = item.replace(" (Key)", "")
-
-    # For "Normal Wheel" and "Mesh Wheel", the plural form should also be accepted
-    item = item.replace("Wheels", "Wheel")
-
-    # Correct "Hide-Out Pattern" to "Hide-out Pattern" 
-    # ('out' is lowercase in-game, but it's helpful for both to be accepted)
-    item = item.replace("Hide-Out", "Hide-out")
-
-    return item
-
-def main():
-    with open("addresses.json", "r") as file:
-        data = json.load(file)
+    # Start from the live inventory, so any region that isn't in the snapshot is left untouched. The snapshot is
+    #     checked against addresses.json before anything is written, so a bad dump never leaves a partial restore.
+    current = InventoryBitmap.fromPine(data, pine)
+    target = current.copy()
+    try:
+        loaded = target.loadSnapshot(snapshot)
+    except ValueError as ex:
+        print(f"Error: {ex}. Nothing was restored.")
+        return
+    skipped = [name for name in target.regions if name not in loaded]
+    if skipped:
+        print("Warning: These regions were not in the snapshot and will not be restored:", ", ".join(skipped))
+
+    writes = target.write(pine, current)
+    print(f"Restored inventory from {filename} ({len(writes)} changed ranges, {sum(len(write[1]) for write in writes)} bytes written)")
+
+    if "currentRun" in snapshot:
+        currentRun.clear()
+        currentRun.update(snapshot["currentRun"])
+        saveCurrentRun(currentRun)
+        print(f"Restored {CURRENT_RUN_FILE}")
+
+def syncInventory(data : dict, pine : Pine, currentRun : dict, filename : str):
+    if not os.path.exists(filename):
+        print(f"Error: {filename} does not exist")
+        return
 
-    print("--------------------------------------")
-    print("Road Trip Adventure Inventory Editor")
-    print("--------------------------------------")
-    loadingMsg = "Attempting to connect to PCSX2 via PINE.\n" \
-    "To enable PINE, go to Tools and click 'Show Advanced Settings', then go to System > Settings " \
-    "and click the now-visible 'Advanced' tab.\nScroll to the PINE section at the bottom and click 'Enable'.\n" \
-    "The port can be left at the default setting.\n"
-    print(loadingMsg)
+    receivedItems = loadReceivedItems(filename)
+
+    # One batched read of the whole inventory, then one batched write of only the bytes that differ
+    current = InventoryBitmap.fromPine(data, pine)
+    target, levels = computeTargetInventory(data, current, receivedItems)
+    writes = target.write(pine, current)
+    print(f"Synced {sum(receivedItems.values())} received items ({len(writes)} changed ranges, {sum(len(write[1]) for write in writes)} bytes written)")
+
+    for name, level in levels.items():
+        if level > 0 or name in currentRun:
+            currentRun[name] = level
+    saveCurrentRun(currentRun)
+
+def updateItem(data : dict, pine : Pine, cmd : str, item : str, value : str, currentRun : dict):
+    # get and remove go through applyItemToInventory like every other change to the inventory: one batched read, the 
+    #     change applied in memory, then one batched write of only the bytes that differ.
+    current = InventoryBitmap.fromPine(data, pine)
+    target = current.copy()
+    runState = dict(currentRun)
+    try:
+        message = applyItemToInventory(data, target, cmd, item, value, runState)
+    except ValueError as ex:
+        print(f"Error: {ex}")
+        return
 
-    pine = Pine()
+    writes = target.write(pine, current)
+    print(message)
+    if writes:
+        print("Wrote to", ", ".join(hex(address) for address, _ in writes))
+
+    # Only progressive upgrades change the run state
+    if runState != currentRun:
+        currentRun.update(runState)
+        saveCurrentRun(currentRun)
+
+def runCommand(data : dict, pine : Pine, commandLine : str, currentRun : dict):
+    words = commandLine.split(maxsplit=1)
+    with profiler.command(words[0] if words else ""), session.recordCommand(commandLine):
+        executeCommand(data, pine, commandLine, currentRun)
+
+def executeCommand(data : dict, pine : Pine, commandLine : str, currentRun : dict):
+    try:
+        with profiler.phase(profiler.PHASE_PARSE):
+            argv = shlex.split(commandLine)
+        commandParsed = True
+    except:
+        print("Error: Could not parse command.\n")
+        commandParsed = False
+
+    if commandParsed:
+        # Read arguments
+        cmd = None
+        item = None
+        value = None
+        if(len(argv) >= 1):
+            cmd = argv[0]
+        if(len(argv) >= 2):
+            item = argv[1]
+        if(len(argv) >= 3):
+            value = argv[2] # Used for money, and the quantity of parts
+
+        # Process arguments
+        if(cmd == CMD_INIT):
+            init(data, pine)
+        elif(cmd == CMD_RECONCILE):
+            reconcileCurrentRun(data, pine, currentRun)
+        elif(cmd == CMD_DUMP):
+            dumpInventory(data, pine, currentRun, item or DEFAULT_DUMP_FILE)
+        elif(cmd == CMD_RESTORE):
+            restoreInventory(data, pine, currentRun, item or DEFAULT_DUMP_FILE)
+        elif(cmd == CMD_SYNC):
+            syncInventory(data, pine, currentRun, item or DEFAULT_SYNC_FILE)
+        elif(cmd == CMD_MONITOR):
+            from monitor import runMonitor
+            runMonitor(data, pine, currentRun)
+        elif(cmd == CMD_HELP):
+            print()
+            print("Command list")
+            print("---------------------------------------------------------------")
+            print("get [name of part in quotes]       Add a part to your inventory")
+            print("get [name of part in quotes] [qty] Add several copies of a part to your inventory")
+            print("get money [amount]                 Add amount to your current money")
+            print("remove [name of part in quotes]    Remove a part from your inventory")
+            print("remove [name of part] [qty]        Remove several copies of a part from your inventory")
+            print("remove money [amount]              Subtract amount from your current money")
+            print("initAP                             If playing RTA AP manual, run after loading Q's Factory (but NOT before!)")
+            print("reconcile                          Compare current_run.json to your inventory, and offer to repair it")
+            print("dump [file]                        Save your whole inventory and current_run.json to a file")
+            print("restore [file]                     Restore your inventory and current_run.json from a dump file")
+            print("sync [file]                        Give yourself every item in a list of received items, in one step")
+            print("monitor                            Watch your inventory live, until you press Enter")
+            print()
+            print("initAP patches several functions that would interfere with the manual Archipelago randomizer:")
+            print("- Prevents shop purchases from going to your inventory (except in the My City part shop)")
+            print("- Prevents NPC rewards from being added to your inventory")
+            print("- Prevents receiving license upgrades from completing all races within a rank")
+            print("- Prevents NPCs from equipping parts to you (e.g. in the Temple Under the Sea)")
+            print("- Makes overworld items always visible, even if the player already has that item (e.g gemstones)")
+            print("- Allows access to Tin Raceway with just the Rank A license (allows Tin Raceway to be a location check)")
+            print()
+        elif(cmd == CMD_GET or cmd == CMD_REMOVE):               
+            if item:
+                updateItem(data, pine, cmd, item, value, currentRun)
+            else:
+                print("Error: No item supplied!")
+        else:
+            print("Error: First argument is not valid!")
+        
+        print()
 
+def waitForRoadTrip(pine : Pine):
     # Wait for a connection to PCSX2...
     print("Attempting to connect...")
     while pine.is_connected() == False:
@@ -507,7 +412,7 @@ def main():
     while not gameLoaded:
         try:
             gameId = pine.get_game_id()
-            if gameId == "SLUS-20398": 
+            if gameId == ROAD_TRIP_GAME_ID:
                 gameLoaded = True
         except:
             # There doesn't appear to be a function in the included pine.py script that can test
@@ -522,83 +427,73 @@ def main():
             sleep(1)
     print("Road Trip loaded!\n")
 
-    # Process user commands
-    while(True):
-        argv = input("Enter a command ('help' for options): ")
+def main():
+    parser = argparse.ArgumentParser(description="Live inventory editor for Road Trip Adventure.")
+    parser.add_argument("--daemon", action="store_true", help="Run without a command prompt, taking commands from other tools over a local JSON-RPC socket")
+    parser.add_argument("--port", type=int, default=None, help="Port to take requests from other tools (e.g. the Manual client's /link_editor) on (localhost only)")
+    parser.add_argument("--orchestrate", type=int, nargs="+", metavar="SLOT", help="Run as a daemon driving one PCSX2 instance per PINE slot given")
+    parser.add_argument("--record", metavar="FILE", help="Record every command you run, and its output, to a session log that replay.py can play back")
+    parser.add_argument("--profile", action="store_true", help="Print how long each phase of each command takes, and a summary on exit")
+    parser.add_argument("--profile-stats", metavar="FILE", help="With --profile, also run commands under cProfile and save the stats to FILE on exit")
+    args = parser.parse_args()
+
+    with open("addresses.json", "r") as file:
+        data = json.load(file)
+
+    if args.profile:
+        activeProfiler = profiler.start(args.profile_stats)
         try:
-            argv = shlex.split(argv)
-            commandParsed = True
-        except:
-            print("Error: Could not parse command.\n")
-            commandParsed = False
-
-        if commandParsed:
-            # Read arguments
-            cmd = None
-            item = None
-            value = None
-            if(len(argv) >= 1):
-                cmd = argv[0]
-            if(len(argv) >= 2):
-                item = argv[1]
-            if(len(argv) >= 3):
-                value = argv[2] # Currently only used for money
-
-            # Process arguments
-            if(cmd == CMD_INIT):
-                init(data, pine)
-            elif(cmd == CMD_HELP):
-                print()
-                print("Command list")
-                print("---------------------------------------------------------------")
-                print("get [name of part in quotes]       Add a part to your inventory")
-                print("get money [amount]                 Add amount to your current money")
-                print("remove [name of part in quotes]    Remove a part from your inventory")
-                print("remove money [amount]              Subtract amount from your current money")
-                print("initAP                             If playing RTA AP manual, run after loading Q's Factory (but NOT before!)")
-                print()
-                print("initAP patches several functions that would interfere with the manual Archipelago randomizer:")
-                print("- Prevents shop purchases from going to your inventory (except in the My City part shop)")
-                print("- Prevents NPC rewards from being added to your inventory")
-                print("- Prevents receiving license upgrades from completing all races within a rank")
-                print("- Prevents NPCs from equipping parts to you (e.g. in the Temple Under the Sea)")
-                print("- Makes overworld items always visible, even if the player already has that item (e.g gemstones)")
-                print("- Allows access to Tin Raceway with just the Rank A license (allows Tin Raceway to be a location check)")
-                print()
-            elif(cmd == CMD_GET or cmd == CMD_REMOVE):               
-                if item:
-                    # Check for a few potential problems with the item as-typed, and correct them.
-                    item = fixPossibleItemNameIssues(item)
-                    
-                    # If the item is a progressive upgrade...
-                    if (item in data["progressiveUpgrades"]["names"]):
-                        updateProgressiveUpgrade(data, pine, cmd, item)
-
-                    # Else, if it is a collectible...
-                    elif (item in data["collectibles"]["bitOffsets"]):
-                        updateCollectible(data["collectibles"], pine, cmd, item)
-
-                    # Else, if it is a body...
-                    elif (item[0:6] == "Body Q" or item == "Life Body"):
-                        updateBody(data["bodies"], pine, cmd, item)
-
-                    # Else, if it is a license...
-                    elif (item in data["licenses"]["values"]):
-                        setLicense(data["licenses"], pine, cmd, item)
-                    
-                    # Else, if it is money...
-                    elif (item.lower() == "money"):
-                        updateMoney(data["money"], pine, cmd, value)
-
-                    # Else, we check each table in Parts - and if in none, do nothing
-                    else:
-                        updatePart(data["parts"], pine, cmd, item)
-                else:
-                    print("Error: No item supplied!")
-            else:
-                print("Error: First argument is not valid!")
-            
-            print()
+            runEditor(data, args)
+        finally:
+            activeProfiler.report()
+    else:
+        runEditor(data, args)
+
+def runEditor(data : dict, args : argparse.Namespace):
+    if args.orchestrate:
+        from daemon import runOrchestrator, DEFAULT_DAEMON_PORT
+        runOrchestrator(data, args.orchestrate, args.port or DEFAULT_DAEMON_PORT)
+        return
+
+    print("--------------------------------------")
+    print("Road Trip Adventure Inventory Editor")
+    print("--------------------------------------")
+    loadingMsg = "Attempting to connect to PCSX2 via PINE.\n" \
+    "To enable PINE, go to Tools and click 'Show Advanced Settings', then go to System > Settings " \
+    "and click the now-visible 'Advanced' tab.\nScroll to the PINE section at the bottom and click 'Enable'.\n" \
+    "The port can be left at the default setting.\n"
+    print(loadingMsg)
+
+    # Listen for other tools before connecting, so that if the editor is already running this copy stops here instead
+    #    of opening a second Pine connection
+    from daemon import openServer, runDaemon, DEFAULT_DAEMON_PORT
+    rpcServer = openServer(args.port or DEFAULT_DAEMON_PORT)
+    if rpcServer is None:
+        return
+
+    pine = Pine()
+    profiler.attachPine(pine)
+    waitForRoadTrip(pine)
+
+    currentRun = loadCurrentRun()
+
+    if args.daemon:
+        runDaemon(data, pine, currentRun, rpcServer)
+        return
+
+    if args.record:
+        session.start(args.record, currentRun, InventoryBitmap.fromPine(data, pine).toSnapshot())
+        print(f"Recording this session to {args.record}\n")
+
+    # Process user commands, while watching the game in the background
+    try:
+        from repl import runRepl, PatchWatchdog
+        from checks import CheckLog, EventWatcher
+        watchers = [PatchWatchdog(), EventWatcher(CheckLog())]
+        print(f"Taking requests from other tools (e.g. the Manual client's /link_editor) on port {rpcServer.server_address[1]}\n")
+        runRepl(data, pine, currentRun, runCommand, watchers, rpcServer)
+    finally:
+        session.stop()
 
 if __name__ == "__main__":
     main()
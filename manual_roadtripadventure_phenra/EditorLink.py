@@ -0,0 +1,101 @@
+"""
+Optional link between the Manual client and the Road Trip Adventure inventory editor (main.py).
+While linked, every item the client receives is sent to the editor, which gives it to the player's inventory in PCSX2,
+instead of it being typed into the editor by hand.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import typing
+
+from CommonClient import logger
+
+if typing.TYPE_CHECKING:
+    from .ManualClient import ManualContext
+
+DEFAULT_EDITOR_PORT = 28111  # The port the editor listens on by default (its --port)
+LINK_POLL_INTERVAL = 0.5  # Items received within one interval are sent as one request
+RECONNECT_INTERVAL = 5.0
+
+
+class EditorLinkError(Exception):
+    pass
+
+
+class EditorLink:
+    """Sends newly received items to the inventory editor, over its local JSON-RPC socket.
+
+    The editor is the only thing that changes the inventory and current_run.json: it gives each batch of items in one
+    read and one write of the inventory, and saves how many items of each seed and slot it has given in
+    current_run.json, along with the rest of the run state. The link only remembers that count for the current
+    connection, so after reconnecting (to the server, or to the editor) it sends every item again and the editor skips
+    the ones it has already given."""
+
+    def __init__(self, port: int = DEFAULT_EDITOR_PORT):
+        self.port = port
+        self.reader: typing.Optional[asyncio.StreamReader] = None
+        self.writer: typing.Optional[asyncio.StreamWriter] = None
+        self.request_id = 0
+        self.given: dict[str, int] = {}
+
+    async def ensure_connected(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+            self.given.clear()
+            logger.info(f"Editor link: Connected to the inventory editor on port {self.port}")
+
+    async def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def call(self, method: str, params: dict) -> typing.Any:
+        self.request_id += 1
+        request = {"jsonrpc": "2.0", "id": self.request_id, "method": method, "params": params}
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("The inventory editor closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise EditorLinkError(response["error"].get("message", "Unknown error"))
+        return response["result"]
+
+    async def send_items(self, key: str, item_names: list[str]):
+        # Until the editor has told us how many it has given, send everything and let it skip what it already has
+        start = self.given.get(key, 0)
+        result = await self.call("receive", {"key": key, "start": start, "items": item_names[start:]})
+        self.given[key] = result["given"]
+        for message in result["messages"]:
+            logger.info(f"Editor link: {message}")
+
+    async def run(self, ctx: ManualContext):
+        logger.info(f"Editor link: Sending received items to the inventory editor on port {self.port}")
+        try:
+            while not ctx.exit_event.is_set():
+                await asyncio.sleep(LINK_POLL_INTERVAL)
+
+                # Items can only be told apart from ones already given once the client knows which slot it's playing
+                if not ctx.seed_name or not ctx.slot:
+                    continue
+                key = f"{ctx.seed_name}:{ctx.slot}"
+                if key in self.given and self.given[key] >= len(ctx.items_received):
+                    continue
+
+                try:
+                    await self.ensure_connected()
+                    await self.send_items(key, [ctx.item_names.lookup_in_game(item.item) for item in ctx.items_received])
+                except Exception as e:
+                    # Nothing is lost: the editor only counts items once they've been given, so they're sent again
+                    logger.warning(f"Editor link: {type(e).__name__}: {e}. Retrying in {RECONNECT_INTERVAL:g} seconds")
+                    logger.debug("Editor link error", exc_info=True)
+                    await self.disconnect()
+                    await asyncio.sleep(RECONNECT_INTERVAL)
+        finally:
+            await self.disconnect()
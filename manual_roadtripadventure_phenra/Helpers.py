@@ -4,7 +4,8 @@ import os
 import pkgutil
 import json
 
-from BaseClasses import MultiWorld, Item
+from array import array
+from BaseClasses import MultiWorld, Item, CollectionState
 from enum import IntEnum
 from typing import Optional, List, TYPE_CHECKING, Union, get_args, get_origin, Any
 from types import GenericAlias
@@ -172,6 +173,82 @@ def get_items_with_value(world: World, multiworld: MultiWorld, value: str, playe
         world.item_values[player][value] = item_with_values
     return world.item_values[player].get(value)
 
+def get_category_items(world: World, category_name: str) -> tuple[str, ...]:
+    """Return the names of every item in a category
+
+    The index of every category is built the first time it's needed, so this doesn't scan every item each time"""
+    if not hasattr(world, 'category_items'):
+        category_items = {}
+        for item in world.item_name_to_item.values():
+            for category in item.get("category", []):
+                category_items.setdefault(category, []).append(item["name"])
+        world.category_items = {category: tuple(items) for category, items in category_items.items()}
+    return world.category_items.get(category_name, ())
+
+def get_category_item_count(world: World, category_name: str, player: Optional[int] = None) -> int:
+    """Return how many of a category's items are in the player's pool (their "real" progression item counts),
+    which is what 'all', 'half' and percentage counts of |@Category:count| requires are based on.
+
+    The total of every category is computed once per player"""
+    if player is None:
+        player = world.player
+
+    items_counts = world.get_item_counts(player, only_progression=True)
+    # Just a small check to prevent caching totals of 0 if the item pool doesn't exist yet
+    if not items_counts:
+        return 0
+
+    if not hasattr(world, 'category_item_counts'):
+        world.category_item_counts = {}
+
+    if player not in world.category_item_counts:
+        get_category_items(world, category_name)
+        world.category_item_counts[player] = {category: sum(items_counts.get(item, 0) for item in items)
+                                              for category, items in world.category_items.items()}
+    return world.category_item_counts[player].get(category_name, 0)
+
+def get_rules_affected_by_item(world: World, item_name: str) -> set[str]:
+    """Return the names of the entrances and locations whose access rule can change when the item is collected or removed,
+    e.g. to only check those again after a collect/remove, instead of every rule of the world.
+
+    That's every entrance/location whose requires mention the item or one of its categories, plus every one whose requires
+    call a function, since those could check anything. Only available once the world's rules are set"""
+    return world.rule_dependents.get(item_name, set()) | world.rule_unknown_dependents
+
+def get_item_count_indexes(world: World) -> dict[str, int]:
+    """Return the index of every item (and of __Victory__) in the item counts arrays of get_state_item_counts"""
+    if not hasattr(world, 'item_count_indexes'):
+        world.item_count_indexes = {name: index for index, name in enumerate([*world.item_name_to_item, "__Victory__"])}
+    return world.item_count_indexes
+
+def get_state_item_counts(world: World, state: CollectionState) -> array:
+    """Return how many of each progression item the world's player has in the state, as an array indexed by
+    get_item_count_indexes, which rules read instead of looking the items up by name
+
+    The array is kept up to date by the world's collect and remove. A state that doesn't have one yet (e.g. one made before
+    the world was loaded) gets one built from its prog_items"""
+    try:
+        return state.manual_item_counts[world.player]
+    except (AttributeError, KeyError):
+        pass
+
+    indexes = get_item_count_indexes(world)
+    counts = array('H', [0]) * len(indexes)
+    for item_name, count in state.prog_items[world.player].items():
+        if item_name in indexes and count > 0:
+            counts[indexes[item_name]] = count
+    if not hasattr(state, 'manual_item_counts'):
+        state.manual_item_counts = {}
+    state.manual_item_counts[world.player] = counts
+    return counts
+
+def change_state_item_count(world: World, state: CollectionState, item_name: str, change: int):
+    """Add change to the count of an item in the state's item counts array, if it has one already"""
+    counts = getattr(state, 'manual_item_counts', {}).get(world.player)
+    index = get_item_count_indexes(world).get(item_name)
+    if counts is not None and index is not None:
+        counts[index] += change
+
 
 def filter_used_regions(player_regions: dict|list) -> set:
     """Return a set of regions that are actually used in Generation. It includes region that have no locations but are required by other regions\n
@@ -41,6 +41,66 @@ class ManualClientCommandProcessor(ClientCommandProcessor):
         self.ctx.syncing = True
         return True
 
+    @mark_raw
+    def _cmd_export_items(self, filename: str = "received_items.json") -> bool:
+        """Export the names and counts of every received item to a JSON file, for the inventory editor's sync command"""
+        received = {}
+        for network_item in self.ctx.items_received:
+            item_name = self.ctx.item_names.lookup_in_game(network_item.item)
+            received[item_name] = received.get(item_name, 0) + 1
+
+        with open(filename, "w") as f:
+            json.dump(received, f, indent=4)
+        self.output(f"Exported {len(self.ctx.items_received)} received items to {os.path.abspath(filename)}")
+        return True
+
+    @mark_raw
+    def _cmd_import_checks(self, filename: str = "location_checks.json") -> bool:
+        """Send every location check the inventory editor has detected in-game, from its JSON list of location names"""
+        try:
+            with open(filename, "r") as f:
+                location_names = json.load(f)
+        except (OSError, ValueError) as e:
+            self.output(f"Could not read {filename}: {e}")
+            return False
+
+        sent = 0
+        for location_name in location_names:
+            # Locations can be renamed by options (e.g. "Stamp 12 / Double-Up Stamp"), so also match on the first name
+            location_id = self.ctx.location_names_to_id.get(location_name)
+            if location_id is None:
+                location_id = next((id for name, id in self.ctx.location_names_to_id.items() if name.startswith(location_name + " / ")), None)
+            if location_id is not None and location_id in self.ctx.missing_locations and location_id not in self.ctx.locations_checked:
+                self.ctx.locations_checked.append(location_id)
+                sent += 1
+        self.ctx.syncing = True
+        self.output(f"Sending {sent} new location checks from {os.path.abspath(filename)}")
+        return True
+
+    def _cmd_link_editor(self, port: str = "") -> bool:
+        """Give every received item to your inventory in PCSX2 automatically, through the inventory editor (on an optional port). Only one editor can be connected to PCSX2 at a time, so link the one you already have open instead of starting another"""
+        from .EditorLink import EditorLink, DEFAULT_EDITOR_PORT
+
+        if port and not port.isdigit():
+            self.output("Give the port the inventory editor is listening on (its --port), e.g. /link_editor 28111")
+            return False
+
+        link = EditorLink(int(port) if port else DEFAULT_EDITOR_PORT)
+        if self.ctx.editor_link_task:
+            self.ctx.editor_link_task.cancel()
+        self.ctx.editor_link_task = asyncio.create_task(link.run(self.ctx), name="EditorLink")
+        return True
+
+    def _cmd_unlink_editor(self) -> bool:
+        """Stop giving received items to your inventory in PCSX2"""
+        if not self.ctx.editor_link_task:
+            self.output("The inventory editor is not linked")
+            return False
+        self.ctx.editor_link_task.cancel()
+        self.ctx.editor_link_task = None
+        self.output("Unlinked the inventory editor")
+        return True
+
     @mark_raw
     def _cmd_send(self, location_name: str) -> bool:
         """Send a check"""
@@ -104,6 +164,7 @@ class ManualContext(SuperContext):
 
         self.send_index: int = 0
         self.syncing = False
+        self.editor_link_task: Optional[asyncio.Task] = None
         self.game = game
         self.username = player_name
 
@@ -920,6 +981,8 @@ async def main(args):
     ctx.server_address = None
 
     await progression_watcher
+    if ctx.editor_link_task:
+        ctx.editor_link_task.cancel()
 
     await ctx.shutdown()
 
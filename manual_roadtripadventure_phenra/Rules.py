@@ -1,11 +1,12 @@
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional
 from enum import IntEnum
-from operator import eq, ge, le
+from operator import eq, ge, le, itemgetter
 
 from .Regions import regionMap
 from .hooks import Rules
 from .Helpers import clamp, is_item_enabled, is_option_enabled, get_option_value, convert_string_to_type,\
-    format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat
+    format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat, get_category_items, get_category_item_count, \
+    get_item_count_indexes, get_state_item_counts
 
 from BaseClasses import MultiWorld, CollectionState
 from worlds.AutoWorld import World
@@ -14,6 +15,7 @@ from Options import Choice, Toggle, Range, NamedRange
 
 import re
 import math
+from array import array
 import inspect
 import logging
 
@@ -45,303 +47,514 @@ def construct_logic_error(location_or_region: dict, source: LogicErrorSource) ->
 
     return KeyError(f"Invalid 'requires' for {object_type} '{object_name}': {source_text} (ERROR {source})")
 
-def infix_to_postfix(expr, location):
-    prec = {"&": 2, "|": 2, "!": 3}
-    stack = []
-    postfix = ""
-
-    try:
-        for c in expr:
-            if c.isnumeric():
-                postfix += c
-            elif c in prec:
-                while stack and stack[-1] != "(" and prec[c] <= prec[stack[-1]]:
-                    postfix += stack.pop()
-                stack.append(c)
-            elif c == "(":
-                stack.append(c)
-            elif c == ")":
-                while stack and stack[-1] != "(":
-                    postfix += stack.pop()
-                stack.pop()
-
-        while stack:
-            postfix += stack.pop()
-    except Exception:
-        raise construct_logic_error(location, LogicErrorSource.INFIX_TO_POSTFIX)
-
-    return postfix
-
-
-def evaluate_postfix(expr: str, location: str) -> bool:
-    stack = []
-
+# Tokens of a requires string: {function(args)}, |item| or |@category|, AND, OR, parentheses, ! and the constants 0/1.
+# Anything else (e.g. stray spaces) is skipped.
+REQUIRES_TOKEN_REGEX = re.compile(r'\{(\w+)\((.*?)\)\}|(\|[^|]+\|)|\b(AND|OR)\b|([()!01])', re.IGNORECASE)
+
+# Requirement functions that only depend on the options, even though they ask for a CollectionState. Like functions
+# that don't ask for one, they're called once per player when rules are compiled, and their result is folded into the
+# rule. Add the names of your own functions from hooks/Rules.py here if the same is true of them.
+STATIC_REQUIREMENT_FUNCTIONS = {"YamlCompare"}
+
+def always_accessible(state: CollectionState) -> bool:
+    return True
+
+def resolve_item_count(item_name: str, item_count: str, total: int, area: dict) -> int:
+    """Turns the count of an |item:count| or |@category:count| requirement into a number. 'all', 'half' and
+    percentages are relative to total, the number of the item (or of the category's items) in the pool."""
+    if item_count.lower() == 'all':
+        return total
+    elif item_count.lower() == 'half':
+        return int(total / 2)
+    elif item_count.endswith('%') and len(item_count) > 1:
+        percent = clamp(float(item_count[:-1]) / 100, 0, 1)
+        return math.ceil(total * percent)
     try:
-        for c in expr:
-            if c == "0":
-                stack.append(False)
-            elif c == "1":
-                stack.append(True)
-            elif c == "&":
-                op2 = stack.pop()
-                op1 = stack.pop()
-                stack.append(op1 and op2)
-            elif c == "|":
-                op2 = stack.pop()
-                op1 = stack.pop()
-                stack.append(op1 or op2)
-            elif c == "!":
-                op = stack.pop()
-                stack.append(not op)
-    except Exception:
-        raise construct_logic_error(location, LogicErrorSource.EVALUATE_POSTFIX)
-
-    if len(stack) != 1:
-        raise construct_logic_error(location, LogicErrorSource.EVALUATE_STACK_SIZE)
-
-    return stack.pop()
-
-def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
-    # this is only called when the area (think, location or region) has a "requires" field that is a string
-    def checkRequireStringForArea(state: CollectionState, area: dict):
-        requires_list = area["requires"]
-
+        return int(item_count)
+    except ValueError as e:
+        raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
+
+class MemoizedRule:
+    """A rule whose result only depends on the counts of a few items, which remembers its result for each
+    combination of counts it has seen. At most max_size results are kept; the oldest is forgotten first.\n
+    Every call can change the cache, without a lock, so it mustn't be called from several threads at once.\n
+    rule is called with the state and the state's item counts array (see get_state_item_counts), and indexes are
+    the positions of the items it checks in that array."""
+
+    def __init__(self, rule: Callable[[CollectionState, array], bool], indexes: list[int], world: "ManualWorld", max_size: int):
+        self.rule = rule
+        self.key = itemgetter(*indexes)
+        self.world = world
+        self.max_size = max_size
+        self.cache: dict[Any, bool] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state: CollectionState) -> bool:
+        counts = get_state_item_counts(self.world, state)
+        key = self.key(counts)
+        result = self.cache.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = self.rule(state, counts)
+        if len(self.cache) >= self.max_size:
+            del self.cache[next(iter(self.cache))]
+        self.cache[key] = result
+        return result
+
+class CompiledRule:
+    """The rule of one player's location, region or entrance, which knows what it's the rule of (name, and type:
+    "location", "region" or "entrance").\n
+    Its name, type and player can't be changed once it's made, and every player's rules are separate objects, even when
+    several players play this game, so no rule writes to another player's. Evaluating it isn't read-only though: a
+    MemoizedRule updates its cache and counters, and a function that returns a requires string has it compiled into
+    the compiler's caches on first use. So, like the rest of generation, a world's rules must only be evaluated from
+    one thread at a time."""
+    __slots__ = ("name", "type", "player", "rule")
+
+    def __init__(self, name: str, type: str, player: int, rule: Callable[[CollectionState], bool]):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "type", type)
+        object.__setattr__(self, "player", player)
+        object.__setattr__(self, "rule", rule)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"The rule of {self.type} \"{self.name}\" can't be changed")
+
+    def __call__(self, state: CollectionState) -> bool:
+        return self.rule(state)
+
+    def __repr__(self) -> str:
+        return f"<CompiledRule of {self.type} \"{self.name}\" for player {self.player}>"
+
+class RequiresCompiler:
+    """Turns the requires of locations, regions and entrances into rule functions for one player.\n
+    Each requires string is parsed once, into a tree of item checks, category checks and function calls joined by
+    AND/OR/!, and the tree becomes nested closures. Evaluating a rule is then a few lookups in the state's item counts
+    array (see get_state_item_counts), with AND/OR short-circuiting, instead of parsing the requires again on every
+    access check.\n
+    Anything that doesn't depend on the state (see STATIC_REQUIREMENT_FUNCTIONS) is evaluated while compiling, so
+    e.g. {YamlEnabled(...)} costs nothing during fill, and a requires that's always met compiles to always_accessible.\n
+    AND and OR have the same precedence and are evaluated left to right, like they always have been."""
+
+    def __init__(self, world: "ManualWorld", multiworld: MultiWorld, player: int):
+        self.world = world
+        self.multiworld = multiworld
+        self.player = player
         # Get the "real" item counts of item in the pool/placed/starting_items
-        items_counts = world.get_item_counts(player, only_progression=True)
-
-        # Preparing some variables for exception messages
-        area_type = "region" if area.get("is_region",False) else "location"
-        area_name = area.get("name", f"unknown with these parameters: {area}")
-
-        if requires_list == "":
-            return True
-
-        def findAndRecursivelyExecuteFunctions(requires_list: str, recursionDepth: int = 0) -> str:
-            found_functions = re.findall(r'\{(\w+)\((.*?)\)\}', requires_list)
-            if found_functions:
-                if recursionDepth > world.rules_functions_maximum_recursion:
-                    raise RecursionError(f'One or more functions in {area_type} "{area_name}"\'s requires looped too many time (maximum recursion is {world.rules_functions_maximum_recursion}) \
-                                         \n    As of this Exception the following function(s) are waiting to run: {[f[0] for f in found_functions]} \
-                                         \n    And the currently processed requires look like this: "{requires_list}"')
+        self.items_counts = world.get_item_counts(player, only_progression=True)
+        self.item_indexes = get_item_count_indexes(world)
+        # Rules for the requires strings that functions return, compiled the first time each one is returned
+        self.returned_rules: dict[str, Callable[[CollectionState], bool]] = {}
+        # Results of the static function calls, by function name and arguments
+        self.static_results: dict[tuple[str, str], Any] = {}
+        self.memoized_rules: list[MemoizedRule] = []
+        # What each compiled rule mentions (see mentions), None for rules that call functions
+        self.rule_mentions: dict[Callable[[CollectionState], bool], Optional[set[str]]] = {}
+        # Names of the entrances and locations whose rules mention each item/@category, and of the ones whose rules
+        #     call functions, which could depend on any item
+        self.dependents: dict[str, set[str]] = {}
+        self.unknown_dependents: set[str] = set()
+
+    def compile(self, area: dict, area_type: str) -> Callable[[CollectionState], bool]:
+        """Returns the rule of a location/region/entrance (area_type) from its requires, as a CompiledRule, or
+        always_accessible if it doesn't need one."""
+        # don't require the "requires" key for locations and regions if they don't need to use it
+        requires = area.get("requires") if area else None
+        if not requires:
+            return always_accessible
+
+        if isinstance(requires, str):
+            rule = self.compile_string(requires, area)
+        else:  # item access is in dict/list form
+            rule = self.compile_list(requires)
+        if rule is always_accessible:
+            return rule
+
+        compiled_rule = CompiledRule(area.get("name", ""), area_type, self.player, rule)
+        self.rule_mentions[compiled_rule] = self.rule_mentions.get(rule)
+        return compiled_rule
+
+    def compile_string(self, requires: str, area: dict, recursion_depth: int = 0) -> Callable[[CollectionState], bool]:
+        if requires.strip() == "":
+            return always_accessible
+        tree = self.fold(self.parse(requires, area), area, recursion_depth)
+        if tree == ("const", True):
+            return always_accessible
+        return self.state_rule(self.emit(tree, area, recursion_depth), self.mentions(tree))
+
+    def mentions(self, node: tuple) -> Optional[set[str]]:
+        """The names of the items a (folded) tree checks the count of, and of its categories as "@Category", or None
+        if it calls a function, which could check anything."""
+        kind = node[0]
+        if kind == "item":
+            return {node[1]}
+        elif kind == "category":
+            return {f"@{node[1]}", *node[2]}
+        elif kind == "call":
+            return None
+        elif kind == "not":
+            return self.mentions(node[1])
+        elif kind in ("and", "or"):
+            mentions = set()
+            for child in node[1]:
+                child_mentions = self.mentions(child)
+                if child_mentions is None:
+                    return None
+                mentions |= child_mentions
+            return mentions
+        return set()
+
+    def state_rule(self, rule: Callable[[CollectionState, array], bool], mentions: Optional[set[str]]) -> Callable[[CollectionState], bool]:
+        """Turns an emitted rule, which takes the state and its item counts array, into a rule of the state only.
+        It's memoized if it only checks items that have a place in the array."""
+        world = self.world
+        indexes = None
+        if mentions is not None:
+            items = sorted(name for name in mentions if not name.startswith("@"))
+            if all(item_name in self.item_indexes for item_name in items):
+                indexes = [self.item_indexes[item_name] for item_name in items]
+
+        if indexes and world.rules_cache_size > 0:
+            state_rule = MemoizedRule(rule, indexes, world, world.rules_cache_size)
+            self.memoized_rules.append(state_rule)
+        else:
+            def state_rule(state: CollectionState) -> bool:
+                return rule(state, get_state_item_counts(world, state))
+        # Also remembers what the rule mentions, for the dependency index
+        self.rule_mentions[state_rule] = mentions
+        return state_rule
+
+    def add_dependent(self, name: str, rule: Callable[[CollectionState], bool]):
+        """Indexes an entrance or location under every item and category its rule mentions, or under
+        unknown_dependents if the rule calls a function."""
+        if rule is always_accessible:
+            return
+        mentions = self.rule_mentions.get(rule)
+        if mentions is None:
+            self.unknown_dependents.add(name)
+            return
+        for mention in mentions:
+            self.dependents.setdefault(mention, set()).add(name)
+
+    def cache_stats(self) -> dict[str, int | float]:
+        """How well the remembered rule results worked, for tuning the world's rules_cache_size."""
+        hits = sum(rule.hits for rule in self.memoized_rules)
+        misses = sum(rule.misses for rule in self.memoized_rules)
+        return {
+            "rules": len(self.memoized_rules),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "cached_results": sum(len(rule.cache) for rule in self.memoized_rules),
+            "full_caches": sum(1 for rule in self.memoized_rules if len(rule.cache) >= rule.max_size)
+        }
+
+    def parse(self, requires: str, area: dict) -> tuple:
+        """Parses a requires string into a tree of ("const", value), ("item", name, count),
+        ("category", name, item names, count), ("function", name, args), ("not", node), and ("and"/"or", [nodes])."""
+        tokens = []
+        for func_name, func_args, requirement, operator, symbol in REQUIRES_TOKEN_REGEX.findall(requires):
+            if func_name:
+                tokens.append(("function", func_name, func_args))
+            elif requirement:
+                tokens.append(self.parse_requirement(requirement, area))
+            elif operator:
+                tokens.append(operator.lower())
+            elif symbol in ("0", "1"):
+                tokens.append(("const", symbol == "1"))
+            else:
+                tokens.append(symbol)
+
+        position = 0
+
+        def parse_operand() -> tuple:
+            nonlocal position
+            if position >= len(tokens):
+                raise construct_logic_error(area, LogicErrorSource.EVALUATE_POSTFIX)
+            token = tokens[position]
+            position += 1
+            if token == "!":
+                return ("not", parse_operand())
+            elif token == "(":
+                node = parse_expression()
+                # A missing closing parenthesis at the end of the requires is tolerated
+                if position < len(tokens):
+                    if tokens[position] != ")":
+                        raise construct_logic_error(area, LogicErrorSource.EVALUATE_STACK_SIZE)
+                    position += 1
+                return node
+            elif token == ")":
+                raise construct_logic_error(area, LogicErrorSource.INFIX_TO_POSTFIX)
+            elif isinstance(token, tuple):
+                return token
+            else:  # AND/OR without a value before it
+                raise construct_logic_error(area, LogicErrorSource.EVALUATE_POSTFIX)
+
+        def parse_expression() -> tuple:
+            nonlocal position
+            node = parse_operand()
+            while position < len(tokens) and tokens[position] in ("and", "or"):
+                operator = tokens[position]
+                position += 1
+                operand = parse_operand()
+                if node[0] == operator:
+                    node[1].append(operand)
                 else:
-                    for item in found_functions:
-                        func_name = item[0]
-                        func_args = item[1].split(",")
-                        if func_args == ['']:
-                            func_args.pop()
-
-                        func = globals().get(func_name)
-
-                        if func is None:
-                            func = getattr(Rules, func_name, None)
-
-                        if not callable(func):
-                            raise ValueError(f'Invalid function "{func_name}" in {area_type} "{area_name}".')
-
-                        convert_req_function_args(state, func, func_args, area_name)
-                        try:
-                            result = func(*func_args)
-                        except Exception as ex:
-                            raise RuntimeError(f'A call to the function "{func_name}" in {area_type} "{area_name}"\'s requires raised an Exception. \
-                                                \nUnless it was called by another function, it should look something like "{{{func_name}({item[1]})}}" in {area_type}s.json. \
-                                                \nFull error message: \
-                                                \n\n{type(ex).__name__}: {ex}')
-                        if isinstance(result, bool):
-                            requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", "1" if result else "0")
-                        else:
-                            requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", str(result))
-
-                requires_list = findAndRecursivelyExecuteFunctions(requires_list, recursionDepth + 1)
-            return requires_list
-
-        requires_list = findAndRecursivelyExecuteFunctions(requires_list)
-
-        # parse user written statement into list of each item
-        for item in re.findall(r'\|[^|]+\|', requires_list):
-            require_type = 'item'
-
-            if '|@' in item:
-                require_type = 'category'
-
-            item_base = item
-            item = item.lstrip('|@$').rstrip('|')
-
-            item_parts = item.split(":")  # type: list[str]
-            item_name = item
-            item_count = "1"
-
-
-            if len(item_parts) > 1:
-                item_name = item_parts[0].strip()
-                item_count = item_parts[1].strip()
-
-            total = 0
-
-            if require_type == 'category':
-                category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
-                category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
-                if item_count.lower() == 'all':
-                    item_count = category_items_counts
-                elif item_count.lower() == 'half':
-                    item_count = int(category_items_counts / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(category_items_counts * percent)
+                    node = (operator, [node, operand])
+            return node
+
+        tree = parse_expression()
+        if position < len(tokens):
+            if tokens[position] == ")":
+                raise construct_logic_error(area, LogicErrorSource.INFIX_TO_POSTFIX)
+            raise construct_logic_error(area, LogicErrorSource.EVALUATE_STACK_SIZE)
+        return tree
+
+    def parse_requirement(self, requirement: str, area: dict) -> tuple:
+        # |item|, |item:count|, |@category| or |@category:count|, where count can also be all, half or a percentage
+        is_category = '|@' in requirement
+        requirement = requirement.lstrip('|@$').rstrip('|')
+
+        item_parts = requirement.split(":")  # type: list[str]
+        item_name = requirement
+        item_count = "1"
+
+        if len(item_parts) > 1:
+            item_name = item_parts[0].strip()
+            item_count = item_parts[1].strip()
+
+        if is_category:
+            total = get_category_item_count(self.world, item_name, self.player)
+            return ("category", item_name, get_category_items(self.world, item_name), resolve_item_count(item_name, item_count, total, area))
+        else:
+            return ("item", item_name, resolve_item_count(item_name, item_count, self.items_counts.get(item_name, 0), area))
+
+    def fold(self, node: tuple, area: dict, recursion_depth: int) -> tuple:
+        """Evaluates every part of a tree that doesn't depend on the state: calls of static functions, requirements of
+        0 items, and the AND/OR/! of constants. The calls of other functions become ("call", bound function)."""
+        kind = node[0]
+
+        if kind == "function":
+            _, func_name, func_args = node
+            call_function, is_static = self.bind_function(func_name, func_args, area)
+            if not is_static:
+                return ("call", call_function)
+
+            if (func_name, func_args) not in self.static_results:
+                self.static_results[(func_name, func_args)] = call_function(None)
+            result = self.static_results[(func_name, func_args)]
+            if isinstance(result, bool):
+                return ("const", result)
+            self.check_recursion(str(result), area, recursion_depth + 1)
+            return self.fold(self.parse(str(result), area), area, recursion_depth + 1)
+
+        elif kind == "item":
+            return ("const", True) if node[2] <= 0 else node
+
+        elif kind == "category":
+            if not node[2]:
+                return ("const", False)
+            return ("const", True) if node[3] <= 0 else node
+
+        elif kind == "not":
+            child = self.fold(node[1], area, recursion_depth)
+            return ("const", not child[1]) if child[0] == "const" else ("not", child)
+
+        elif kind in ("and", "or"):
+            # A constant that decides the result (False for AND, True for OR) replaces the whole group, and the other
+            #     constant can be dropped
+            deciding = kind == "or"
+            children = []
+            for child in node[1]:
+                child = self.fold(child, area, recursion_depth)
+                if child[0] == "const":
+                    if child[1] == deciding:
+                        return child
+                elif child[0] == kind:
+                    children.extend(child[1])
                 else:
-                    try:
-                        item_count = int(item_count)
-                    except ValueError as e:
-                        raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
-
-                for category_item in category_items:
-                    total += state.count(category_item["name"], player)
-
+                    children.append(child)
+            if not children:
+                return ("const", not deciding)
+            return children[0] if len(children) == 1 else (kind, children)
+
+        return node
+
+    def emit(self, node: tuple, area: dict, recursion_depth: int) -> Callable[[CollectionState, array], bool]:
+        player = self.player
+        kind = node[0]
+
+        if kind == "const":
+            value = node[1]
+            return lambda state, counts: value
+
+        elif kind == "item":
+            _, item_name, item_count = node
+            index = self.item_indexes.get(item_name)
+            if index is None:  # Not an item of the world (e.g. an event item added by a hook), so it's not in the array
+                return lambda state, counts: state.has(item_name, player, item_count)
+            return lambda state, counts: counts[index] >= item_count
+
+        elif kind == "category":
+            _, _, category_items, item_count = node
+            category_indexes = [self.item_indexes[category_item] for category_item in category_items]
+
+            def category_rule(state: CollectionState, counts: array) -> bool:
+                total = 0
+                for index in category_indexes:
+                    total += counts[index]
                     if total >= item_count:
-                        requires_list = requires_list.replace(item_base, "1")
-            elif require_type == 'item':
-                item_current_count = items_counts.get(item_name, 0)
-                if item_count.lower() == 'all':
-                    item_count = item_current_count
-                elif item_count.lower() == 'half':
-                    item_count = int(item_current_count / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(item_current_count * percent)
-                else:
-                    item_count = int(item_count)
-
-                total = state.count(item_name, player)
+                        return True
+                return False
 
-                if total >= item_count:
-                    requires_list = requires_list.replace(item_base, "1")
+            return category_rule
 
-            if total <= item_count:
-                requires_list = requires_list.replace(item_base, "0")
+        elif kind == "not":
+            rule = self.emit(node[1], area, recursion_depth)
+            return lambda state, counts: not rule(state, counts)
 
-        requires_list = re.sub(r'\s?\bAND\b\s?', '&', requires_list, 0, re.IGNORECASE)
-        requires_list = re.sub(r'\s?\bOR\b\s?', '|', requires_list, 0, re.IGNORECASE)
+        elif kind == "and":
+            rules = [self.emit(child, area, recursion_depth) for child in node[1]]
 
-        requires_string = infix_to_postfix("".join(requires_list), area)
-        return (evaluate_postfix(requires_string, area))
-
-    # this is only called when the area (think, location or region) has a "requires" field that is a dict
-    def checkRequireDictForArea(state: CollectionState, area: dict):
-        canAccess = True
+            def and_rule(state: CollectionState, counts: array) -> bool:
+                for rule in rules:
+                    if not rule(state, counts):
+                        return False
+                return True
 
-        for item in area["requires"]:
-            # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
+            return and_rule
+
+        elif kind == "or":
+            rules = [self.emit(child, area, recursion_depth) for child in node[1]]
+
+            def or_rule(state: CollectionState, counts: array) -> bool:
+                for rule in rules:
+                    if rule(state, counts):
+                        return True
+                return False
+
+            return or_rule
+
+        else:  # call of a function that depends on the state
+            _, call_function = node
+
+            def function_rule(state: CollectionState, counts: array) -> bool:
+                result = call_function(state)
+                if isinstance(result, bool):
+                    return result
+                # Anything else is a requires string of its own, e.g. "|Figher Level:15| or |Black Belt Level:15|"
+                return self.compile_returned(str(result), area, recursion_depth + 1)(state)
+
+            return function_rule
+
+    def check_recursion(self, requires: str, area: dict, recursion_depth: int):
+        if recursion_depth > self.world.rules_functions_maximum_recursion:
+            area_type = "region" if area.get("is_region", False) else "location"
+            area_name = area.get("name", f"unknown with these parameters: {area}")
+            raise RecursionError(f'One or more functions in {area_type} "{area_name}"\'s requires looped too many time (maximum recursion is {self.world.rules_functions_maximum_recursion}) \
+                                 \n    And the last requires returned by a function look like this: "{requires}"')
+
+    def compile_returned(self, requires: str, area: dict, recursion_depth: int) -> Callable[[CollectionState], bool]:
+        self.check_recursion(requires, area, recursion_depth)
+        rule = self.returned_rules.get(requires)
+        if rule is None:
+            rule = self.returned_rules[requires] = self.compile_string(requires, area, recursion_depth)
+        return rule
+
+    def find_function(self, func_name: str, area: dict) -> Callable:
+        func = globals().get(func_name)
+
+        if func is None:
+            func = getattr(Rules, func_name, None)
+
+        if not callable(func):
+            area_type = "region" if area.get("is_region", False) else "location"
+            raise ValueError(f'Invalid function "{func_name}" in {area_type} "{area.get("name", area)}".')
+        return func
+
+    def bind_function(self, func_name: str, func_args: str, area: dict) -> tuple[Callable[[CollectionState], Any], bool]:
+        """Binds a {function(args)} call once: the function is looked up, its arguments are converted to the types
+        it asks for, and the world, multiworld and player are filled in. Calling the result only adds the state.\n
+        Also returns whether the call is static, i.e. its result can't depend on the state."""
+        func = self.find_function(func_name, area)
+        area_type = "region" if area.get("is_region", False) else "location"
+        area_name = area.get("name", f"unknown with these parameters: {area}")
+        args = func_args.split(",")
+        if args == ['']:
+            args.pop()
+
+        state_positions = self.bind_function_args(func, args, area_name)
+
+        def call(state: CollectionState):
+            call_args = args
+            if state_positions:
+                call_args = list(args)
+                for position in state_positions:
+                    call_args[position] = state
+            try:
+                return func(*call_args)
+            except Exception as ex:
+                raise RuntimeError(f'A call to the function "{func_name}" in {area_type} "{area_name}"\'s requires raised an Exception. \
+                                    \nUnless it was called by another function, it should look something like "{{{func_name}({func_args})}}" in {area_type}s.json. \
+                                    \nFull error message: \
+                                    \n\n{type(ex).__name__}: {ex}')
+
+        return call, not state_positions or func_name in STATIC_REQUIREMENT_FUNCTIONS
+
+    def compile_list(self, requires: list) -> Callable[[CollectionState], bool]:
+        # Each entry is either an item that's required, or an "or" group: if every item of any one group is
+        #     owned, the area is accessible no matter what else is missing
+        player = self.player
+        checks = []  # (is an "or" group, [(index in the counts array or None, item name, count)])
+        for item in requires:
             if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
-                canAccessOr = True
-                or_items = item
-
-                if isinstance(item, dict):
-                    or_items = item["or"]
-
-                for or_item in or_items:
-                    or_item_parts = or_item.split(":")
-                    or_item_name = or_item
-                    or_item_count = 1
-
-                    if len(or_item_parts) > 1:
-                        or_item_name = or_item_parts[0]
-                        or_item_count = int(or_item_parts[1])
-
-                    if not state.has(or_item_name, player, or_item_count):
-                        canAccessOr = False
-
-                if canAccessOr:
-                    canAccess = True
-                    break
+                or_items = item["or"] if isinstance(item, dict) else item
+                checks.append((True, [self.index_list_item(or_item) for or_item in or_items]))
             else:
-                item_parts = item.split(":")
-                item_name = item
-                item_count = 1
-
-                if len(item_parts) > 1:
-                    item_name = item_parts[0]
-                    item_count = int(item_parts[1])
-
-                if not state.has(item_name, player, item_count):
+                checks.append((False, [self.index_list_item(item)]))
+
+        if not checks:
+            return always_accessible
+        mentions = {item_name for _, group in checks for _, item_name, _ in group}
+
+        def has(state: CollectionState, counts: array, index: Optional[int], item_name: str, item_count: int) -> bool:
+            # Items that aren't in the array (e.g. event items added by a hook) are counted by the state instead
+            if index is None:
+                return state.has(item_name, player, item_count)
+            return counts[index] >= item_count
+
+        def list_rule(state: CollectionState, counts: array) -> bool:
+            canAccess = True
+            for is_or_group, items in checks:
+                if is_or_group:
+                    if all(has(state, counts, *item) for item in items):
+                        return True
+                elif not has(state, counts, *items[0]):
                     canAccess = False
-
-        return canAccess
-
-    # handle any type of checking needed, then ferry the check off to a dedicated method for that check
-    def fullLocationOrRegionCheck(state: CollectionState, area: dict):
-        # if it's not a usable object of some sort, default to true
-        if not area:
-            return True
-
-        # don't require the "requires" key for locations and regions if they don't need to use it
-        if "requires" not in area.keys():
-            return True
-
-        if isinstance(area["requires"], str):
-            return checkRequireStringForArea(state, area)
-        else:  # item access is in dict form
-            return checkRequireDictForArea(state, area)
-
-    used_location_names = []
-    # Region access rules
-    for region in regionMap.keys():
-        used_location_names.extend([l.name for l in multiworld.get_region(region, player).locations])
-        if region != "Menu":
-            for exitRegion in multiworld.get_region(region, player).entrances:
-                def fullRegionCheck(state: CollectionState, region=regionMap[region], region_name=exitRegion.name):
-                    region['name'] = region_name
-                    region['is_region'] = True
-
-                    return fullLocationOrRegionCheck(state, region)
-
-                add_rule(world.get_entrance(exitRegion.name), fullRegionCheck)
-            entrance_rules = regionMap[region].get("entrance_requires", {})
-            for e in entrance_rules:
-                entrance = world.get_entrance(f'{e}To{region}')
-                add_rule(entrance, lambda state, rule={"requires": entrance_rules[e]}: fullLocationOrRegionCheck(state, rule))
-            exit_rules = regionMap[region].get("exit_requires", {})
-            for e in exit_rules:
-                exit = world.get_entrance(f'{region}To{e}')
-                add_rule(exit, lambda state, rule={"requires": exit_rules[e]}: fullLocationOrRegionCheck(state, rule))
-
-    # Location access rules
-    for location in world.location_table:
-        if location["name"] not in used_location_names:
-            continue
-
-        locFromWorld = multiworld.get_location(location["name"], player)
-
-        locationRegion = regionMap[location["region"]] if "region" in location else None
-
-        if locationRegion:
-            locationRegion['name'] = location['region']
-            locationRegion['is_region'] = True
-
-        if "requires" in location: # Location has requires, check them alongside the region requires
-            def checkBothLocationAndRegion(state: CollectionState, location=location, region=locationRegion):
-                locationCheck = fullLocationOrRegionCheck(state, location)
-                regionCheck = True # default to true unless there's a region with requires
-
-                if region:
-                    regionCheck = fullLocationOrRegionCheck(state, region)
-
-                return locationCheck and regionCheck
-
-            set_rule(locFromWorld, checkBothLocationAndRegion)
-        elif "region" in location: # Only region access required, check the location's region's requires
-            def fullRegionCheck(state, region=locationRegion):
-                return fullLocationOrRegionCheck(state, region)
-
-            set_rule(locFromWorld, fullRegionCheck)
-        else: # No location region and no location requires? It's accessible.
-            def allRegionsAccessible(state):
-                return True
-
-            set_rule(locFromWorld, allRegionsAccessible)
-
-    # Victory requirement
-    multiworld.completion_condition[player] = lambda state: state.has("__Victory__", player)
-
-    def convert_req_function_args(state: CollectionState, func, args: list[str], areaName: str):
+            return canAccess
+
+        return self.state_rule(list_rule, mentions)
+
+    def index_list_item(self, item: str) -> tuple[Optional[int], str, int]:
+        item_name, item_count = self.split_list_item(item)
+        return self.item_indexes.get(item_name), item_name, item_count
+
+    @staticmethod
+    def split_list_item(item: str) -> tuple[str, int]:
+        item_parts = item.split(":")
+        if len(item_parts) > 1:
+            return item_parts[0], int(item_parts[1])
+        return item, 1
+
+    def bind_function_args(self, func, args: list[str], areaName: str) -> list[int]:
+        # Fills in args (a call's literal arguments) with everything but the state, converting each literal to the
+        #     type of its parameter. Returns the positions the state goes in, which are left as None.
+        world, multiworld, player = self.world, self.multiworld, self.player
+        state_positions = []
         parameters = inspect.signature(func).parameters
         knownParameters = [World, 'ManualWorld', MultiWorld, CollectionState]
         index = -1
@@ -354,7 +567,8 @@ def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
                 elif target_type == MultiWorld:
                     args.insert(index, multiworld)
                 elif target_type == CollectionState:
-                    args.insert(index, state)
+                    args.insert(index, None)
+                    state_positions.append(index)
                 continue
             if parameter.name.lower() == "player":
                 args.insert(index, player)
@@ -387,6 +601,74 @@ def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
 
             args[index] = value
 
+        return state_positions
+
+
+def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
+    compiler = world.rules_compiler = RequiresCompiler(world, multiworld, player)
+
+    used_location_names = []
+    # Region access rules, compiled once per region and shared by the region's entrances and locations
+    region_rules = {}
+    for region in regionMap.keys():
+        region_rules[region] = compiler.compile({**regionMap[region], "name": region, "is_region": True}, "region")
+        used_location_names.extend([l.name for l in multiworld.get_region(region, player).locations])
+        if region != "Menu":
+            if region_rules[region] is not always_accessible:
+                for exitRegion in multiworld.get_region(region, player).entrances:
+                    add_rule(world.get_entrance(exitRegion.name), region_rules[region])
+                    compiler.add_dependent(exitRegion.name, region_rules[region])
+            entrance_rules = regionMap[region].get("entrance_requires", {})
+            for e in entrance_rules:
+                entrance = world.get_entrance(f'{e}To{region}')
+                entrance_rule = compiler.compile({"name": entrance.name, "requires": entrance_rules[e]}, "entrance")
+                if entrance_rule is not always_accessible:
+                    add_rule(entrance, entrance_rule)
+                    compiler.add_dependent(entrance.name, entrance_rule)
+            exit_rules = regionMap[region].get("exit_requires", {})
+            for e in exit_rules:
+                exit = world.get_entrance(f'{region}To{e}')
+                exit_rule = compiler.compile({"name": exit.name, "requires": exit_rules[e]}, "entrance")
+                if exit_rule is not always_accessible:
+                    add_rule(exit, exit_rule)
+                    compiler.add_dependent(exit.name, exit_rule)
+
+    # Location access rules
+    for location in world.location_table:
+        if location["name"] not in used_location_names:
+            continue
+
+        locFromWorld = multiworld.get_location(location["name"], player)
+
+        regionRule = region_rules[location["region"]] if "region" in location else always_accessible
+        locationRule = compiler.compile(location, "location")
+        # Whether the location can be reached still depends on its region's requires, even when its rule doesn't check them
+        compiler.add_dependent(location["name"], locationRule)
+        compiler.add_dependent(location["name"], regionRule)
+
+        # The region's requires are already checked when reaching the location's region (they're part of the rules of every
+        #     entrance to it), so the location's rule only needs its own requires
+        if not world.location_rules_check_region:
+            regionRule = always_accessible
+
+        if locationRule is not always_accessible and regionRule is not always_accessible: # Check the location's requires alongside the region requires
+            def checkBothLocationAndRegion(state: CollectionState, locationRule=locationRule, regionRule=regionRule):
+                return locationRule(state) and regionRule(state)
+
+            set_rule(locFromWorld, CompiledRule(location["name"], "location", player, checkBothLocationAndRegion))
+        elif locationRule is not always_accessible: # Only the location's own requires
+            set_rule(locFromWorld, locationRule)
+        elif regionRule is not always_accessible: # Only region access required, check the location's region's requires
+            set_rule(locFromWorld, regionRule)
+        # Otherwise the location is always accessible, and doesn't need a rule at all
+
+    # Which entrances and locations each item can affect, see get_rules_affected_by_item
+    world.rule_dependents = compiler.dependents
+    world.rule_unknown_dependents = compiler.unknown_dependents
+
+    # Victory requirement
+    multiworld.completion_condition[player] = lambda state: state.has("__Victory__", player)
+
 
 def ItemValue(state: CollectionState, player: int, valueCount: str):
     """When passed a string with this format: 'valueName:int',
@@ -410,9 +692,6 @@ def OptOne(world: "ManualWorld", item: str, items_counts: Optional[dict] = None)
     """
     if item == "":
         return "" #Skip this function if item is left blank
-    if not items_counts:
-        items_counts = world.get_item_counts(only_progression=True)
-
     require_type = 'item'
 
     if '@' in item[:2]:
@@ -430,13 +709,16 @@ def OptOne(world: "ManualWorld", item: str, items_counts: Optional[dict] = None)
 
     if require_type == 'category':
         if item_count.isnumeric():
-            #Only loop if we can use the result to clamp
-            category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
-            category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
+            if items_counts:
+                category_items_counts = sum(items_counts.get(category_item, 0) for category_item in get_category_items(world, item_name))
+            else:
+                category_items_counts = get_category_item_count(world, item_name)
             item_count = clamp(int(item_count), 0, category_items_counts)
         return f"|@{item_name}:{item_count}|"
     elif require_type == 'item':
         if item_count.isnumeric():
+            if not items_counts:
+                items_counts = world.get_item_counts(only_progression=True)
             item_current_count = items_counts.get(item_name, 0)
             item_count = clamp(int(item_count), 0, item_current_count)
         return f"|{item_name}:{item_count}|"
@@ -449,8 +731,6 @@ def OptAll(world: "ManualWorld", requires: str):
     become "|DisabledItem:0| and |@CategoryWithModifedCount:2| and |other items|" """
     requires_list = requires
 
-    items_counts = world.get_item_counts(only_progression=True)
-
     functions = {}
     if requires_list == "":
         return True
@@ -461,7 +741,7 @@ def OptAll(world: "ManualWorld", requires: str):
         requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", "{" + func_name + "(temp)}")
     # parse user written statement into list of each item
     for item in re.findall(r'\|[^|]+\|', requires):
-        itemScanned = OptOne(world, item, items_counts)
+        itemScanned = OptOne(world, item)
         requires_list = requires_list.replace(item, itemScanned)
 
     for function in functions:
@@ -20,7 +20,8 @@ from .Regions import create_regions
 from .Items import ManualItem
 from .Rules import set_rules
 from .Options import manual_options_data
-from .Helpers import is_item_enabled, get_option_value, get_items_for_player, resolve_yaml_option, format_state_prog_items_key, ProgItemsCat
+from .Helpers import is_item_enabled, get_option_value, get_items_for_player, resolve_yaml_option, format_state_prog_items_key, ProgItemsCat, \
+    get_state_item_counts, change_state_item_count
 
 from BaseClasses import CollectionState, ItemClassification, Item
 from Options import PerGameCommonOptions
@@ -274,6 +275,8 @@ class ManualWorld(World):
     # Item Value need a tweaked collect and remove:
     def collect(self, state: CollectionState, item: Item) -> bool:
         change = super().collect(state, item)
+        if change:
+            change_state_item_count(self, state, item.name, 1)
         manual_item = self.item_name_to_item.get(item.name, {})
         if change and manual_item.get("value"):
             for key, value in manual_item["value"].items():
@@ -283,6 +286,8 @@ class ManualWorld(World):
 
     def remove(self, state: CollectionState, item: Item) -> bool:
         change = super().remove(state, item)
+        if change:
+            change_state_item_count(self, state, item.name, -1)
         manual_item = self.item_name_to_item.get(item.name, {})
         if change and manual_item.get("value"):
             for key, value in manual_item["value"].items():
@@ -421,6 +426,16 @@ class ManualWorld(World):
     The maximum time a location/region's requirement can loop to check for functions\n
     One thing to remember is the more you loop the longer generation will take. So probably leave it as is unless you really needs it."""
 
+    rules_cache_size: int = 256
+    """Default: 256\n
+    How many results each location/region's rule remembers, by the counts of the items it checks\n
+    Set it to 0 to turn remembering off. world.rules_compiler.cache_stats() shows how often remembered results were used after generation."""
+
+    location_rules_check_region: bool = False
+    """Default: False\n
+    Whether every location's rule also checks its region's requires, like it used to\n
+    That's not needed, since a location can only be reached once its region is, and the region's requires are already part of the rules of every entrance to it. Turn it on to compare generations with the old rules."""
+
     def add_filler_items(self, item_pool, traps):
         Utils.deprecate("Use adjust_filler_items instead.")
         return self.adjust_filler_items(item_pool, traps)
@@ -512,6 +527,27 @@ class ManualWorld(World):
             'categories': category_table
         }
 
+# Every state keeps an array of the item counts of each player of this game, which the rules read (see
+#     get_state_item_counts). It's made with the state and copied with it:
+def init_state_item_counts(state: CollectionState, multiworld) -> None:
+    for player in multiworld.get_game_players(game_name):
+        get_state_item_counts(multiworld.worlds[player], state)
+
+def copy_state_item_counts(state: CollectionState, new_state: CollectionState) -> CollectionState:
+    counts = getattr(state, "manual_item_counts", None)
+    if counts:
+        if not hasattr(new_state, "manual_item_counts"):
+            new_state.manual_item_counts = {}
+        for player in state.multiworld.get_game_players(game_name):
+            if player in counts:
+                new_state.manual_item_counts[player] = counts[player][:]
+    return new_state
+
+# Older versions of Archipelago don't have these, the arrays are then built from prog_items when rules first need them
+if hasattr(CollectionState, "additional_init_functions") and hasattr(CollectionState, "additional_copy_functions"):
+    CollectionState.additional_init_functions.append(init_state_item_counts)
+    CollectionState.additional_copy_functions.append(copy_state_item_counts)
+
 ###
 # Non-world client methods
 ###
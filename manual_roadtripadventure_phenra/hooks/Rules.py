@@ -5,24 +5,34 @@ from BaseClasses import MultiWorld, CollectionState
 
 import re
 
+# The towns cityAccessCount counts in decorations mode.
+# Do not count Cloud Hill - this is used only for testing access to Q Coins for Coine's rewards
+TOWN_REGIONS = ["Peach Town", "Fuji City", "Sandpolis", "Chestnut Canyon", "Mushroom Road", "White Mountain", "Papaya Island"]
+
+def reachableTownCount(state: CollectionState, player: int) -> int:
+    """How many of TOWN_REGIONS the player can reach. The count is worked out once and kept on the state, until
+    clearReachableTownCount is called when an item is collected or removed."""
+    counts = getattr(state, "reachable_town_counts", None)
+    if counts is None:
+        counts = state.reachable_town_counts = {}
+    if player not in counts or state.stale[player]:
+        # can_reach_region brings the reachable regions up to date first if the state is stale
+        counts[player] = sum(1 for region in TOWN_REGIONS if state.can_reach_region(region, player))
+    return counts[player]
+
+def clearReachableTownCount(state: CollectionState, player: int):
+    counts = getattr(state, "reachable_town_counts", None)
+    if counts:
+        counts.pop(player, None)
+
 def cityAccessCount(multiworld: MultiWorld, state: CollectionState, player: int, count: int):
-    if get_option_value(multiworld, player, "area_unlock_mode") == 0: # Decorations mode
-        return [
-            state.can_reach_region("Peach Town", player),
-            state.can_reach_region("Fuji City", player),
-            state.can_reach_region("Sandpolis", player),
-            state.can_reach_region("Chestnut Canyon", player),
-            state.can_reach_region("Mushroom Road", player),
-            state.can_reach_region("White Mountain", player),
-            state.can_reach_region("Papaya Island", player),
-
-            # Do not count Cloud Hill - this is used only for testing access to Q Coins for Coine's rewards
-            # state.can_reach_region("Cloud Hill", player)
-        ].count(True) >= count
-
-    elif get_option_value(multiworld, player, "area_unlock_mode") == 1: # Stamp mode
+    area_unlock_mode = get_option_value(multiworld, player, "area_unlock_mode")
+    if area_unlock_mode == 0: # Decorations mode
+        return reachableTownCount(state, player) >= count
+
+    elif area_unlock_mode == 1: # Stamp mode
         return state.count("Stamp", player) >= 5 * (count - 1)
-    
+
     else:
         raise Exception("Area Unlock Mode is not Decorations or Stamps, please fix your YAML.")
 
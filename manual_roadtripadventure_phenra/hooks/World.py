@@ -14,6 +14,8 @@ from ..Data import game_table, item_table, location_table, region_table
 # These helper methods allow you to determine if an option has been set, or what its value is, for any player in the multiworld
 from ..Helpers import is_option_enabled, get_option_value, format_state_prog_items_key, ProgItemsCat
 
+from .Rules import clearReachableTownCount
+
 # calling logging.info("message") anywhere below in this file will output the message to both console and log file
 import logging
 
@@ -310,7 +312,8 @@ def after_collect_item(world: World, state: CollectionState, Changed: bool, item
     # the following let you add to the Potato Item Value count
     # if item.name == "Cooked Potato":
     #     state.prog_items[item.player][format_state_prog_items_key(ProgItemsCat.VALUE, "Potato")] += 1
-    pass
+    if Changed:
+        clearReachableTownCount(state, item.player)
 
 # This method is run every time an item is removed from the state, can be used to modify the value of an item.
 # IMPORTANT! Any changes made in this hook must be first done in after_collect_item
@@ -318,7 +321,8 @@ def after_remove_item(world: World, state: CollectionState, Changed: bool, item:
     # the following let you undo the addition to the Potato Item Value count
     # if item.name == "Cooked Potato":
     #     state.prog_items[item.player][format_state_prog_items_key(ProgItemsCat.VALUE, "Potato")] -= 1
-    pass
+    if Changed:
+        clearReachableTownCount(state, item.player)
 
 
 # This is called before slot data is set and provides an empty dict ({}), in case you want to modify it before Manual does
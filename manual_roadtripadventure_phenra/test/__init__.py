@@ -0,0 +1,17 @@
+from BaseClasses import CollectionState
+
+from ..manual_test import ManualTest
+
+
+class RulesTestBase(ManualTest):
+    """A generated world, plus helpers to build states that have exactly the items a test gives them."""
+
+    def progression_items(self) -> list[str]:
+        return sorted(name for name, item in self.world.item_name_to_item.items() if item.get("progression"))
+
+    def make_state(self, item_counts: dict[str, int]) -> CollectionState:
+        state = CollectionState(self.multiworld)
+        for item_name, count in item_counts.items():
+            for _ in range(count):
+                state.collect(self.world.create_item(item_name), True)
+        return state
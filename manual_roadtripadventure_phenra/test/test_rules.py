@@ -0,0 +1,495 @@
+import copy
+import inspect
+import random
+import re
+from unittest.mock import patch
+
+from BaseClasses import CollectionState, MultiWorld
+
+from . import RulesTestBase
+from ..Helpers import clamp, is_option_enabled, get_category_items, get_category_item_count, get_item_count_indexes, \
+    get_state_item_counts, get_rules_affected_by_item
+from ..Regions import regionMap
+from ..Rules import CompiledRule, MemoizedRule, always_accessible, set_rules
+from ..hooks import Rules as RulesHooks
+from ..hooks.Rules import TOWN_REGIONS, reachableTownCount
+
+REQUIREMENT_REGEX = re.compile(r'\|(@?)([^|:]+)(?::(\d+))?\|')
+
+
+def evaluate_requires(requires: str, state: CollectionState, world) -> bool:
+    """A requires string evaluated the way it was before rules were compiled: each requirement is replaced by 1 or 0,
+    then the expression is turned into postfix (AND and OR with the same precedence, ! above them) and evaluated."""
+    def requirement(match: re.Match) -> str:
+        is_category, name, count = match.group(1), match.group(2), int(match.group(3) or 1)
+        if is_category:
+            total = sum(state.count(item_name, world.player) for item_name in get_category_items(world, name))
+        else:
+            total = state.count(name, world.player)
+        return "1" if total >= count else "0"
+
+    expression = REQUIREMENT_REGEX.sub(requirement, requires)
+    expression = re.sub(r'\s?\bAND\b\s?', '&', expression, 0, re.IGNORECASE)
+    expression = re.sub(r'\s?\bOR\b\s?', '|', expression, 0, re.IGNORECASE)
+
+    prec = {"&": 2, "|": 2, "!": 3}
+    stack = []
+    postfix = ""
+    for c in expression:
+        if c in "01":
+            postfix += c
+        elif c in prec:
+            while stack and stack[-1] != "(" and prec[c] <= prec[stack[-1]]:
+                postfix += stack.pop()
+            stack.append(c)
+        elif c == "(":
+            stack.append(c)
+        elif c == ")":
+            while stack[-1] != "(":
+                postfix += stack.pop()
+            stack.pop()
+    while stack:
+        postfix += stack.pop()
+
+    values = []
+    for c in postfix:
+        if c in "01":
+            values.append(c == "1")
+        elif c == "!":
+            values.append(not values.pop())
+        else:
+            right, left = values.pop(), values.pop()
+            values.append(left and right if c == "&" else left or right)
+    return values.pop()
+
+
+class TestCompiledRules(RulesTestBase):
+    def random_requires(self, rng: random.Random, items: list[str], depth: int = 0) -> str:
+        if depth >= 3 or rng.random() < 0.4:
+            roll = rng.random()
+            if roll < 0.1:
+                operand = rng.choice("01")
+            elif roll < 0.2:
+                operand = f"|@Upgrades:{rng.randint(0, 6)}|"
+            else:
+                operand = f"|{rng.choice(items)}:{rng.randint(0, 3)}|"
+        else:
+            operand = f"|{rng.choice(items)}|"
+            for _ in range(rng.randint(1, 3)):
+                operand += f" {rng.choice(['AND', 'OR'])} {self.random_requires(rng, items, depth + 1)}"
+            operand = f"({operand})"
+        return f"!{operand}" if rng.random() < 0.2 else operand
+
+    def test_compiled_rules_match_uncompiled_requires(self):
+        rng = random.Random(41)
+        items = self.progression_items()[:8]
+        compiler = self.world.rules_compiler
+        for i in range(200):
+            requires = self.random_requires(rng, items)
+            rule = compiler.compile({"name": f"Test {i}", "requires": requires}, "location")
+            for _ in range(10):
+                state = self.make_state({item_name: rng.randint(0, 3) for item_name in items})
+                with self.subTest(requires=requires, items=dict(state.prog_items[self.player])):
+                    self.assertEqual(rule(state), evaluate_requires(requires, state, self.world))
+
+    def test_constants_are_folded(self):
+        compiler = self.world.rules_compiler
+        item_name = self.progression_items()[0]
+        area = {"name": "Test"}
+
+        for requires in (f"|{item_name}:0|", f"1 OR |{item_name}|", f"|{item_name}| OR !0", f"(0 OR 1) AND |{item_name}:0|"):
+            with self.subTest(requires=requires):
+                self.assertIs(compiler.compile({"name": "Test", "requires": requires}, "location"), always_accessible)
+        for requires in (f"0 AND |{item_name}|", f"|{item_name}| AND !1", "|@No Such Category|"):
+            with self.subTest(requires=requires):
+                self.assertEqual(compiler.fold(compiler.parse(requires, area), area, 0), ("const", False))
+
+        # Only the requirements that depend on the state are left
+        self.assertEqual(compiler.fold(compiler.parse(f"1 AND |{item_name}:2| AND |{item_name}:0|", area), area, 0), ("item", item_name, 2))
+
+    def test_not_binds_tighter_than_and_or(self):
+        first, second, third = self.progression_items()[:3]
+        compiler = self.world.rules_compiler
+
+        # !|first| AND |second| is (!|first|) AND |second|, not !(|first| AND |second|)
+        rule = compiler.compile({"name": "Test", "requires": f"!|{first}| AND |{second}|"}, "location")
+        self.assertTrue(rule(self.make_state({second: 1})))
+        self.assertFalse(rule(self.make_state({first: 1, second: 1})))
+        self.assertFalse(rule(self.make_state({})))
+
+        # AND and OR have the same precedence and are evaluated left to right: (|first| OR |second|) AND |third|
+        rule = compiler.compile({"name": "Test", "requires": f"|{first}| OR |{second}| AND |{third}|"}, "location")
+        self.assertFalse(rule(self.make_state({first: 1})))
+        self.assertTrue(rule(self.make_state({first: 1, third: 1})))
+
+        # ! of a group applies to the whole group
+        rule = compiler.compile({"name": "Test", "requires": f"!(|{first}| OR |{second}|)"}, "location")
+        self.assertTrue(rule(self.make_state({})))
+        self.assertFalse(rule(self.make_state({second: 1})))
+
+
+    def test_returned_requires_are_grouped(self):
+        first, second, third = self.progression_items()[:3]
+
+        def returnsRequires(state: CollectionState):
+            return f"|{second}| AND |{third}|"
+
+        # A function's returned requires are one group: |first| OR (|second| AND |third|). Before rules were compiled
+        #     the string was spliced into the requires, which made it (|first| OR |second|) AND |third|.
+        with patch.object(RulesHooks, "returnsRequires", returnsRequires, create=True):
+            rule = self.world.rules_compiler.compile({"name": "Test", "requires": f"|{first}| OR {{returnsRequires()}}"}, "location")
+            self.assertTrue(rule(self.make_state({first: 1})))
+            self.assertFalse(rule(self.make_state({second: 1})))
+            self.assertTrue(rule(self.make_state({second: 1, third: 1})))
+
+
+class TestMemoizedRules(RulesTestBase):
+    def make_rule(self, item_name: str, max_size: int) -> tuple[MemoizedRule, list[int]]:
+        # A rule that's met by 2 of the item, and that counts how many times it was really evaluated
+        index = get_item_count_indexes(self.world)[item_name]
+        evaluated = []
+
+        def rule(state, counts):
+            evaluated.append(counts[index])
+            return counts[index] >= 2
+
+        return MemoizedRule(rule, [index], self.world, max_size), evaluated
+
+    def test_results_are_remembered_by_item_counts(self):
+        item_name = self.progression_items()[0]
+        rule, evaluated = self.make_rule(item_name, 4)
+
+        self.assertFalse(rule(self.make_state({item_name: 1})))
+        self.assertFalse(rule(self.make_state({item_name: 1})))
+        self.assertTrue(rule(self.make_state({item_name: 2})))
+        # Other items aren't part of the key
+        self.assertTrue(rule(self.make_state({item_name: 2, self.progression_items()[1]: 1})))
+        self.assertEqual(evaluated, [1, 2])
+        self.assertEqual((rule.hits, rule.misses), (2, 2))
+
+    def test_oldest_result_is_forgotten_first(self):
+        item_name = self.progression_items()[0]
+        rule, evaluated = self.make_rule(item_name, 2)
+
+        for count in (0, 1, 2):
+            rule(self.make_state({item_name: count}))
+        self.assertEqual(len(rule.cache), 2)
+        self.assertEqual(evaluated, [0, 1, 2])
+
+        # 0 was forgotten, 1 and 2 are still remembered
+        self.assertTrue(rule(self.make_state({item_name: 2})))
+        self.assertFalse(rule(self.make_state({item_name: 1})))
+        self.assertEqual(evaluated, [0, 1, 2])
+        self.assertFalse(rule(self.make_state({item_name: 0})))
+        self.assertEqual(evaluated, [0, 1, 2, 0])
+        self.assertEqual(len(rule.cache), 2)
+
+    def test_cache_stats(self):
+        compiler = self.world.rules_compiler
+        item_name = self.progression_items()[0]
+        before = compiler.cache_stats()
+        rule = compiler.compile({"name": "Test", "requires": f"|{item_name}:2|"}, "location")
+
+        for count in (0, 0, 2):
+            rule(self.make_state({item_name: count}))
+        stats = compiler.cache_stats()
+        self.assertEqual(stats["rules"], before["rules"] + 1)
+        self.assertEqual(stats["hits"] - before["hits"], 1)
+        self.assertEqual(stats["misses"] - before["misses"], 2)
+
+    def test_rules_cache_size_0_turns_memoizing_off(self):
+        item_name = self.progression_items()[0]
+        rules_cache_size = self.world.rules_cache_size
+        self.world.rules_cache_size = 0
+        try:
+            rule = self.world.rules_compiler.compile({"name": "Test", "requires": f"|{item_name}:2|"}, "location")
+        finally:
+            self.world.rules_cache_size = rules_cache_size
+        self.assertNotIsInstance(rule.rule, MemoizedRule)
+        self.assertTrue(rule(self.make_state({item_name: 2})))
+
+
+class TestItemCountArray(RulesTestBase):
+    def assertCountsMatch(self, state: CollectionState):
+        counts = get_state_item_counts(self.world, state)
+        for item_name, index in get_item_count_indexes(self.world).items():
+            self.assertEqual(counts[index], state.count(item_name, self.player), item_name)
+
+    def test_collect_and_remove_keep_counts_up_to_date(self):
+        rng = random.Random(50)
+        items = self.progression_items()
+        state = self.make_state({})
+        collected = []
+        for _ in range(200):
+            if collected and rng.random() < 0.4:
+                state.remove(collected.pop(rng.randrange(len(collected))))
+            else:
+                item = self.world.create_item(rng.choice(items))
+                state.collect(item, True)
+                collected.append(item)
+        self.assertCountsMatch(state)
+
+        for item in collected:
+            state.remove(item)
+        self.assertFalse(any(get_state_item_counts(self.world, state)))
+
+    def test_copies_have_their_own_counts(self):
+        item_name = self.progression_items()[0]
+        index = get_item_count_indexes(self.world)[item_name]
+        state = self.make_state({item_name: 1})
+        copy = state.copy()
+        copy.collect(self.world.create_item(item_name), True)
+
+        self.assertEqual(get_state_item_counts(self.world, state)[index], 1)
+        self.assertEqual(get_state_item_counts(self.world, copy)[index], 2)
+        self.assertCountsMatch(copy)
+
+    def test_counts_are_built_for_states_without_them(self):
+        state = self.make_state({item_name: 2 for item_name in self.progression_items()[:3]})
+        del state.manual_item_counts
+        self.assertCountsMatch(state)
+
+    def test_list_requires(self):
+        first, second, third = self.progression_items()[:3]
+        rule = self.world.rules_compiler.compile({"name": "Test", "requires": [f"{first}:2", {"or": [second, f"{third}:2"]}]}, "location")
+
+        self.assertFalse(rule(self.make_state({first: 1})))
+        self.assertTrue(rule(self.make_state({first: 2})))
+        # An "or" group whose items are all owned is enough on its own
+        self.assertTrue(rule(self.make_state({second: 1, third: 2})))
+        self.assertFalse(rule(self.make_state({second: 1, third: 1})))
+
+
+class TestCategoryIndex(RulesTestBase):
+    def categories(self) -> list[str]:
+        return sorted({category for item in self.world.item_name_to_item.values() for category in item.get("category", [])})
+
+    def test_category_items(self):
+        categories = self.categories()
+        for category in categories:
+            with self.subTest(category=category):
+                expected = [name for name, item in self.world.item_name_to_item.items() if category in item.get("category", [])]
+                self.assertEqual(list(get_category_items(self.world, category)), expected)
+        self.assertEqual(get_category_items(self.world, "No Such Category"), ())
+        # The index is built once
+        category = categories[0]
+        self.assertIs(get_category_items(self.world, category), get_category_items(self.world, category))
+
+    def test_category_item_counts_are_pool_totals(self):
+        items_counts = self.world.get_item_counts(self.player, only_progression=True)
+        for category in self.categories():
+            with self.subTest(category=category):
+                total = sum(items_counts.get(item_name, 0) for item_name in get_category_items(self.world, category))
+                self.assertEqual(get_category_item_count(self.world, category, self.player), total)
+
+    def test_category_requires(self):
+        compiler = self.world.rules_compiler
+        # A category with at least 2 progression items
+        for category in self.categories():
+            items = [item_name for item_name in get_category_items(self.world, category) if item_name in self.progression_items()]
+            if len(items) >= 2:
+                break
+        first, second = items[:2]
+        rule = compiler.compile({"name": "Test", "requires": f"|@{category}:2|"}, "location")
+
+        # Any items of the category add up
+        self.assertFalse(rule(self.make_state({first: 1})))
+        self.assertTrue(rule(self.make_state({first: 1, second: 1})))
+        self.assertTrue(rule(self.make_state({second: 2})))
+
+
+class TestFunctionBinding(RulesTestBase):
+    def test_calls_are_bound_once(self):
+        item_name = self.progression_items()[0]
+        calls = []
+
+        def hasCount(world: "ManualWorld", state: CollectionState, player: int, item: str, count: int):
+            calls.append((world, player, item, count))
+            return state.has(item, player, count)
+
+        with patch.object(RulesHooks, "hasCount", hasCount, create=True), \
+                patch.object(inspect, "signature", wraps=inspect.signature) as signature:
+            rule = self.world.rules_compiler.compile({"name": "Test", "requires": f"{{hasCount({item_name}, 2)}}"}, "location")
+            for count in range(4):
+                self.assertEqual(rule(self.make_state({item_name: count})), count >= 2)
+
+        # The signature was only read while compiling, and the arguments were converted to the parameters' types then
+        self.assertEqual(signature.call_count, 1)
+        self.assertEqual(calls, [(self.world, self.player, item_name, 2)] * 4)
+
+    def test_missing_argument(self):
+        def hasCount(state: CollectionState, player: int, item: str, count: int):
+            return True
+
+        with patch.object(RulesHooks, "hasCount", hasCount, create=True):
+            with self.assertRaisesRegex(Exception, "asks for a value of type <class 'int'> for its argument \"count\""):
+                self.world.rules_compiler.compile({"name": "Test", "requires": "{hasCount(Item)}"}, "location")
+
+
+class TestStaticFunctions(RulesTestBase):
+    def fold(self, requires: str) -> tuple:
+        compiler = self.world.rules_compiler
+        area = {"name": "Test"}
+        return compiler.fold(compiler.parse(requires, area), area, 0)
+
+    def test_yaml_functions_are_folded(self):
+        enabled = is_option_enabled(self.multiworld, self.player, "remove_double_up_stamps")
+        self.assertEqual(self.fold("{YamlEnabled(remove_double_up_stamps)}"), ("const", enabled))
+        self.assertEqual(self.fold("{YamlDisabled(remove_double_up_stamps)}"), ("const", not enabled))
+
+        item_name = self.progression_items()[0]
+        rule = self.world.rules_compiler.compile({"name": "Test", "requires": f"{{YamlEnabled(remove_double_up_stamps)}} OR {{YamlDisabled(remove_double_up_stamps)}} OR |{item_name}|"}, "location")
+        self.assertIs(rule, always_accessible)
+
+    def test_returned_requires_are_folded(self):
+        # OptOne returns a requires string, which is compiled in its place with the count clamped to the pool's
+        item_name = self.progression_items()[0]
+        pool_count = self.world.rules_compiler.items_counts.get(item_name, 0)
+        self.assertEqual(self.fold(f"{{OptOne(|{item_name}:99|)}}"), ("item", item_name, clamp(99, 0, pool_count)))
+
+    def test_state_functions_are_not_folded(self):
+        self.assertEqual(self.fold("{cityAccessCount(2)}")[0], "call")
+        self.assertEqual(self.fold("{cityAccessCount(2)} AND 1")[0], "call")
+        # They're still dropped when a constant decides the result
+        self.assertEqual(self.fold("{cityAccessCount(2)} OR 1"), ("const", True))
+
+    def test_static_results_are_remembered(self):
+        calls = []
+
+        def optionCount(multiworld: MultiWorld, player: int, option: str):
+            calls.append(option)
+            return True
+
+        with patch.object(RulesHooks, "optionCount", optionCount, create=True):
+            for _ in range(2):
+                self.assertEqual(self.fold("{optionCount(area_unlock_mode)}"), ("const", True))
+        self.assertEqual(calls, ["area_unlock_mode"])
+
+
+class TestDependencyIndex(RulesTestBase):
+    def test_rules_mentioning_an_item_are_affected_by_it(self):
+        compiler = self.world.rules_compiler
+        area = {"name": "Test"}
+        first, second = self.progression_items()[:2]
+        self.assertEqual(compiler.mentions(compiler.fold(compiler.parse(f"|{first}| AND !(|{second}:2| OR 0)", area), area, 0)), {first, second})
+        self.assertIsNone(compiler.mentions(compiler.fold(compiler.parse(f"|{first}| OR {{cityAccessCount(2)}}", area), area, 0)))
+
+        location_names = {location.name for location in self.multiworld.get_locations(self.player)}
+        for location in self.world.location_table:
+            requires = location.get("requires")
+            if location["name"] not in location_names or not isinstance(requires, str) or "{" in requires:
+                continue
+            for is_category, name, count in REQUIREMENT_REGEX.findall(requires):
+                if is_category or count == "0":
+                    continue
+                with self.subTest(location=location["name"], item=name):
+                    self.assertIn(location["name"], get_rules_affected_by_item(self.world, name))
+        # Rules that call functions could check any item
+        self.assertLessEqual(self.world.rule_unknown_dependents, get_rules_affected_by_item(self.world, first))
+
+    def test_collecting_an_item_only_changes_the_rules_it_affects(self):
+        rng = random.Random(46)
+        items = self.progression_items()
+        rules = {location.name: location.access_rule for location in self.multiworld.get_locations(self.player)}
+        rules.update({entrance.name: entrance.access_rule for entrance in self.multiworld.get_entrances(self.player)})
+        for _ in range(100):
+            state = self.make_state({item_name: rng.randint(0, 2) for item_name in rng.sample(items, 10)})
+            before = {name: rule(state) for name, rule in rules.items()}
+            item_name = rng.choice(items)
+            state.collect(self.world.create_item(item_name), True)
+
+            affected = get_rules_affected_by_item(self.world, item_name)
+            for name, rule in rules.items():
+                if rule(state) != before[name]:
+                    self.assertTrue(name in affected, f"{name} changed when {item_name} was collected")
+
+
+class TestReachableTownCount(RulesTestBase):
+    def count_towns(self, state: CollectionState) -> int:
+        # The towns a new state with the same items can reach
+        fresh = self.make_state(dict(state.prog_items[self.player]))
+        return sum(1 for region in TOWN_REGIONS if fresh.can_reach_region(region, self.player))
+
+    def test_count_is_kept_until_items_change(self):
+        state = self.make_state({})
+        count = reachableTownCount(state, self.player)
+        self.assertEqual(count, self.count_towns(state))
+        self.assertEqual(state.reachable_town_counts, {self.player: count})
+
+        # Fuji City only needs one of its keys
+        key = self.world.create_item("Gold Ornament (Key)")
+        state.collect(key, True)
+        self.assertNotIn(self.player, state.reachable_town_counts)
+        self.assertEqual(reachableTownCount(state, self.player), count + 1)
+
+        state.remove(key)
+        self.assertNotIn(self.player, state.reachable_town_counts)
+        self.assertEqual(reachableTownCount(state, self.player), count)
+
+    def test_count_matches_a_fresh_state(self):
+        rng = random.Random(47)
+        items = self.progression_items()
+        state = self.make_state({})
+        collected = []
+        for _ in range(100):
+            if collected and rng.random() < 0.3:
+                state.remove(collected.pop(rng.randrange(len(collected))))
+            else:
+                item = self.world.create_item(rng.choice(items))
+                state.collect(item, True)
+                collected.append(item)
+            self.assertEqual(reachableTownCount(state, self.player), self.count_towns(state))
+
+
+class TestLocationRegionRules(RulesTestBase):
+    # A location whose own requires are met by an item that doesn't open its region (Fuji City)
+    location_name = "Ninja Temple Raceway - Rank C"
+    item_name = "Progressive Engine"
+
+    def test_location_rule_leaves_out_the_region_rule(self):
+        location = self.multiworld.get_location(self.location_name, self.player)
+        state = self.make_state({self.item_name: 1})
+        self.assertTrue(location.access_rule(state))
+        # The region's requires are still checked through its entrances
+        self.assertFalse(location.can_reach(state))
+        self.assertTrue(location.can_reach(self.make_state({self.item_name: 1, "Gold Ornament (Key)": 1})))
+
+    def test_location_rule_checks_the_region_rule_when_asked_to(self):
+        location_rules_check_region = self.world.location_rules_check_region
+        self.world.location_rules_check_region = True
+        try:
+            set_rules(self.world, self.multiworld, self.player)
+        finally:
+            self.world.location_rules_check_region = location_rules_check_region
+
+        location = self.multiworld.get_location(self.location_name, self.player)
+        self.assertFalse(location.access_rule(self.make_state({self.item_name: 1})))
+        self.assertTrue(location.access_rule(self.make_state({self.item_name: 1, "Gold Ornament (Key)": 1})))
+
+
+class TestCompiledRuleObjects(RulesTestBase):
+    def location_rules(self) -> dict[str, CompiledRule]:
+        return {location.name: location.access_rule for location in self.multiworld.get_locations(self.player)
+                if isinstance(location.access_rule, CompiledRule)}
+
+    def test_rules_are_not_shared_and_regions_are_unchanged(self):
+        region_map = copy.deepcopy(regionMap)
+        rules = self.location_rules()
+        self.assertTrue(rules)
+        for name, rule in rules.items():
+            self.assertEqual((rule.name, rule.type, rule.player), (name, "location", self.player))
+
+        # Setting the rules again, as for another player of this game, makes new rules and leaves regionMap as it was
+        set_rules(self.world, self.multiworld, self.player)
+        new_rules = self.location_rules()
+        self.assertEqual(new_rules.keys(), rules.keys())
+        for name, rule in new_rules.items():
+            self.assertIsNot(rule, rules[name])
+        self.assertEqual(regionMap, region_map)
+
+    def test_rules_cant_be_changed(self):
+        rule = next(iter(self.location_rules().values()))
+        with self.assertRaises(AttributeError):
+            rule.player = self.player + 1
+        with self.assertRaises(AttributeError):
+            rule.rule = always_accessible
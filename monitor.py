@@ -0,0 +1,102 @@
+from pine.pine import Pine
+from inventory import InventoryBitmap
+from items import PROGRESSIVE_PART_TABLES, PROGRESSIVE_SET_COUNT, deriveProgressiveLevels, getProgressiveOrder, getProgressiveTrackNames
+import session
+import shutil
+import sys
+import threading
+import time
+
+REFRESH_RATE = 10 # Refreshes per second
+HIGHLIGHT_SECONDS = 2.0 # How long a changed field stays highlighted
+LABEL_WIDTH = 14
+PART_NAME_WIDTH = 17 # Fits all three sets in an 80 column terminal
+
+HIGHLIGHT = "\x1b[7m"
+RESET = "\x1b[0m"
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+
+def getProgressiveBitfields(inventory : InventoryBitmap) -> dict[str, list[int]]:
+    # The quantity bitfields of each progressive part type (first copy first), as readProgressiveInventory returns them
+    sizeInBytes = inventory.data["parts"]["sizeInBytes"]
+    bitfields = {}
+    for itemType, partType in PROGRESSIVE_PART_TABLES.items():
+        table = inventory.getRegionBytes(f"parts.{partType}")
+        bitfields[itemType] = [int.from_bytes(table[i:i + sizeInBytes], "little") for i in range(0, len(table), sizeInBytes)]
+    return bitfields
+
+def getMonitorFields(data : dict, inventory : InventoryBitmap, currentRun : dict) -> list[tuple[str, str]]:
+    """ The monitor's fields as (label, value) pairs, all decoded from one inventory snapshot. """
+    decoded = inventory.decode()
+    levels, _ = deriveProgressiveLevels(data, getProgressiveBitfields(inventory), inventory.getValue("licenses"), currentRun)
+
+    fields = [
+        ("Money", f"{decoded['money']}G"),
+        ("License", str(decoded["license"]))
+    ]
+
+    for itemType in PROGRESSIVE_PART_TABLES:
+        order = getProgressiveOrder(data, itemType)
+        sets = []
+        for track in getProgressiveTrackNames(itemType):
+            level = levels.get(track, 0)
+            name = order[min(level, len(order) - 1)]
+            sets.append(f"{level:>2} {name[:PART_NAME_WIDTH]:<{PART_NAME_WIDTH}}")
+        fields.append((itemType, " | ".join(sets)))
+
+    collectibleCount = len(data["collectibles"]["bitOffsets"])
+    fields.append(("Collectibles", f"{len(decoded['collectibles'])}/{collectibleCount} " + ", ".join(decoded["collectibles"])))
+    fields.append(("Bodies", f"{len(decoded['bodies'])} " + " ".join(name.replace("Body ", "") for name in decoded["bodies"])))
+    return fields
+
+def renderMonitor(fields : list[tuple[str, str]], changedAt : dict[str, float], now : float, width : int) -> str:
+    lines = [
+        "Road Trip Adventure inventory monitor (press Enter to stop)",
+        "-" * min(width, 100),
+        f"{'':<{LABEL_WIDTH}}" + " | ".join(f"{'Set ' + str(i):<{PART_NAME_WIDTH + 3}}" for i in range(1, PROGRESSIVE_SET_COUNT + 1))
+    ]
+    for label, value in fields:
+        line = f"{label + ':':<{LABEL_WIDTH}}{value}"
+        # Long fields (collectibles, bodies) are cut to the terminal width rather than wrapped, so the view doesn't jump
+        if len(line) > width:
+            line = line[:width - 3] + "..."
+        if now - changedAt.get(label, -HIGHLIGHT_SECONDS) < HIGHLIGHT_SECONDS:
+            line = HIGHLIGHT + line + RESET
+        lines.append(line)
+    return "\n".join(lines)
+
+def runMonitor(data : dict, pine : Pine, currentRun : dict, refreshRate : float = REFRESH_RATE):
+    """ Show the inventory, refreshed about refreshRate times a second until Enter is pressed. Each refresh is one
+    batched snapshot of the whole inventory, so the monitor never issues per-field reads. """
+    stop = threading.Event()
+
+    def waitForEnter():
+        try:
+            input()
+        except EOFError:
+            pass
+        stop.set()
+
+    threading.Thread(target=waitForEnter, name="MonitorInput", daemon=True).start()
+
+    inventory = InventoryBitmap(data)
+    previous = {}
+    changedAt = {}
+    interval = 1 / refreshRate
+    while not stop.is_set():
+        started = time.monotonic()
+        inventory.read(pine)
+        fields = getMonitorFields(data, inventory, currentRun)
+
+        for label, value in fields:
+            # Nothing is highlighted on the first refresh
+            if previous and previous.get(label) != value:
+                changedAt[label] = started
+        previous = dict(fields)
+
+        width = shutil.get_terminal_size().columns
+        with session.unrecorded():
+            sys.stdout.write(CLEAR_SCREEN + renderMonitor(fields, changedAt, started, width) + "\n")
+            sys.stdout.flush()
+
+        stop.wait(max(0, interval - (time.monotonic() - started)))
@@ -0,0 +1,38 @@
+# Addresses and values of the initAP patches, shared by main.py (which applies them) and the background watchers
+#     (which check on them and read what they record).
+
+CMD_INIT = "initAP"
+ROAD_TRIP_GAME_ID = "SLUS-20398"
+INIT_HOOK_ADDRESS = 0x2697D8
+INIT_HOOK_BYTES = bytes([0x2A, 0xA8, 0x0B, 0x0C]) # jal 0x002EA0A8 (0C0BA82A)
+
+# initAP redirects the calls that would add overworld pickups to your inventory into a stub that records them in a
+#     ring buffer instead, which the editor drains to detect location checks. The stub, its entry points and the
+#     buffer all live in the unused non-English strings after initAP's shop hook. Shop purchases and NPC rewards
+#     aren't recorded, since the calls that give them (and where their item ids are) haven't been confirmed yet.
+EVENT_STUB_ADDRESS = 0x2EA0D0
+EVENT_PICKUP_ENTRY_ADDRESS = 0x2EA11C # One 3-instruction entry per overworld item
+EVENT_RING_ADDRESS = 0x2EA200
+EVENT_RING_HEADER_SIZE = 16 # Write index, last event type, last item id, magic
+EVENT_RING_RECORD_SIZE = 8 # Event type, item id
+EVENT_RING_SIZE = 32 # Records, must be a power of 2 (the stub masks the write index with EVENT_RING_SIZE - 1)
+EVENT_RING_MAGIC = b"RTAP" # Lets the editor tell whether initAP has set up the ring buffer
+EVENT_OVERWORLD_ITEM = 3 # Event type of a pickup, the item id is its index in OVERWORLD_ITEMS
+
+# Overworld items, as (address of the jal that plays the pickup sound, address of the jal that adds the item to your 
+#     inventory, name of the item's location)
+OVERWORLD_ITEMS = [
+    (None, 0x2409E0, "Peach"), # 0x2409D0 for sound, not needed for the Peach
+    (0x25C02C, 0x25C03C, "Wallet"),
+    (0x25C2A4, 0x25C2B4, "Fluffy Mushroom"),
+    (0x25C3E0, 0x25C3F0, "Amethyst"),
+    (0x25C4C4, 0x25C4D4, "Moonstone"),
+    (0x25C5F8, 0x25C608, "Small Bottle"),
+    (0x25C6D8, 0x25C6E8, "Black Opal"),
+    (0x25C7B8, 0x25C7C8, "Papu Flower"),
+    (0x25C8F4, 0x25C904, "Ruby"),
+    (0x25CAD8, 0x25CAE8, "Fountain Pen"),
+    (0x25CBB8, 0x25CBC8, "Blue Sapphire"),
+    (0x25D498, 0x25D4A8, "Topaz"),
+    (0x25D5A8, 0x25D5B8, "Emerald")
+]
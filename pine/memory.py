@@ -0,0 +1,110 @@
+"""
+A stand-in for PCSX2's side of the PINE protocol, backed by a bytearray instead of a running emulator.
+Requests are still encoded and decoded as real IPC messages, so everything above _send_request (batching, request
+sizes, reply parsing) behaves exactly as it would against PCSX2, and round trips and bytes can be counted.
+"""
+from .pine import Pine
+
+
+class MemoryPine(Pine):
+    """ A Pine connection to an in-memory PS2, for replaying and benchmarking without an emulator. """
+
+    """ Size of the PS2's main (EE) memory. """
+    RAM_SIZE: int = 0x2000000
+
+    def __init__(self, image: bytes = None, game_id: str = "SLUS-20398", title: str = "Road Trip Adventure",
+                 slot: int = Pine.DEFAULT_SLOT):
+        super().__init__(slot)
+        self.memory = bytearray(MemoryPine.RAM_SIZE)
+        if image is not None:
+            self.load_image(image)
+        self.game_id = game_id
+        self.title = title
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def load_image(self, image: bytes) -> None:
+        if len(image) != len(self.memory):
+            raise ValueError(f"Memory image is {len(image)} bytes, expected {len(self.memory)}")
+        self.memory[:] = image
+
+    def _init_socket(self) -> None:
+        self._sock_state = True
+
+    def disconnect(self) -> None:
+        self._sock_state = False
+
+    def reset_counters(self) -> None:
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def _send_request(self, request: bytes) -> bytes:
+        if not self._sock_state:
+            self._init_socket()
+
+        self.requests += 1
+        self.bytes_sent += len(request)
+        reply = self._handle_request(request)
+        self.bytes_received += len(reply)
+
+        if reply[4] == Pine.IPCResult.IPC_FAIL:
+            raise ConnectionError("Failure indicated in PCSX2 response.")
+        return reply
+
+    def _handle_request(self, request: bytes) -> bytes:
+        """ Runs every command in an IPC message, and builds the reply PCSX2 would send. """
+        if len(request) < 4 or Pine.from_bytes(request[0:4]) != len(request) or len(request) > Pine.MAX_IPC_SIZE:
+            return self._reply(Pine.IPCResult.IPC_FAIL)
+
+        data = b''
+        offset = 4
+        try:
+            while offset < len(request):
+                command = request[offset]
+                offset += 1
+                if command <= Pine.IPCCommand.READ64:
+                    size = 1 << command
+                    address = self._address(request[offset:offset + 4], size)
+                    data += self.memory[address:address + size]
+                    offset += 4
+                elif command <= Pine.IPCCommand.WRITE64:
+                    size = 1 << (command - Pine.IPCCommand.WRITE8)
+                    address = self._address(request[offset:offset + 4], size)
+                    value = request[offset + 4:offset + 4 + size]
+                    if len(value) != size:
+                        raise ValueError("Truncated write")
+                    self.memory[address:address + size] = value
+                    offset += 4 + size
+                elif command == Pine.IPCCommand.ID:
+                    data += self._string(self.game_id)
+                elif command == Pine.IPCCommand.TITLE:
+                    data += self._string(self.title)
+                elif command == Pine.IPCCommand.STATUS:
+                    data += Pine.to_bytes(0, 4)  # Running
+                else:
+                    raise ValueError(f"Unsupported command {command}")
+        except ValueError:
+            return self._reply(Pine.IPCResult.IPC_FAIL)
+
+        if len(data) + 5 > Pine.MAX_IPC_RETURN_SIZE:
+            return self._reply(Pine.IPCResult.IPC_FAIL)
+        return self._reply(Pine.IPCResult.IPC_OK, data)
+
+    def _address(self, encoded: bytes, size: int) -> int:
+        if len(encoded) != 4:
+            raise ValueError("Truncated address")
+        address = Pine.from_bytes(encoded)
+        if address + size > len(self.memory):
+            raise ValueError(f"Address {hex(address)} is out of range")
+        return address
+
+    @staticmethod
+    def _string(value: str) -> bytes:
+        encoded = value.encode("ascii") + b'\0'
+        return Pine.to_bytes(len(encoded), 4) + encoded
+
+    @staticmethod
+    def _reply(result: int, data: bytes = b'') -> bytes:
+        return Pine.to_bytes(5 + len(data), 4) + Pine.to_bytes(result, 1) + data
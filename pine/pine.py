@@ -30,6 +30,9 @@ class Pine:
     """ Maximum number of commands sent in a batch message. """
     MAX_BATCH_REPLY_COUNT: int = 50000
 
+    """ Slot PCSX2 uses for PINE unless configured otherwise. """
+    DEFAULT_SLOT: int = 28011
+
     class IPCResult(IntEnum):
         """ IPC result codes. A list of possible result codes the IPC can send back. Each one of them is what we call an
         "opcode" or "tag" and is the first byte sent by the IPC to differentiate between results.
@@ -62,7 +65,7 @@ class Pine:
         INT32 = 4,
         INT64 = 8,
 
-    def __init__(self, slot: int = 28011):
+    def __init__(self, slot: int = DEFAULT_SLOT):
         if not 0 < slot <= 65536:
             raise ValueError("Provided slot number is outside valid range")
         self._slot: int = slot
@@ -71,9 +74,24 @@ class Pine:
         # self._init_socket()
 
     def _init_socket(self) -> None:
+        socket_family, socket_name = Pine._socket_address(self._slot)
+        try:
+            self._sock = socket.socket(socket_family, socket.SOCK_STREAM)
+            self._sock.settimeout(5.0)
+            self._sock.connect(socket_name)
+        except socket.error:
+            self._sock.close()
+            self._sock_state = False
+            return
+
+        self._sock_state = True
+
+    @staticmethod
+    def _socket_address(slot: int) -> tuple[int, str | tuple[str, int]]:
+        """Returns the socket family and address PCSX2 listens on for a PINE slot."""
         if system() == "Windows":
             socket_family = socket.AF_INET
-            socket_name = ("127.0.0.1", self._slot)
+            socket_name = ("127.0.0.1", slot)
         elif system() == "Linux":
             socket_family = socket.AF_UNIX
             socket_name = os.environ.get("XDG_RUNTIME_DIR", "/tmp")
@@ -89,16 +107,11 @@ class Pine:
             socket_family = socket.AF_UNIX
             socket_name = "/tmp/pcsx2.sock"
 
-        try:
-            self._sock = socket.socket(socket_family, socket.SOCK_STREAM)
-            self._sock.settimeout(5.0)
-            self._sock.connect(socket_name)
-        except socket.error:
-            self._sock.close()
-            self._sock_state = False
-            return
+        # PCSX2 only uses the slot number in the socket name for slots other than the default
+        if socket_family == socket.AF_UNIX and slot != Pine.DEFAULT_SLOT:
+            socket_name += f".{slot}"
 
-        self._sock_state = True
+        return socket_family, socket_name
 
     def connect(self) -> None:
         if not self._sock_state:
@@ -192,6 +205,60 @@ class Pine:
                 self._send_request(request)
                 bytes_written += 1
 
+    def batch_read_bytes(self, regions: list[tuple[int, int]]) -> list[bytes]:
+        """Reads several (address, length) regions of memory, packing every read into as few IPC messages as
+        possible. Returns one bytes object per region, in the order the regions were given."""
+        replies = [self._send_request(request) for request in Pine._batch_read_requests(regions)]
+        return Pine._batch_read_results(regions, replies)
+
+    def batch_write_bytes(self, writes: list[tuple[int, bytes]]) -> None:
+        """Writes several (address, data) ranges of memory, packing every write into as few IPC messages as
+        possible."""
+        for request in Pine._batch_write_requests(writes):
+            self._send_request(request)
+
+    @staticmethod
+    def _batch_read_requests(regions: list[tuple[int, int]]) -> list[bytes]:
+        commands = []
+        for address, length in regions:
+            offset = 0
+            while offset < length:
+                size = Pine._largest_data_size(length - offset)
+                commands.append((Pine._read_command(size), address + offset, size))
+                offset += size
+
+        requests = []
+        for batch in Pine._split_batches(commands, lambda command: 5, lambda command: command[2]):
+            request = b''.join(Pine.to_bytes(command, 1) + Pine.to_bytes(address, 4) for command, address, _ in batch)
+            requests.append(Pine.to_bytes(4 + len(request), 4) + request)
+        return requests
+
+    @staticmethod
+    def _batch_read_results(regions: list[tuple[int, int]], replies: list[bytes]) -> list[bytes]:
+        data = b''.join(reply[5:] for reply in replies)
+        results = []
+        offset = 0
+        for _, length in regions:
+            results.append(data[offset:offset + length])
+            offset += length
+        return results
+
+    @staticmethod
+    def _batch_write_requests(writes: list[tuple[int, bytes]]) -> list[bytes]:
+        commands = []
+        for address, data in writes:
+            offset = 0
+            while offset < len(data):
+                size = Pine._largest_data_size(len(data) - offset)
+                commands.append((Pine._write_command(size), address + offset, data[offset:offset + size]))
+                offset += size
+
+        requests = []
+        for batch in Pine._split_batches(commands, lambda command: 5 + len(command[2]), lambda command: 0):
+            request = b''.join(Pine.to_bytes(command, 1) + Pine.to_bytes(address, 4) + data for command, address, data in batch)
+            requests.append(Pine.to_bytes(4 + len(request), 4) + request)
+        return requests
+
     def get_game_id(self) -> str:
         request = Pine.to_bytes(5, 4) + Pine.to_bytes(Pine.IPCCommand.ID, 1)
         response = self._send_request(request)
@@ -243,6 +310,45 @@ class Pine:
         ipc += Pine.to_bytes(address, 4)
         return ipc
 
+    @staticmethod
+    def _largest_data_size(remaining: int) -> int:
+        for size in (Pine.DataSize.INT64, Pine.DataSize.INT32, Pine.DataSize.INT16):
+            if remaining >= size:
+                return size
+        return Pine.DataSize.INT8
+
+    @staticmethod
+    def _read_command(size: int) -> IPCCommand:
+        return {1: Pine.IPCCommand.READ8, 2: Pine.IPCCommand.READ16,
+                4: Pine.IPCCommand.READ32, 8: Pine.IPCCommand.READ64}[size]
+
+    @staticmethod
+    def _write_command(size: int) -> IPCCommand:
+        return {1: Pine.IPCCommand.WRITE8, 2: Pine.IPCCommand.WRITE16,
+                4: Pine.IPCCommand.WRITE32, 8: Pine.IPCCommand.WRITE64}[size]
+
+    @staticmethod
+    def _split_batches(commands: list, request_size, reply_size) -> list[list]:
+        """Splits a list of commands into batches that fit within the IPC message, reply and batch count limits."""
+        batches = []
+        batch = []
+        batch_request_size = 4
+        batch_reply_size = 5
+        for command in commands:
+            if batch and (batch_request_size + request_size(command) > Pine.MAX_IPC_SIZE
+                          or batch_reply_size + reply_size(command) > Pine.MAX_IPC_RETURN_SIZE
+                          or len(batch) >= Pine.MAX_BATCH_REPLY_COUNT):
+                batches.append(batch)
+                batch = []
+                batch_request_size = 4
+                batch_reply_size = 5
+            batch.append(command)
+            batch_request_size += request_size(command)
+            batch_reply_size += reply_size(command)
+        if batch:
+            batches.append(batch)
+        return batches
+
     @staticmethod
     def to_bytes(value: int, size: int) -> bytes:
         return value.to_bytes(length=size, byteorder="little")
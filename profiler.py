@@ -0,0 +1,153 @@
+from pine.pine import Pine
+import contextlib
+import cProfile
+import threading
+import time
+
+# Phases of a command that are timed separately
+PHASE_PARSE = "parse"
+PHASE_NAMES = "name fixups"
+PHASE_CATALOG = "catalog lookup"
+PHASE_IPC = "ipc"
+PHASE_RUN_FILE = "current_run I/O"
+PHASES = [PHASE_PARSE, PHASE_NAMES, PHASE_CATALOG, PHASE_IPC, PHASE_RUN_FILE]
+
+_profiler = None
+_NO_OP = contextlib.nullcontext()
+
+def start(statsFile : str = None) -> "CommandProfiler":
+    """ Turn profiling on for the rest of the process. If statsFile is given, every command also runs under cProfile,
+    and the cumulative stats are written to that file by report(). """
+    global _profiler
+    _profiler = CommandProfiler(statsFile)
+    return _profiler
+
+def phase(name : str):
+    """ Time one phase of the current command. Does nothing unless profiling is on. """
+    return _profiler.phase(name) if _profiler else _NO_OP
+
+def command(name : str):
+    """ Time one whole command, and print its breakdown when it finishes. Does nothing unless profiling is on. """
+    return _profiler.command(name) if _profiler else _NO_OP
+
+def attachPine(pine : Pine):
+    """ Count and time every request sent over this Pine connection. Does nothing unless profiling is on. """
+    if _profiler:
+        _profiler.attachPine(pine)
+
+def _formatTime(seconds : float) -> str:
+    return f"{seconds * 1000:.3f} ms"
+
+class CommandProfiler:
+    """ Wall time and call counts for each phase of each command, and request counts for each Pine connection. """
+
+    def __init__(self, statsFile : str = None):
+        self.statsFile = statsFile
+        self.cprofile = cProfile.Profile() if statsFile else None
+        self.cprofileLock = threading.Lock() # cProfile can only follow one thread at a time
+        self.lock = threading.Lock()
+        self.local = threading.local() # The command running on each thread
+        self.phases = {} # Phase name: [seconds, calls]
+        self.commands = {} # Command name: [seconds, calls, {phase name: [seconds, calls]}]
+        self.pineRequests = {} # PINE slot: [requests, bytes sent, bytes received]
+
+    @contextlib.contextmanager
+    def phase(self, name : str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            breakdown = getattr(self.local, "breakdown", None)
+            if breakdown is not None:
+                totals = breakdown.setdefault(name, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+            with self.lock:
+                totals = self.phases.setdefault(name, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+
+    @contextlib.contextmanager
+    def command(self, name : str):
+        self.local.breakdown = {}
+        self.local.requests = [0, 0, 0]
+        profiling = self.cprofile is not None and self.cprofileLock.acquire(blocking=False)
+        if profiling:
+            self.cprofile.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiling:
+                self.cprofile.disable()
+                self.cprofileLock.release()
+            breakdown, requests = self.local.breakdown, self.local.requests
+            self.local.breakdown = None
+
+            with self.lock:
+                totals = self.commands.setdefault(name, [0.0, 0, {}])
+                totals[0] += elapsed
+                totals[1] += 1
+                for phaseName, (seconds, calls) in breakdown.items():
+                    phaseTotals = totals[2].setdefault(phaseName, [0.0, 0])
+                    phaseTotals[0] += seconds
+                    phaseTotals[1] += calls
+
+            print(f"[profile] {name or '(empty)'}: {_formatTime(elapsed)}, {requests[0]} PINE requests "
+                  f"({requests[1]} bytes sent, {requests[2]} received)")
+            print("[profile]   " + self._formatBreakdown(elapsed, breakdown))
+
+    def attachPine(self, pine : Pine):
+        # Wrap this connection's _send_request, which every Pine call goes through
+        send = pine._send_request
+        slot = pine._slot
+
+        def profiledSend(request : bytes) -> bytes:
+            response = b''
+            try:
+                with self.phase(PHASE_IPC):
+                    response = send(request)
+                return response
+            finally:
+                if getattr(self.local, "breakdown", None) is not None:
+                    self.local.requests[0] += 1
+                    self.local.requests[1] += len(request)
+                    self.local.requests[2] += len(response)
+                with self.lock:
+                    totals = self.pineRequests.setdefault(slot, [0, 0, 0])
+                    totals[0] += 1
+                    totals[1] += len(request)
+                    totals[2] += len(response)
+
+        pine._send_request = profiledSend
+
+    def _formatBreakdown(self, elapsed : float, breakdown : dict) -> str:
+        # Phases in a fixed order, then whatever time wasn't in any phase (printing, bit twiddling, etc.)
+        parts = []
+        for name in PHASES + [name for name in breakdown if name not in PHASES]:
+            if name in breakdown:
+                seconds, calls = breakdown[name]
+                parts.append(f"{name} {_formatTime(seconds)} ({calls}x)")
+        other = elapsed - sum(seconds for seconds, _ in breakdown.values())
+        parts.append(f"other {_formatTime(max(other, 0))}")
+        return " | ".join(parts)
+
+    def report(self):
+        """ Print the totals for the whole session, and write the cProfile stats file if one was asked for. """
+        print()
+        print("Profile")
+        print("---------------------------------------------------------------")
+        for name, (seconds, calls, breakdown) in sorted(self.commands.items(), key=lambda entry: -entry[1][0]):
+            print(f"{name or '(empty)'}: {calls} commands, {_formatTime(seconds)} total, {_formatTime(seconds / calls)} mean")
+            print("  " + self._formatBreakdown(seconds, breakdown))
+        print()
+        for name, (seconds, calls) in self.phases.items():
+            print(f"{name}: {calls} calls, {_formatTime(seconds)} total, {_formatTime(seconds / calls)} mean")
+        for slot, (requests, sent, received) in self.pineRequests.items():
+            print(f"PINE slot {slot}: {requests} requests, {sent} bytes sent, {received} bytes received")
+
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(self.statsFile)
+            print(f"cProfile stats written to {self.statsFile} (open with python -m pstats)")
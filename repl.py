@@ -0,0 +1,320 @@
+from pine.pine import Pine
+from daemon import EditorDaemon, EditorServer
+from patches import CMD_INIT, ROAD_TRIP_GAME_ID, INIT_HOOK_ADDRESS, INIT_HOOK_BYTES
+from abc import ABC, abstractmethod
+import asyncio
+import shlex
+import sys
+import threading
+import time
+
+try:
+    import readline # Lets the prompt be redrawn with whatever the user has typed so far (not available on Windows)
+except ImportError:
+    readline = None
+
+PROMPT = "Enter a command ('help' for options): "
+SUPERVISOR_INTERVAL = 2.0 # Seconds between reconnection attempts
+PATCH_CHECK_INTERVAL = 5.0
+FAST_POLL_INTERVAL = 0.25 # Seconds between background reads while something is likely to happen
+SLOW_POLL_INTERVAL = 3.0 # Seconds between background reads otherwise
+ACTIVITY_WINDOW = 10.0 # Seconds to keep polling fast after a watcher reports something
+
+class Console:
+    """ Prints messages from background tasks without breaking the command prompt.
+
+    While the user is typing, the prompt line is cleared, the message printed, and the prompt redrawn along with
+    whatever had been typed. While a command is running, messages are held back until it finishes so that they don't
+    land in the middle of the command's own output. """
+
+    def __init__(self, prompt : str = PROMPT):
+        self.prompt = prompt
+        self.lock = threading.Lock()
+        self.waitingForInput = False
+        self.commandRunning = False
+        self.heldMessages = []
+
+    def notify(self, message : str):
+        with self.lock:
+            if self.commandRunning:
+                self.heldMessages.append(message)
+            elif self.waitingForInput:
+                typed = readline.get_line_buffer() if readline else ""
+                sys.stdout.write("\r\x1b[K" + message + "\n" + self.prompt + typed)
+                sys.stdout.flush()
+            else:
+                print(message)
+
+    def readLine(self) -> str:
+        # Blocks, so only ever called from the input thread
+        with self.lock:
+            self.waitingForInput = True
+        try:
+            return input(self.prompt)
+        finally:
+            with self.lock:
+                self.waitingForInput = False
+
+    def startCommand(self):
+        with self.lock:
+            self.commandRunning = True
+
+    def endCommand(self):
+        with self.lock:
+            self.commandRunning = False
+            held, self.heldMessages = self.heldMessages, []
+        for message in held:
+            print(message)
+
+class Watcher(ABC):
+    """ Background work that watches a few ranges of memory while the emulator is connected, at most once every
+    `interval` seconds.
+
+    The PollScheduler reads the ranges of every watcher that is due in one batched request, and passes each watcher
+    its data through process(), which returns a message for the console (or None). """
+
+    name = "watcher"
+    interval = 1.0
+
+    def __init__(self):
+        self.enabled = True
+
+    def commandRan(self, argv : list[str]):
+        # Called after each command, so a watcher can react to what the user did
+        pass
+
+    @abstractmethod
+    def ranges(self) -> list[tuple[int, int]]:
+        """ The (address, size) ranges to read on each poll. """
+
+    @abstractmethod
+    def process(self, data : list[bytes]) -> str | None:
+        """ Handle one poll's reads, one bytes object per range. """
+
+    def poll(self, pine : Pine) -> str | None:
+        return self.process(pine.batch_read_bytes(self.ranges()))
+
+class PatchWatchdog(Watcher):
+    """ Warns when the initAP patches disappear from memory, e.g. because the game was reset. """
+
+    name = "patch watchdog"
+    interval = PATCH_CHECK_INTERVAL
+
+    def __init__(self):
+        super().__init__()
+        self.enabled = False # Nothing to check until initAP has been run
+
+    def commandRan(self, argv : list[str]):
+        if argv and argv[0] == CMD_INIT:
+            self.enabled = True
+
+    def ranges(self) -> list[tuple[int, int]]:
+        return [(INIT_HOOK_ADDRESS, len(INIT_HOOK_BYTES))]
+
+    def process(self, data : list[bytes]) -> str | None:
+        if data[0] == INIT_HOOK_BYTES:
+            return None
+        self.enabled = False
+        return "Warning: The initAP patches are no longer in memory (was the game reset?). Run initAP again once you're back in Q's Factory."
+
+class PollScheduler:
+    """ Decides when the watchers poll, based on how recently something happened.
+
+    Every tick is one batched read of the ranges of every watcher that is due (or a check of the game id when none
+    are), and a tick that fails means the connection was lost. Ticks are fast for ACTIVITY_WINDOW seconds after a
+    watcher reports something (e.g. a location was checked, so more pickups are likely nearby), and slow otherwise.
+    Nothing is missed while polling slowly, since the events and bitfields the watchers read persist in memory; it
+    only takes longer to notice them. """
+
+    def __init__(self, watchers : list[Watcher]):
+        self.watchers = watchers
+        self.nextPoll = {watcher: 0.0 for watcher in watchers}
+        self.activeUntil = 0.0
+
+    def dueWatchers(self, now : float) -> list[Watcher]:
+        return [watcher for watcher in self.watchers if watcher.enabled and now >= self.nextPoll[watcher]]
+
+    def tick(self, pine : Pine) -> list[str]:
+        """ Poll once. Returns the watchers' messages. """
+        now = time.monotonic()
+        due = self.dueWatchers(now)
+        ranges = []
+        for watcher in due:
+            ranges += watcher.ranges()
+        if ranges:
+            results = pine.batch_read_bytes(ranges)
+        else:
+            # Nothing to read this tick, but a lost connection or an unloaded game should still be noticed
+            results = []
+            if pine.get_game_id() != ROAD_TRIP_GAME_ID:
+                raise ConnectionError("Road Trip is no longer running")
+
+        messages = []
+        offset = 0
+        for watcher in due:
+            count = len(watcher.ranges())
+            message = watcher.process(results[offset:offset + count])
+            offset += count
+            self.nextPoll[watcher] = now + watcher.interval
+            if message:
+                messages.append(message)
+                self.activeUntil = now + ACTIVITY_WINDOW
+        return messages
+
+    def isFast(self) -> bool:
+        return time.monotonic() < self.activeUntil
+
+    def nextInterval(self) -> float:
+        # Slow ticks still poll every watcher that is due, so no watcher waits longer than SLOW_POLL_INTERVAL
+        return FAST_POLL_INTERVAL if self.isFast() else SLOW_POLL_INTERVAL
+
+class EditorSession:
+    """ The interactive editor: the command loop, a connection supervisor, and any watchers, run as concurrent tasks on
+    one asyncio loop.
+
+    Pine calls block, so they run in worker threads, and pineLock makes sure only one task uses the connection at a
+    time. Commands always get the connection next; background tasks give up their turn whenever a command is pending,
+    so they never add latency to a command. While connected, a PollScheduler does all background reads; when a read
+    fails, the connection is retried every SUPERVISOR_INTERVAL seconds until Road Trip is back.
+
+    Given an rpcServer, the session also takes requests from other tools (e.g. the Manual client's /link_editor) over
+    the same Pine connection. Each of their transactions waits for the connection like a command does. """
+
+    def __init__(self, data : dict, pine : Pine, currentRun : dict, runCommand, watchers : list[Watcher] = None, console : Console = None,
+                 rpcServer : EditorServer = None):
+        self.data = data
+        self.pine = pine
+        self.currentRun = currentRun
+        self.runCommand = runCommand # main.runCommand, passed in so that this module doesn't import main
+        self.watchers = watchers if watchers is not None else [PatchWatchdog()]
+        self.scheduler = PollScheduler(self.watchers)
+        self.console = console or Console()
+        self.pineLock = None
+        self.commandPending = False
+        self.connected = pine.is_connected()
+        self.loop = None
+        self.rpcServer = rpcServer
+        if rpcServer:
+            rpcServer.daemon = EditorDaemon(data, pine, currentRun, runExclusive=self.runExclusive, notify=self.console.notify)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.pineLock = asyncio.Lock()
+        background = [asyncio.create_task(self.pollLoop())]
+        if self.rpcServer:
+            self.rpcServer.daemon.start()
+            threading.Thread(target=self.rpcServer.serve_forever, name="EditorServer", daemon=True).start()
+        try:
+            await self.commandLoop()
+        finally:
+            if self.rpcServer:
+                self.rpcServer.shutdown()
+                self.rpcServer.server_close()
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+
+    def runExclusive(self, func, *args):
+        """ Run func(*args) from another thread (the RPC worker) once no command or background task is using the Pine
+        connection. Blocks until it has run, and returns its result. """
+        async def exclusive():
+            async with self.pineLock:
+                return await asyncio.to_thread(func, *args)
+        return asyncio.run_coroutine_threadsafe(exclusive(), self.loop).result()
+
+    async def commandLoop(self):
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+        readyForInput = threading.Event()
+
+        # input() can't be cancelled, so it runs on its own daemon thread rather than the loop's executor, which would
+        # otherwise hold up shutting down. The thread only reads the next line once the last command has finished,
+        # since some commands (e.g. reconcile) ask the user questions of their own.
+        def readLines():
+            while True:
+                readyForInput.wait()
+                readyForInput.clear()
+                try:
+                    line = self.console.readLine()
+                except (EOFError, KeyboardInterrupt):
+                    line = None
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+                if line is None:
+                    return
+
+        threading.Thread(target=readLines, name="EditorInput", daemon=True).start()
+
+        while True:
+            readyForInput.set()
+            line = await lines.get()
+            if line is None:
+                print()
+                return
+            await self.execute(line)
+
+    async def execute(self, line : str):
+        self.commandPending = True
+        self.console.startCommand()
+        try:
+            async with self.pineLock:
+                await asyncio.to_thread(self.runCommand, self.data, self.pine, line, self.currentRun)
+        except Exception as ex:
+            print(f"Error: {ex}\n")
+        finally:
+            self.commandPending = False
+            self.console.endCommand()
+
+        try:
+            argv = shlex.split(line)
+        except ValueError:
+            return
+        for watcher in self.watchers:
+            watcher.commandRan(argv)
+
+    async def backgroundCall(self, func, *args):
+        """ Run a Pine call from a background task. Returns (True, result), or (False, None) if the turn was given up
+        to a command. """
+        if self.commandPending or self.pineLock.locked():
+            return False, None
+        async with self.pineLock:
+            if self.commandPending:
+                return False, None
+            return True, await asyncio.to_thread(func, *args)
+
+    def _checkConnection(self) -> bool:
+        if not self.pine.is_connected():
+            self.pine.connect()
+            if not self.pine.is_connected():
+                return False
+        try:
+            return self.pine.get_game_id() == ROAD_TRIP_GAME_ID
+        except Exception:
+            return False
+
+    async def pollLoop(self):
+        while True:
+            if not self.connected:
+                await asyncio.sleep(SUPERVISOR_INTERVAL)
+                ran, connected = await self.backgroundCall(self._checkConnection)
+                if ran and connected:
+                    self.connected = True
+                    self.console.notify("Reconnected to Road Trip.")
+                continue
+
+            try:
+                ran, messages = await self.backgroundCall(self.scheduler.tick, self.pine)
+            except Exception:
+                self.connected = False
+                self.console.notify("Lost connection to Road Trip, retrying in the background...")
+                continue
+
+            for message in messages if ran else []:
+                self.console.notify(message)
+            await asyncio.sleep(self.scheduler.nextInterval() if ran else FAST_POLL_INTERVAL)
+
+def runRepl(data : dict, pine : Pine, currentRun : dict, runCommand, watchers : list[Watcher] = None, rpcServer : EditorServer = None):
+    session = EditorSession(data, pine, currentRun, runCommand, watchers, rpcServer=rpcServer)
+    try:
+        asyncio.run(session.run())
+    except KeyboardInterrupt:
+        print()
@@ -0,0 +1,109 @@
+from pine.memory import MemoryPine
+from main import INTERACTIVE_COMMANDS, runCommand
+import session
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+def loadImage(filename : str) -> bytes:
+    with open(filename, "rb") as file:
+        return file.read()
+
+def saveImage(filename : str, image : bytes):
+    with open(filename, "wb") as file:
+        file.write(image)
+
+def seedInventory(pine : MemoryPine, inventory : dict):
+    # Put the inventory the session was recorded with into the stand-in's memory
+    for region in inventory.get("regions", {}).values():
+        address = int(region["address"], 16)
+        data = bytes.fromhex(region["bytes"])
+        pine.memory[address:address + len(data)] = data
+
+def compareImages(image : bytes, reference : bytes) -> tuple[int, int | None]:
+    """ Returns how many bytes differ between two memory images, and the address of the first one. """
+    if len(image) != len(reference):
+        return abs(len(image) - len(reference)), min(len(image), len(reference))
+    differing = [address for address, (a, b) in enumerate(zip(image, reference)) if a != b] if image != reference else []
+    return len(differing), differing[0] if differing else None
+
+def isInteractive(entry : dict) -> bool:
+    words = entry["command"].split(maxsplit=1)
+    return bool(words) and words[0] in INTERACTIVE_COMMANDS
+
+def replaySession(data : dict, header : dict, commands : list[dict], pine : MemoryPine, workDir : str) -> float:
+    """ Run every command in a session against the stand-in, as fast as possible. Output is thrown away, and answers
+    to questions are taken from the log. Interactive commands (e.g. monitor) only run until the user stops them, and
+    never change the inventory, so they're skipped. Returns how long the commands took, in seconds. """
+    currentRun = dict(header.get("currentRun", {}))
+    elapsed = 0.0
+
+    # Commands read and write files (e.g. current_run.json) relative to the working directory
+    previousDir = os.getcwd()
+    os.chdir(workDir)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for entry in commands:
+                if isInteractive(entry):
+                    continue
+                started = time.perf_counter()
+                try:
+                    with session.scriptedInput(entry.get("inputs", [])):
+                        runCommand(data, pine, entry["command"], currentRun)
+                except Exception:
+                    pass # Errors are part of the workload too, as long as they happen the same way each time
+                elapsed += time.perf_counter() - started
+    finally:
+        os.chdir(previousDir)
+
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a session recorded with main.py --record against an in-memory PINE stand-in.")
+    parser.add_argument("session", help="Session log to replay")
+    parser.add_argument("--initial", metavar="IMAGE", help="Memory image to start from, instead of the inventory in the session log")
+    parser.add_argument("--reference", metavar="IMAGE", help="Check that the final memory image matches this one byte for byte")
+    parser.add_argument("--save-image", metavar="IMAGE", help="Save the final memory image, e.g. as a reference for later runs")
+    parser.add_argument("--workdir", help="Folder to run commands in, for commands that read files (default: an empty temporary folder)")
+    args = parser.parse_args()
+
+    with open("addresses.json", "r") as file:
+        data = json.load(file)
+
+    header, commands = session.loadSession(args.session)
+
+    pine = MemoryPine(loadImage(args.initial) if args.initial else None)
+    if not args.initial and header.get("inventory"):
+        seedInventory(pine, header["inventory"])
+
+    if args.workdir:
+        elapsed = replaySession(data, header, commands, pine, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as workDir:
+            elapsed = replaySession(data, header, commands, pine, workDir)
+
+    image = bytes(pine.memory)
+    skipped = sum(1 for entry in commands if isInteractive(entry))
+    print(f"Replayed {len(commands) - skipped} commands from {args.session}" + (f" ({skipped} interactive commands skipped)" if skipped else ""))
+    print(f"Total time: {elapsed * 1000:.3f} ms ({elapsed * 1000 / max(len(commands) - skipped, 1):.3f} ms per command)")
+    print(f"Round trips: {pine.requests}")
+    print(f"Bytes sent: {pine.bytes_sent}, bytes received: {pine.bytes_received}")
+
+    if args.save_image:
+        saveImage(args.save_image, image)
+        print(f"Final memory image saved to {args.save_image}")
+
+    if args.reference:
+        differing, firstAddress = compareImages(image, loadImage(args.reference))
+        if differing == 0:
+            print(f"Final memory image matches {args.reference}")
+        else:
+            print(f"Final memory image does NOT match {args.reference}: {differing} bytes differ, starting at {hex(firstAddress)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from pine.pine import Pine
+import profiler
+import json
+import os
+
+CURRENT_RUN_FILE = "current_run.json"
+
+def getCurrentRunFile(slot : int) -> str:
+    # Each emulator driven by the orchestrator keeps its own run state. The default slot keeps using current_run.json.
+    if slot == Pine.DEFAULT_SLOT:
+        return CURRENT_RUN_FILE
+    return f"current_run_{slot}.json"
+
+def initializeCurrentRun(filename : str = CURRENT_RUN_FILE):
+    with open(filename, "w") as file:
+        json.dump({}, file)
+
+def ensureCurrentRunFileExists(filename : str = CURRENT_RUN_FILE):
+    if not os.path.exists(filename):
+        initializeCurrentRun(filename)
+    elif os.path.getsize(filename) == 0:
+        # A blank JSON file will cause exceptions later. Let's initialize it to an empty JSON object.
+        initializeCurrentRun(filename)
+
+def loadCurrentRun(filename : str = CURRENT_RUN_FILE) -> dict:
+    # The run state is read once on startup and kept in memory, and only written back when it changes.
+    with profiler.phase(profiler.PHASE_RUN_FILE):
+        ensureCurrentRunFileExists(filename)
+        with open(filename, "r") as file:
+            return json.load(file)
+
+def saveCurrentRun(currentRun : dict, filename : str = CURRENT_RUN_FILE):
+    # Written to a temporary file that then replaces the old one, so the file always holds either the old or the new 
+    #     run state in full, even if the editor is closed mid-write
+    with profiler.phase(profiler.PHASE_RUN_FILE):
+        temporaryFile = filename + ".tmp"
+        with open(temporaryFile, "w") as file:
+            json.dump(currentRun, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporaryFile, filename)
@@ -0,0 +1,165 @@
+import contextlib
+import json
+import sys
+import threading
+import time
+
+SESSION_LOG_VERSION = 1
+
+_recorder = None
+_NO_OP = contextlib.nullcontext()
+_thread = threading.local() # How the command running on each thread asks the user questions, see readInput
+
+def start(filename : str, currentRun : dict, inventory : dict = None) -> "SessionRecorder":
+    """ Record every command run from now on to a session log, which replay.py can play back. inventory is a snapshot
+    of the inventory the session starts from (see InventoryBitmap.toSnapshot). Call stop() when the session ends. """
+    global _recorder
+    _recorder = SessionRecorder(filename, currentRun, inventory)
+    return _recorder
+
+def stop():
+    """ Stop recording, and close the session log. Does nothing unless recording is on. """
+    global _recorder
+    if _recorder:
+        _recorder.close()
+        _recorder = None
+
+def recordCommand(commandLine : str):
+    """ Record one command, along with its output. Does nothing unless recording is on. """
+    return _recorder.command(commandLine) if _recorder else _NO_OP
+
+@contextlib.contextmanager
+def unrecorded():
+    """ Leave what this thread prints out of the command being recorded, e.g. the monitor's redraws, which would
+    otherwise fill the session log. It's still shown as usual. Does nothing unless a command is being recorded. """
+    output = sys.stdout if isinstance(sys.stdout, _CommandOutput) else None
+    captured = getattr(output.local, "captured", None) if output else None
+    if output:
+        output.local.captured = None
+    try:
+        yield
+    finally:
+        if output:
+            output.local.captured = captured
+
+def readInput(prompt : str = "") -> str:
+    """ Ask the user a question from inside a command. Commands use this instead of input(), so that the answer can be
+    recorded while recording, and taken from the session log while replaying. """
+    readInputHook = getattr(_thread, "readInput", None)
+    return readInputHook(prompt) if readInputHook else input(prompt)
+
+@contextlib.contextmanager
+def scriptedInput(answers : list[str]):
+    """ Answer the questions asked on this thread from a list instead of the keyboard (with an empty answer once the
+    list runs out), e.g. to replay a session. """
+    remaining = iter(answers)
+    previous = getattr(_thread, "readInput", None)
+    _thread.readInput = lambda prompt="": next(remaining, "")
+    try:
+        yield
+    finally:
+        _thread.readInput = previous
+
+def loadSession(filename : str) -> tuple[dict, list[dict]]:
+    """ Returns a session log's header and its commands, in the order they were run. """
+    with open(filename, "r") as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    if not entries or entries[0].get("type") != "session":
+        raise ValueError(f"{filename} is not a session log")
+    return entries[0], [entry for entry in entries[1:] if entry.get("type") == "command"]
+
+class _CommandOutput:
+    # Stands in for sys.stdout while recording. Everything is passed through to the real output stream, and whatever a
+    #     thread prints while it is running a recorded command is also kept for that command's log entry. Other
+    #     threads (e.g. background watchers) print exactly as they would without recording.
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text : str) -> int:
+        captured = getattr(self.local, "captured", None)
+        if captured is not None:
+            captured.append(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name : str):
+        return getattr(self.stream, name)
+
+class SessionRecorder:
+    """ Writes a session log: one JSON object per line, starting with a header that holds the run state and inventory
+    the session started from, then one entry per command with when it ran, how long it took, what it printed, and
+    the answers typed to any questions it asked (e.g. by reconcile), so it can be replayed exactly.
+
+    Output is captured by putting a _CommandOutput in front of output (sys.stdout by default) once, from the thread
+    that creates the recorder, and answers are read with readInput (input() by default). close() puts sys.stdout
+    back, so the recorder should be closed when the session ends, or used as a context manager. """
+
+    def __init__(self, filename : str, currentRun : dict, inventory : dict = None, output = None, readInput = None):
+        self.filename = filename
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.readInput = readInput or input
+        self.output = _CommandOutput(output or sys.stdout)
+        self.file = open(filename, "w")
+        self._writeEntry({"type": "session", "version": SESSION_LOG_VERSION, "started": self.started, "currentRun": dict(currentRun), "inventory": inventory})
+        self.previousStdout = sys.stdout
+        sys.stdout = self.output
+
+    def __enter__(self) -> "SessionRecorder":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _writeEntry(self, entry : dict):
+        # Flushed after every entry, so the log survives the editor being closed mid-session
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+
+    @contextlib.contextmanager
+    def command(self, commandLine : str):
+        started = time.time()
+        captured = []
+        answers = []
+        previousReadInput = getattr(_thread, "readInput", None)
+
+        def recordedInput(prompt : str = "") -> str:
+            answer = self.readInput(prompt)
+            answers.append(answer)
+            return answer
+
+        # Both only apply to the thread running this command
+        self.output.local.captured = captured
+        _thread.readInput = recordedInput
+        error = None
+        try:
+            yield
+        except Exception as ex:
+            error = str(ex)
+            raise
+        finally:
+            self.output.local.captured = None
+            _thread.readInput = previousReadInput
+            entry = {
+                "type": "command",
+                "time": started,
+                "offset": round(started - self.started, 6),
+                "elapsed": round(time.time() - started, 6),
+                "command": commandLine,
+                "output": "".join(captured)
+            }
+            if answers:
+                entry["inputs"] = answers
+            if error is not None:
+                entry["error"] = error
+            self._writeEntry(entry)
+
+    def close(self):
+        if sys.stdout is self.output:
+            sys.stdout = self.previousStdout
+        with self.lock:
+            self.file.close()
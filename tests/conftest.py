@@ -0,0 +1,25 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The editor's modules live at the top of the repository rather than in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from pine.memory import MemoryPine
+
+
+@pytest.fixture(scope="session")
+def data() -> dict:
+    with open(os.path.join(ROOT, "addresses.json"), "r") as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def pine() -> MemoryPine:
+    pine = MemoryPine()
+    pine.connect()
+    return pine
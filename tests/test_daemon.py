@@ -0,0 +1,224 @@
+import asyncio
+import json
+import socket
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from daemon import EditorDaemon, EditorServer, RpcError, openServer
+from inventory import InventoryBitmap
+from repl import Console, EditorSession
+
+
+@pytest.fixture
+def daemon(data, pine, tmp_path) -> EditorDaemon:
+    return EditorDaemon(data, pine, {}, str(tmp_path / "current_run.json"), coalesceWindow=0.05)
+
+
+def run(daemon : EditorDaemon, *requests : tuple[str, dict]) -> list[Future]:
+    batch = [(method, params, Future()) for method, params in requests]
+    daemon._runTransaction(batch)
+    return [future for _, _, future in batch]
+
+
+def test_transaction_applies_requests_in_order(daemon, data, pine):
+    futures = run(daemon, ("get", {"item": "Racing Tires", "quantity": 3}), ("remove", {"item": "Racing Tires"}), ("get", {"item": "Ruby"}))
+
+    assert [future.exception() for future in futures] == [None, None, None]
+    items = InventoryBitmap.fromPine(data, pine).decode()
+    assert items["parts"] == {"Racing Tires": 2}
+    assert items["collectibles"] == ["Ruby"]
+
+
+def test_transaction_reads_and_writes_once(daemon, pine):
+    pine.reset_counters()
+    run(daemon, *[("get", {"item": name}) for name in ["Ruby", "Emerald", "Topaz", "Racing Tires"]])
+    assert pine.requests == 2
+
+
+def test_failed_request_is_isolated(daemon, data, pine):
+    futures = run(daemon, ("get", {"item": "Ruby"}), ("get", {"item": "Not An Item"}), ("get", {"item": "Emerald"}))
+
+    assert futures[0].result() and futures[2].result()
+    with pytest.raises(RpcError):
+        futures[1].result()
+    assert sorted(InventoryBitmap.fromPine(data, pine).decode()["collectibles"]) == ["Emerald", "Ruby"]
+    assert daemon.stats["errors"] == 1
+
+
+def test_failed_request_leaves_no_partial_changes(daemon, data, pine, monkeypatch):
+    apply = EditorDaemon._apply
+
+    def applyThenFail(self, method, params, target, runState):
+        result = apply(self, method, params, target, runState)
+        if params.get("fail"):
+            raise ValueError("failed after changing the inventory")
+        return result
+
+    monkeypatch.setattr(EditorDaemon, "_apply", applyThenFail)
+    futures = run(daemon, ("get", {"item": "Progressive Engine"}), ("get", {"item": "Progressive Engine", "fail": True}), ("get", {"item": "Ruby"}))
+
+    assert futures[1].exception() is not None
+    assert daemon.currentRun == {"Progressive Engine": 1}
+    items = InventoryBitmap.fromPine(data, pine).decode()
+    assert items["parts"] == {"Panther": 1}
+    assert items["collectibles"] == ["Ruby"]
+
+
+def test_run_state_is_saved_only_when_changed(daemon, tmp_path):
+    run(daemon, ("get", {"item": "Ruby"}))
+    assert not (tmp_path / "current_run.json").exists()
+
+    run(daemon, ("get", {"item": "Progressive License"}))
+    with open(tmp_path / "current_run.json", "r") as file:
+        assert json.load(file) == {"Progressive License": 1}
+
+
+def test_failed_write_fails_every_request(daemon, pine, monkeypatch):
+    def failWrite(writes):
+        raise ConnectionError("emulator went away")
+
+    monkeypatch.setattr(pine, "batch_write_bytes", failWrite)
+    futures = run(daemon, ("get", {"item": "Progressive License"}), ("get", {"item": "Ruby"}))
+
+    assert all(isinstance(future.exception(), RpcError) for future in futures)
+    assert daemon.currentRun == {}
+
+
+def test_requests_that_arrive_together_share_a_transaction(daemon):
+    futures = [daemon.submit("get", {"item": name}) for name in ["Ruby", "Emerald", "Topaz"]]
+    daemon.start()
+
+    assert all(future.result(timeout=5) for future in futures)
+    assert daemon.stats["transactions"] == 1
+    assert daemon.stats["requests"] == 3
+
+
+def test_unknown_method_is_rejected(daemon):
+    with pytest.raises(RpcError):
+        daemon.submit("format", {})
+
+
+@pytest.mark.parametrize("file", ["/tmp/dump.json", "../dump.json", "dumps/../../dump.json", "C:\\dump.json", "C:dump.json", "\\\\server\\share\\dump.json", ""])
+def test_files_outside_the_editor_folder_are_rejected(daemon, file):
+    for method in ("dump", "sync"):
+        with pytest.raises(RpcError) as error:
+            daemon.submit(method, {"file": file})
+        assert error.value.code == -32602
+    assert daemon.queue.empty()
+
+
+def test_dump_to_a_file_in_the_editor_folder(daemon, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dumps").mkdir()
+    daemon.start()
+    daemon.submit("dump", {"file": "dumps/dump.json"}).result(timeout=5)
+    with open(tmp_path / "dumps" / "dump.json", "r") as file:
+        assert "regions" in json.load(file)
+
+
+def test_json_rpc_batch(daemon):
+    daemon.start()
+    server = EditorServer(daemon, 0)
+    try:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        with socket.create_connection(server.server_address, timeout=5) as connection:
+            requests = [
+                {"jsonrpc": "2.0", "id": 1, "method": "get", "params": {"item": "Ruby"}},
+                {"jsonrpc": "2.0", "id": 2, "method": "get", "params": {"item": "Not An Item"}},
+                {"jsonrpc": "2.0", "id": 3, "method": "nope"},
+                {"jsonrpc": "2.0", "method": "get", "params": {"item": "Emerald"}}
+            ]
+            connection.sendall(json.dumps(requests).encode() + b"\n")
+            responses = json.loads(connection.makefile().readline())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    byId = {response["id"]: response for response in responses}
+    assert set(byId) == {1, 2, 3}
+    assert "result" in byId[1]
+    assert byId[2]["error"]["message"] == "Item 'Not An Item' not found"
+    assert byId[3]["error"]["code"] == -32601
+
+
+def test_receive_skips_items_already_given(daemon, data, pine, tmp_path):
+    items = ["Progressive Engine", "Ruby", "Stamp"]
+    first = run(daemon, ("receive", {"key": "seed:1", "items": items[:2]}))[0].result()
+    assert first["given"] == 2
+
+    # After a reconnect, the client sends everything again from the start
+    again = run(daemon, ("receive", {"key": "seed:1", "start": 0, "items": items + ["Progressive Engine"]}))[0].result()
+    assert again["given"] == 4
+    assert daemon.currentRun["Progressive Engine"] == 2
+    assert daemon.currentRun["Received Items"] == {"seed:1": 4}
+
+    with open(tmp_path / "current_run.json", "r") as file:
+        assert json.load(file)["Received Items"] == {"seed:1": 4}
+    assert InventoryBitmap.fromPine(data, pine).decode()["collectibles"] == ["Ruby"]
+
+
+def test_receive_rejects_a_gap(daemon):
+    future = run(daemon, ("receive", {"key": "seed:1", "start": 3, "items": ["Ruby"]}))[0]
+    assert isinstance(future.exception(), RpcError)
+    assert "Received Items" not in daemon.currentRun
+
+
+def test_receive_counts_items_that_cannot_be_given(daemon):
+    result = run(daemon, ("receive", {"key": "seed:1", "items": ["Not An Item", "Ruby"]}))[0].result()
+    assert result["given"] == 2
+    assert result["messages"][0].startswith("Could not give Not An Item")
+
+
+def test_second_editor_stops_at_startup(capsys):
+    first = openServer(0)
+    try:
+        assert openServer(first.server_address[1]) is None
+        assert "already running" in capsys.readouterr().out
+    finally:
+        first.server_close()
+
+
+class HeldConsole(Console):
+    # A command prompt that nobody types into, until done is set
+    def __init__(self):
+        super().__init__()
+        self.done = threading.Event()
+
+    def readLine(self) -> str:
+        self.done.wait(5)
+        raise EOFError
+
+
+def test_command_prompt_takes_requests_over_its_own_connection(data, pine, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = openServer(0)
+    console = HeldConsole()
+    notified = []
+    monkeypatch.setattr(console, "notify", notified.append)
+    session = EditorSession(data, pine, {}, None, watchers=[], console=console, rpcServer=server)
+
+    transactions = []
+    runExclusive = session.runExclusive
+    def recordExclusive(func, *args):
+        transactions.append(func)
+        return runExclusive(func, *args)
+    session.rpcServer.daemon.runExclusive = recordExclusive
+
+    thread = threading.Thread(target=asyncio.run, args=(session.run(),))
+    thread.start()
+    try:
+        with socket.create_connection(server.server_address, timeout=5) as connection:
+            request = {"jsonrpc": "2.0", "id": 1, "method": "receive", "params": {"key": "seed:1", "items": ["Ruby", "Progressive Engine"]}}
+            connection.sendall(json.dumps(request).encode() + b"\n")
+            response = json.loads(connection.makefile().readline())
+    finally:
+        console.done.set()
+        thread.join(5)
+
+    assert response["result"]["given"] == 2
+    assert len(transactions) == 1
+    assert session.currentRun["Progressive Engine"] == 1
+    assert InventoryBitmap.fromPine(data, pine).decode()["collectibles"] == ["Ruby"]
+    assert notified == response["result"]["messages"]
@@ -0,0 +1,193 @@
+import pytest
+
+from checks import CheckLog, EventWatcher
+from main import init, initEventRing
+from patches import EVENT_STUB_ADDRESS, EVENT_PICKUP_ENTRY_ADDRESS, EVENT_RING_ADDRESS, EVENT_RING_SIZE, EVENT_OVERWORLD_ITEM, OVERWORLD_ITEMS
+from pine.memory import MemoryPine
+from repl import FAST_POLL_INTERVAL, SLOW_POLL_INTERVAL, PollScheduler
+
+RETURN_ADDRESS = 0x100000 # Where the game would continue after the pickup, stops the interpreter
+MAX_STEPS = 100
+
+PEACH, WALLET, RUBY = 0, 1, 8
+
+
+def signed16(value : int) -> int:
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def call(pine : MemoryPine, address : int, registers : dict = None):
+    """ Run the MIPS code at address as if the game had called it with jal, until it returns. Only knows the
+    instructions initAP's event stub and pickup entries use. """
+    memory = pine.memory
+    reg = [0] * 32
+    for number, value in (registers or {}).items():
+        reg[number] = value
+    reg[31] = RETURN_ADDRESS
+    pc, npc = address, address + 4
+
+    for _ in range(MAX_STEPS):
+        if pc == RETURN_ADDRESS:
+            return
+        word = int.from_bytes(memory[pc:pc + 4], "little")
+        opcode, rs, rt, rd, shift, funct = word >> 26, (word >> 21) & 31, (word >> 16) & 31, (word >> 11) & 31, (word >> 6) & 31, word & 63
+        imm = word & 0xFFFF
+        # Branches and jumps take effect after the instruction in their delay slot
+        pc, npc = npc, npc + 4
+
+        if opcode == 0 and funct == 0x00: # sll
+            reg[rd] = (reg[rt] << shift) & 0xFFFFFFFF
+        elif opcode == 0 and funct == 0x08: # jr
+            npc = reg[rs]
+        elif opcode == 0 and funct == 0x21: # addu
+            reg[rd] = (reg[rs] + reg[rt]) & 0xFFFFFFFF
+        elif opcode == 0x02: # j
+            npc = (pc & 0xF0000000) | ((word & 0x3FFFFFF) << 2)
+        elif opcode in (0x04, 0x05): # beq, bne
+            if (reg[rs] == reg[rt]) == (opcode == 0x04):
+                npc = pc + (signed16(imm) << 2)
+        elif opcode == 0x09: # addiu
+            reg[rt] = (reg[rs] + signed16(imm)) & 0xFFFFFFFF
+        elif opcode == 0x0C: # andi
+            reg[rt] = reg[rs] & imm
+        elif opcode == 0x0D: # ori
+            reg[rt] = reg[rs] | imm
+        elif opcode == 0x0F: # lui
+            reg[rt] = imm << 16
+        elif opcode == 0x23: # lw
+            target = reg[rs] + signed16(imm)
+            reg[rt] = int.from_bytes(memory[target:target + 4], "little")
+        elif opcode == 0x2B: # sw
+            target = reg[rs] + signed16(imm)
+            memory[target:target + 4] = reg[rt].to_bytes(4, "little")
+        else:
+            raise NotImplementedError(f"Instruction {word:08X} at {hex(pc - 4)}")
+        reg[0] = 0
+    raise RuntimeError("The code didn't return")
+
+
+def pickUp(pine : MemoryPine, index : int, frames : int = 1):
+    # The game calls the item's inventory update on every frame the car touches it, which initAP points at its entry
+    _, inventoryJAL, _ = OVERWORLD_ITEMS[index]
+    word = int.from_bytes(pine.memory[inventoryJAL:inventoryJAL + 4], "little")
+    assert word >> 26 == 0x03 # jal
+    for _ in range(frames):
+        call(pine, (word & 0x3FFFFFF) << 2)
+
+
+@pytest.fixture
+def ring(data, pine) -> MemoryPine:
+    init(data, pine)
+    return pine
+
+
+@pytest.fixture
+def watcher(tmp_path) -> EventWatcher:
+    return EventWatcher(CheckLog(str(tmp_path / "location_checks.json")))
+
+
+def poll(watcher : EventWatcher, pine : MemoryPine) -> str | None:
+    return watcher.process(pine.batch_read_bytes(watcher.ranges()))
+
+
+def test_pickup_entries_follow_the_stub():
+    pine = MemoryPine()
+    initEventRing(pine)
+    # Each entry sets the item id and jumps to the stub, and the last one ends before the ring buffer
+    end = EVENT_PICKUP_ENTRY_ADDRESS + len(OVERWORLD_ITEMS) * 12
+    assert end <= EVENT_RING_ADDRESS
+    assert pine.memory[EVENT_PICKUP_ENTRY_ADDRESS:EVENT_PICKUP_ENTRY_ADDRESS + 4] == bytes([0x00, 0x00, 0x04, 0x24]) # addiu a0, zero, 0
+
+
+def test_pickup_is_checked(ring, watcher):
+    assert poll(watcher, ring) is None
+    pickUp(ring, RUBY)
+    assert poll(watcher, ring) == "Location checked: Ruby"
+    assert watcher.checkLog.checked == ["Ruby"]
+    assert poll(watcher, ring) is None
+
+
+def test_first_pickup_is_recorded_even_with_item_id_0(ring, watcher):
+    # The ring buffer starts out with a last item id of 0, which is the Peach's, but no last event type
+    pickUp(ring, PEACH)
+    assert watcher.drain(ring.batch_read_bytes(watcher.ranges())[0]) == [(EVENT_OVERWORLD_ITEM, PEACH)]
+
+
+def test_repeated_frames_of_one_pickup_are_recorded_once(ring, watcher):
+    pickUp(ring, RUBY, frames=10)
+    pickUp(ring, WALLET, frames=3)
+    pickUp(ring, RUBY, frames=2)
+    events = watcher.drain(ring.batch_read_bytes(watcher.ranges())[0])
+    assert events == [(EVENT_OVERWORLD_ITEM, RUBY), (EVENT_OVERWORLD_ITEM, WALLET), (EVENT_OVERWORLD_ITEM, RUBY)]
+
+
+def test_drain_reads_across_the_end_of_the_buffer(ring, watcher):
+    for count in range(EVENT_RING_SIZE - 2):
+        pickUp(ring, count % 2)
+    assert len(watcher.drain(ring.batch_read_bytes(watcher.ranges())[0])) == EVENT_RING_SIZE - 2
+
+    # The next records wrap around to the start of the buffer
+    for index in (RUBY, WALLET, RUBY, WALLET, PEACH):
+        pickUp(ring, index)
+    events = watcher.drain(ring.batch_read_bytes(watcher.ranges())[0])
+    assert [itemId for _, itemId in events] == [RUBY, WALLET, RUBY, WALLET, PEACH]
+
+
+def test_overwritten_events_are_skipped(ring, watcher):
+    watcher.drain(ring.batch_read_bytes(watcher.ranges())[0])
+    for count in range(EVENT_RING_SIZE + 5):
+        pickUp(ring, RUBY if count % 2 else WALLET)
+
+    # Only the newest EVENT_RING_SIZE records are still in the buffer, oldest first
+    events = watcher.drain(ring.batch_read_bytes(watcher.ranges())[0])
+    assert len(events) == EVENT_RING_SIZE
+    assert events[0] == (EVENT_OVERWORLD_ITEM, RUBY) # The 6th pickup
+    assert events[-1] == (EVENT_OVERWORLD_ITEM, WALLET)
+
+
+def test_nothing_is_read_before_init_and_everything_after_a_reset(pine, data, watcher):
+    assert poll(watcher, pine) is None
+
+    init(data, pine)
+    pickUp(pine, RUBY)
+    pickUp(pine, WALLET)
+    assert watcher.drain(pine.batch_read_bytes(watcher.ranges())[0]) == [(EVENT_OVERWORLD_ITEM, RUBY), (EVENT_OVERWORLD_ITEM, WALLET)]
+
+    # Running initAP again empties the buffer, so the write index goes back to 0
+    init(data, pine)
+    pickUp(pine, PEACH)
+    assert watcher.drain(pine.batch_read_bytes(watcher.ranges())[0]) == [(EVENT_OVERWORLD_ITEM, PEACH)]
+
+
+def test_unrecognized_events_are_reported_once(ring, watcher):
+    for _ in range(2):
+        # The stub itself, with an event type (t2) and item id (a0) that no pickup entry sets
+        call(ring, EVENT_STUB_ADDRESS, {4: 0x40, 10: 7})
+        call(ring, EVENT_STUB_ADDRESS, {4: 0x41, 10: 7})
+    message = poll(watcher, ring)
+    assert message.count("Unrecognized event") == 2
+    call(ring, EVENT_STUB_ADDRESS, {4: 0x40, 10: 7})
+    assert poll(watcher, ring) is None
+
+
+def test_polling_speeds_up_after_a_check(ring, watcher):
+    scheduler = PollScheduler([watcher])
+    assert scheduler.tick(ring) == []
+    assert scheduler.nextInterval() == SLOW_POLL_INTERVAL
+
+    pickUp(ring, RUBY)
+    scheduler.nextPoll[watcher] = 0.0
+    ring.reset_counters()
+    assert scheduler.tick(ring) == ["Location checked: Ruby"]
+    assert ring.requests == 1
+    assert scheduler.nextInterval() == FAST_POLL_INTERVAL
+
+
+def test_poll_without_due_watchers_still_checks_the_game(ring, watcher):
+    scheduler = PollScheduler([watcher])
+    scheduler.tick(ring)
+    # The watcher isn't due again yet, so only the game id is checked
+    assert scheduler.tick(ring) == []
+    ring.game_id = "SLUS-00000"
+    with pytest.raises(ConnectionError):
+        scheduler.tick(ring)
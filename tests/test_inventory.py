@@ -0,0 +1,134 @@
+import pytest
+
+from inventory import InventoryBitmap, MAX_MONEY, getBodyName
+
+
+@pytest.fixture
+def inventory(data) -> InventoryBitmap:
+    return InventoryBitmap(data)
+
+
+def partBit(data : dict, name : str) -> tuple[str, int]:
+    for partType, table in data["parts"].items():
+        if isinstance(table, dict) and name in table["bitOffsets"]:
+            return partType, table["bitOffsets"][name]
+    raise KeyError(name)
+
+
+def test_buffer_size_must_match_regions(data, inventory):
+    with pytest.raises(ValueError):
+        InventoryBitmap(data, bytes(len(inventory.buffer) + 1))
+
+
+def test_bits_and_values(inventory):
+    inventory.setBit("collectibles", 12)
+    assert inventory.isBitSet("collectibles", 12)
+    assert inventory.popcount("collectibles") == 1
+    inventory.clearBit("collectibles", 12)
+    assert inventory.popcount("collectibles") == 0
+
+    inventory.setValue("money", 123456)
+    assert inventory.getValue("money") == 123456
+    with pytest.raises(ValueError):
+        inventory.setBit("licenses", 8 * len(inventory.getRegionBytes("licenses")))
+
+
+def test_part_copies(data, inventory):
+    partType, bit = partBit(data, "Racing Tires")
+    maxQuantity = data["parts"]["maxQuantity"]
+
+    assert inventory.addPartCopies(partType, bit, 2) == 2
+    assert inventory.getPartQuantity(partType, bit) == 2
+    assert inventory.addPartCopies(partType, bit, maxQuantity) == maxQuantity - 2
+    assert inventory.removePartCopies(partType, bit, 1) == 1
+    # The highest copy is emptied first, so the lowest copies stay filled
+    assert not inventory.isBitSet(f"parts.{partType}", inventory.partBit(bit, maxQuantity - 1))
+    assert inventory.removePartCopies(partType, bit, maxQuantity) == maxQuantity - 1
+    assert inventory.getPartQuantity(partType, bit) == 0
+
+
+def test_money_is_clamped(inventory):
+    assert inventory.addMoney(500) == 500
+    assert inventory.addMoney(-1000) == 0
+    assert inventory.addMoney(MAX_MONEY + 1) == MAX_MONEY
+
+
+def test_decode(data, inventory):
+    inventory.setBit("collectibles", data["collectibles"]["bitOffsets"]["Ruby"])
+    inventory.setBit("bodies", 149)
+    inventory.setValue("licenses", data["licenses"]["values"]["B License"])
+    partType, bit = partBit(data, "Panther")
+    inventory.addPartCopies(partType, bit, 2)
+
+    items = inventory.decode()
+    assert items["collectibles"] == ["Ruby"]
+    assert items["bodies"] == ["Life Body"]
+    assert items["license"] == "B License"
+    assert items["parts"] == {"Panther": 2}
+    assert getBodyName(0) == "Body Q001" and getBodyName(150) == "Body Q150"
+
+
+def test_snapshot_round_trip(data, inventory):
+    inventory.setBit("collectibles", 3)
+    inventory.setValue("money", 42)
+    restored = InventoryBitmap(data)
+    assert restored.loadSnapshot(inventory.toSnapshot()) == list(inventory.regions)
+    assert restored == inventory
+
+
+@pytest.mark.parametrize("change, problem", [
+    (lambda regions: regions.update({"garage": {"address": "0x0", "bytes": ""}}), "garage is not a region"),
+    (lambda regions: regions["money"].update({"bytes": "0000"}), "money is 2 bytes"),
+    (lambda regions: regions["money"].update({"bytes": "zz"}), "money is malformed"),
+    (lambda regions: regions["money"].update({"address": "0x10"}), "money is stored at 0x10")
+])
+def test_bad_snapshot_changes_nothing(data, inventory, change, problem):
+    snapshot = inventory.toSnapshot()
+    snapshot["regions"]["licenses"]["bytes"] = "01"
+    change(snapshot["regions"])
+
+    target = InventoryBitmap(data)
+    with pytest.raises(ValueError, match=problem):
+        target.loadSnapshot(snapshot)
+    assert target == InventoryBitmap(data)
+
+
+def test_diff_writes_only_changed_bytes(data, inventory):
+    target = inventory.copy()
+    assert target.diff(inventory) == []
+
+    target.setBit("collectibles", 0)
+    target.setBit("collectibles", 9)
+    address = int(data["collectibles"]["address"], 16)
+    # Bytes 0 and 1 are next to each other, so they are merged into one range
+    assert target.diff(inventory) == [(address, bytes([1, 2]))]
+
+    target.setValue("money", 1)
+    assert len(target.diff(inventory)) == 2
+
+
+def test_diff_of_every_part_copy(data, inventory):
+    target = inventory.copy()
+    partType, bit = partBit(data, "Racing Tires")
+    target.addPartCopies(partType, bit, data["parts"]["maxQuantity"])
+    writes = target.diff(inventory)
+    # Every copy's bitfield changed, so the ranges are only split where unchanged bytes sit between them
+    assert sum(len(data) for _, data in writes) == data["parts"]["maxQuantity"]
+
+
+def test_read_and_write_are_batched(data, pine):
+    current = InventoryBitmap.fromPine(data, pine)
+    target = current.copy()
+    target.setValue("money", 999)
+    target.setBit("collectibles", 5)
+    target.setBit("bodies", 10)
+
+    pine.reset_counters()
+    writes = target.write(pine, current)
+    assert pine.requests == 1
+    assert len(writes) == 3
+    assert InventoryBitmap.fromPine(data, pine) == target
+
+    pine.reset_counters()
+    assert target.write(pine, target.copy()) == []
+    assert pine.requests == 0
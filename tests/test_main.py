@@ -0,0 +1,198 @@
+import json
+import os
+
+import pytest
+
+from inventory import InventoryBitmap
+from items import CMD_GET, getProgressiveOrder
+from main import dumpInventory, reconcileCurrentRun, restoreInventory, syncInventory, updateItem
+import session
+
+
+@pytest.fixture(autouse=True)
+def runFolder(tmp_path, monkeypatch):
+    # Commands save current_run.json in the working folder
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def partBit(data : dict, name : str) -> tuple[str, int]:
+    for partType, table in data["parts"].items():
+        if isinstance(table, dict) and name in table["bitOffsets"]:
+            return partType, table["bitOffsets"][name]
+    raise KeyError(name)
+
+
+def savedRun(runFolder) -> dict:
+    with open(runFolder / "current_run.json", "r") as file:
+        return json.load(file)
+
+
+def test_progressive_part_only_adds_a_copy(data, pine, runFolder):
+    engine = getProgressiveOrder(data, "Engine")[1]
+    partType, bit = partBit(data, engine)
+    other = next(name for name in data["parts"][partType]["bitOffsets"] if name != engine)
+    before = InventoryBitmap.fromPine(data, pine)
+    before.addPartCopies(partType, bit, 1)
+    before.addPartCopies(*partBit(data, other), 2)
+    before.write(pine, InventoryBitmap.fromPine(data, pine))
+
+    currentRun = {}
+    updateItem(data, pine, CMD_GET, "Progressive Engine", None, currentRun)
+    updateItem(data, pine, CMD_GET, "Progressive Engine - Set 2", None, currentRun)
+
+    # Each track adds one more copy of its part, and every copy that was already owned is kept
+    after = InventoryBitmap.fromPine(data, pine)
+    expected = before.copy()
+    expected.addPartCopies(partType, bit, 2)
+    assert after == expected
+    assert currentRun == {"Progressive Engine": 1, "Progressive Engine - Set 2": 1}
+    assert savedRun(runFolder) == currentRun
+
+
+def test_progressive_part_at_the_maximum_warns(data, pine, capsys):
+    engine = getProgressiveOrder(data, "Engine")[1]
+    partType, bit = partBit(data, engine)
+    full = InventoryBitmap.fromPine(data, pine)
+    full.addPartCopies(partType, bit, data["parts"]["maxQuantity"])
+    full.write(pine, InventoryBitmap.fromPine(data, pine))
+
+    currentRun = {}
+    updateItem(data, pine, CMD_GET, "Progressive Engine", None, currentRun)
+
+    output = capsys.readouterr().out
+    assert f"Warning: Cannot hold more than {data['parts']['maxQuantity']} of a part, adding 0" in output
+    assert "Wrote to" not in output
+    # The track still counts the upgrade it received
+    assert currentRun == {"Progressive Engine": 1}
+    assert InventoryBitmap.fromPine(data, pine) == full
+
+
+def test_getting_an_item_twice_writes_once(data, pine, capsys):
+    currentRun = {}
+    updateItem(data, pine, CMD_GET, "Ruby", None, currentRun)
+    assert "Wrote to" in capsys.readouterr().out
+    memory = bytes(pine.memory)
+
+    pine.reset_counters()
+    updateItem(data, pine, CMD_GET, "Ruby", None, currentRun)
+    assert "Wrote to" not in capsys.readouterr().out
+    assert pine.memory == memory
+    # Only the read
+    assert pine.requests == 1
+    assert currentRun == {}
+
+
+def giveUpgrades(data : dict, pine, tracks : dict[str, int]):
+    # Puts the parts of these progressive levels in memory, without keeping the run state
+    for track, level in tracks.items():
+        currentRun = {}
+        for _ in range(level):
+            updateItem(data, pine, CMD_GET, track, None, currentRun)
+    os.remove("current_run.json")
+
+
+def test_reconcile_repairs_the_run_state_from_memory(data, pine, runFolder, monkeypatch):
+    giveUpgrades(data, pine, {"Progressive Engine": 2, "Progressive Tires": 1, "Progressive License": 1})
+    prompts = []
+    monkeypatch.setattr(session, "readInput", lambda prompt: prompts.append(prompt) or "repair")
+    pine.reset_counters()
+
+    currentRun = {"Progressive Engine": 1, "Progressive License": 1}
+    reconcileCurrentRun(data, pine, currentRun)
+
+    assert len(prompts) == 1
+    assert currentRun == {"Progressive Engine": 2, "Progressive Tires": 1, "Progressive License": 1}
+    assert savedRun(runFolder) == currentRun
+    # One batched read, and nothing written to memory
+    assert pine.requests == 1
+
+
+def test_reconcile_does_nothing_when_the_run_state_matches(data, pine, runFolder, monkeypatch, capsys):
+    giveUpgrades(data, pine, {"Progressive Brakes": 1})
+    monkeypatch.setattr(session, "readInput", lambda prompt: pytest.fail("Nothing should be asked"))
+    currentRun = {"Progressive Brakes": 1}
+    reconcileCurrentRun(data, pine, currentRun)
+
+    assert "matches the emulator's memory" in capsys.readouterr().out
+    assert currentRun == {"Progressive Brakes": 1}
+    assert not (runFolder / "current_run.json").exists()
+
+
+def test_reconcile_can_be_cancelled(data, pine, runFolder, monkeypatch):
+    giveUpgrades(data, pine, {"Progressive Engine": 1})
+    monkeypatch.setattr(session, "readInput", lambda prompt: "")
+    currentRun = {}
+    reconcileCurrentRun(data, pine, currentRun)
+
+    assert currentRun == {}
+    assert not (runFolder / "current_run.json").exists()
+
+
+def test_restore_puts_back_a_dump(data, pine, runFolder):
+    currentRun = {}
+    updateItem(data, pine, CMD_GET, "Progressive Engine", None, currentRun)
+    updateItem(data, pine, CMD_GET, "Ruby", None, currentRun)
+    dumped = bytes(pine.memory)
+    dumpInventory(data, pine, currentRun, "dump.json")
+
+    updateItem(data, pine, CMD_GET, "Progressive Engine", None, currentRun)
+    updateItem(data, pine, CMD_GET, "Emerald", None, currentRun)
+    restoreInventory(data, pine, currentRun, "dump.json")
+
+    assert pine.memory == dumped
+    assert currentRun == {"Progressive Engine": 1}
+    assert savedRun(runFolder) == currentRun
+
+
+def test_restore_rejects_a_dump_that_does_not_match(data, pine, runFolder, capsys):
+    currentRun = {"Progressive Engine": 1}
+    dumpInventory(data, pine, currentRun, "dump.json")
+    with open("dump.json", "r") as file:
+        snapshot = json.load(file)
+    snapshot["regions"]["money"]["bytes"] = "ffff0000"
+    snapshot["regions"]["licenses"]["address"] = "0x10"
+    snapshot["currentRun"] = {}
+    with open("dump.json", "w") as file:
+        json.dump(snapshot, file)
+
+    memory = bytes(pine.memory)
+    pine.reset_counters()
+    restoreInventory(data, pine, currentRun, "dump.json")
+
+    assert "Nothing was restored" in capsys.readouterr().out
+    # Only the read of the live inventory, and neither the memory nor the run state changed
+    assert pine.requests == 1
+    assert pine.memory == memory
+    assert currentRun == {"Progressive Engine": 1}
+    assert not (runFolder / "current_run.json").exists()
+
+
+def test_sync_only_adds_part_copies_and_twice_writes_once(data, pine, runFolder, capsys):
+    # A copy of the level 1 engine the player already owned outside of the randomizer
+    engine = getProgressiveOrder(data, "Engine")[1]
+    partType, bit = partBit(data, engine)
+    owned = InventoryBitmap.fromPine(data, pine)
+    owned.addPartCopies(partType, bit, 1)
+    owned.write(pine, InventoryBitmap.fromPine(data, pine))
+
+    with open("received.json", "w") as file:
+        json.dump({"Progressive Engine": 2, "Progressive Engine - Set 2": 1, "Ruby": 1}, file)
+    currentRun = {}
+    syncInventory(data, pine, currentRun, "received.json")
+
+    # Two tracks have the level 1 engine, which the owned copy counts towards, and one has the level 2 engine
+    inventory = InventoryBitmap.fromPine(data, pine)
+    assert inventory.getPartQuantity(partType, bit) == 2
+    assert inventory.getPartQuantity(*partBit(data, getProgressiveOrder(data, "Engine")[2])) == 1
+    assert inventory.isBitSet("collectibles", data["collectibles"]["bitOffsets"]["Ruby"])
+    assert currentRun == {"Progressive Engine": 2, "Progressive Engine - Set 2": 1}
+    assert savedRun(runFolder) == currentRun
+    capsys.readouterr()
+
+    memory = bytes(pine.memory)
+    pine.reset_counters()
+    syncInventory(data, pine, currentRun, "received.json")
+    assert "(0 changed ranges, 0 bytes written)" in capsys.readouterr().out
+    assert pine.memory == memory
+    assert pine.requests == 1
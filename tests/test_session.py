@@ -0,0 +1,86 @@
+import io
+import sys
+import threading
+
+from inventory import InventoryBitmap
+from replay import replaySession
+import session
+
+
+def test_records_output_and_answers_of_the_command_thread_only(tmp_path):
+    output = io.StringIO()
+    stdout = sys.stdout
+    answers = iter(["repair"])
+    backgroundStarted = threading.Event()
+    backgroundPrinted = threading.Event()
+
+    def background():
+        backgroundStarted.wait()
+        print("from a watcher")
+        backgroundPrinted.set()
+
+    def command():
+        with recorder.command("reconcile"):
+            print("comparing")
+            backgroundStarted.set()
+            backgroundPrinted.wait()
+            print("answer:", session.readInput("? "))
+
+    with session.SessionRecorder(str(tmp_path / "session.jsonl"), {"Progressive Engine": 1}, output=output, readInput=lambda prompt: next(answers)) as recorder:
+        threads = [threading.Thread(target=background), threading.Thread(target=command)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert sys.stdout is stdout
+    assert recorder.file.closed
+    assert "from a watcher" in output.getvalue()
+
+    header, commands = session.loadSession(str(tmp_path / "session.jsonl"))
+    assert header["currentRun"] == {"Progressive Engine": 1}
+    assert commands[0]["output"] == "comparing\nanswer: repair\n"
+    assert commands[0]["inputs"] == ["repair"]
+
+
+def test_errors_are_recorded(tmp_path):
+    with session.SessionRecorder(str(tmp_path / "session.jsonl"), {}, output=io.StringIO()) as recorder:
+        try:
+            with recorder.command("get"):
+                raise ValueError("no item")
+        except ValueError:
+            pass
+
+    _, commands = session.loadSession(str(tmp_path / "session.jsonl"))
+    assert commands[0]["error"] == "no item"
+
+
+def test_scripted_input():
+    with session.scriptedInput(["replace"]):
+        assert session.readInput() == "replace"
+        assert session.readInput() == ""
+
+
+def test_unrecorded_output_is_shown_but_not_logged(tmp_path):
+    output = io.StringIO()
+    with session.SessionRecorder(str(tmp_path / "session.jsonl"), {}, output=output) as recorder:
+        with recorder.command("monitor"):
+            print("before")
+            with session.unrecorded():
+                print("redraw")
+            print("after")
+
+    assert output.getvalue() == "before\nredraw\nafter\n"
+    _, commands = session.loadSession(str(tmp_path / "session.jsonl"))
+    assert commands[0]["output"] == "before\nafter\n"
+
+
+def test_replay_skips_interactive_commands(data, pine, tmp_path, monkeypatch):
+    def noKeyboard(prompt=""):
+        raise AssertionError("replay waited for the keyboard")
+
+    monkeypatch.setattr("builtins.input", noKeyboard)
+    commands = [{"command": "get Ruby"}, {"command": "monitor"}, {"command": "get Emerald"}]
+    replaySession(data, {"currentRun": {}}, commands, pine, str(tmp_path))
+
+    assert sorted(InventoryBitmap.fromPine(data, pine).decode()["collectibles"]) == ["Emerald", "Ruby"]